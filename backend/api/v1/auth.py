@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+import asyncio
+from dataclasses import dataclass
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from api.v1.auth_schemas import (
@@ -21,47 +24,143 @@ from api.v1.auth_store import (
     list_users,
     update_user,
 )
-from api.v1.auth_utils import create_access_token, decode_token, verify_password
+from api.v1.auth_utils import (
+    create_access_token,
+    verify_and_update_async,
+    verify_password_async,
+    verify_token,
+)
+from core import executors
 from core.config import settings
+from core.executors import ExecutorBusyError
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer(auto_error=False)
 
 
-def get_current_user_email(
+async def _run_auth(op: str, fn, *args, **kwargs):
+    """Run a hashing store call (create_user, update_user with a password) on the bounded "auth" pool."""
+    try:
+        return await executors.run_blocking("auth", op, fn, *args, **kwargs)
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+        )
+
+
+async def _run_db(op: str, fn, *args, **kwargs):
+    """Run a plain store call (lookup, update without a password) on the "db" pool, off the event loop."""
+    try:
+        return await executors.run_blocking("db", op, fn, *args, **kwargs)
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+        )
+
+
+async def _verify(plain: str, hashed: str) -> bool:
+    try:
+        return await verify_password_async(plain, hashed)
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+        )
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """The authenticated user, resolved once per request and shared by the dependencies that need it."""
+
+    email: str
+    is_admin: bool
+    must_change_password: bool
+    hashed_password: str
+
+
+def _user_from_token(token: str) -> CurrentUser:
+    email = verify_token(token)
+    user = get_user_by_email(email) if email else None
+    if not email or not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return CurrentUser(
+        email=email,
+        is_admin=bool(user.get("is_admin")),
+        must_change_password=bool(user.get("must_change_password", False)),
+        hashed_password=user["hashed_password"],
+    )
+
+
+def get_current_user(
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
-) -> str:
+) -> CurrentUser:
     if not credentials or credentials.scheme != "Bearer":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    email = decode_token(credentials.credentials)
-    user = get_user_by_email(email) if email else None
-    if not email or not user:
+    return _user_from_token(credentials.credentials)
+
+
+def get_current_user_email(user: CurrentUser = Depends(get_current_user)) -> str:
+    return user.email
+
+
+def get_current_token_or_query_token(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+    token: str | None = Query(None, description="Access token, for clients that cannot set headers (EventSource)"),
+) -> str:
+    """
+    Validate the Authorization header or ?token= (browsers' EventSource cannot send Authorization) and return
+    the token itself, so a long-lived stream can re-check it with is_token_valid() while it runs.
+    """
+    if credentials and credentials.scheme == "Bearer":
+        token = credentials.credentials
+    if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return email
+    _user_from_token(token)
+    return token
+
+
+async def is_token_valid(token: str) -> bool:
+    """Whether a token is still unexpired and its user still exists. Assumed valid while the db pool is full."""
+    try:
+        await executors.run_blocking("db", "auth.recheck_token", _user_from_token, token)
+    except HTTPException:
+        return False
+    except ExecutorBusyError:
+        return True
+    return True
 
 
-def get_current_admin_email(email: str = Depends(get_current_user_email)) -> str:
-    user = get_user_by_email(email)
-    if not user or not user.get("is_admin"):
+def get_current_admin(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required",
         )
-    return email
+    return user
+
+
+def get_current_admin_email(user: CurrentUser = Depends(get_current_admin)) -> str:
+    return user.email
 
 
 @router.get("/registration-allowed", response_model=RegistrationAllowed)
 async def registration_allowed():
     """Return whether the first-admin registration flow is available (no admin user exists yet)."""
-    return RegistrationAllowed(allowed=not has_any_admin())
+    return RegistrationAllowed(allowed=not await _run_db("auth.has_any_admin", has_any_admin))
 
 
 def _do_clear_users():
@@ -72,7 +171,7 @@ def _do_clear_users():
 @router.get("/dev/clear-users", status_code=status.HTTP_200_OK)
 async def dev_clear_users_get():
     """Clear all users via GET (so you can use a link; works with proxy). Returns a simple HTML page."""
-    _do_clear_users()
+    await _run_db("auth.clear_users", _do_clear_users)
     html = """
     <!DOCTYPE html>
     <html><head><meta charset="utf-8"><title>Reset done</title></head>
@@ -88,60 +187,49 @@ async def dev_clear_users_get():
 @router.post("/dev/clear-users", status_code=status.HTTP_204_NO_CONTENT)
 async def dev_clear_users_post():
     """Clear all users. In production, protect or remove this route."""
-    _do_clear_users()
+    await _run_db("auth.clear_users", _do_clear_users)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+def _seed_specs() -> list[tuple[str, str, bool]]:
+    """(email, password, is_admin) for each seed user from env whose email and password are both set."""
+    specs = [
+        (settings.E2E_SEED_EMAIL, settings.E2E_SEED_PASSWORD, True),
+        (settings.ADMIN_SEED_EMAIL, settings.ADMIN_SEED_PASSWORD, True),
+        (settings.USER1_SEED_EMAIL, settings.USER1_SEED_PASSWORD, False),
+        (settings.USER2_SEED_EMAIL, settings.USER2_SEED_PASSWORD, False),
+        (settings.USER3_SEED_EMAIL, settings.USER3_SEED_PASSWORD, False),
+    ]
+    return [(email.strip(), password, is_admin) for email, password, is_admin in specs if email.strip() and password]
+
+
 def _seed_dev_users() -> None:
     """Create or overwrite seeded users from env (E2E_SEED_*, ADMIN_SEED_*, USER1_SEED_*, USER2_SEED_*, USER3_SEED_*). Only seeds when both email and password are set."""
-    if settings.E2E_SEED_EMAIL.strip() and settings.E2E_SEED_PASSWORD:
-        create_user(
-            settings.E2E_SEED_EMAIL.strip(),
-            settings.E2E_SEED_PASSWORD,
-            is_admin=True,
-            must_change_password=False,
-        )
-    if settings.ADMIN_SEED_EMAIL.strip() and settings.ADMIN_SEED_PASSWORD:
-        create_user(
-            settings.ADMIN_SEED_EMAIL.strip(),
-            settings.ADMIN_SEED_PASSWORD,
-            is_admin=True,
-            must_change_password=False,
-        )
-    if settings.USER1_SEED_EMAIL.strip() and settings.USER1_SEED_PASSWORD:
-        create_user(
-            settings.USER1_SEED_EMAIL.strip(),
-            settings.USER1_SEED_PASSWORD,
-            is_admin=False,
-            must_change_password=False,
-        )
-    if settings.USER2_SEED_EMAIL.strip() and settings.USER2_SEED_PASSWORD:
-        create_user(
-            settings.USER2_SEED_EMAIL.strip(),
-            settings.USER2_SEED_PASSWORD,
-            is_admin=False,
-            must_change_password=False,
-        )
-    if settings.USER3_SEED_EMAIL.strip() and settings.USER3_SEED_PASSWORD:
-        create_user(
-            settings.USER3_SEED_EMAIL.strip(),
-            settings.USER3_SEED_PASSWORD,
-            is_admin=False,
-            must_change_password=False,
+    for email, password, is_admin in _seed_specs():
+        create_user(email, password, is_admin=is_admin, must_change_password=False)
+
+
+async def seed_dev_users_async() -> None:
+    """Same as _seed_dev_users, hashing the seed passwords concurrently on the "auth" pool."""
+    await asyncio.gather(*(
+        executors.run_blocking(
+            "auth", "auth.seed_user", create_user, email, password, is_admin=is_admin, must_change_password=False
         )
+        for email, password, is_admin in _seed_specs()
+    ))
 
 
 @router.post("/dev/seed-e2e-user", status_code=status.HTTP_204_NO_CONTENT)
 async def dev_seed_e2e_user_post():
     """Ensure the known E2E and admin users exist. Call before login tests or use for manual admin access."""
-    _seed_dev_users()
+    await seed_dev_users_async()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/dev/seed-e2e-user", status_code=status.HTTP_200_OK)
 async def dev_seed_e2e_user_get():
     """Same as POST: create seed users. Open in browser to force seed, then try logging in as admin."""
-    _seed_dev_users()
+    await seed_dev_users_async()
     return Response(
         content="<html><body><h1>Seed done</h1><p>E2E and admin users created. Try logging in as admin.</p></body></html>",
         media_type="text/html",
@@ -153,7 +241,7 @@ async def dev_seed_status():
     """Debug: see if seed env is loaded and if admin user exists. Open in browser to verify setup."""
     admin_email = (getattr(settings, "ADMIN_SEED_EMAIL", "") or "").strip()
     admin_configured = bool(admin_email and getattr(settings, "ADMIN_SEED_PASSWORD", ""))
-    admin_exists = get_user_by_email(admin_email or "admin") is not None
+    admin_exists = await _run_db("auth.get_user", get_user_by_email, admin_email or "admin") is not None
     return {
         "admin_configured": admin_configured,
         "admin_exists": admin_exists,
@@ -168,20 +256,20 @@ async def register(data: UserCreate):
     The new user becomes an administrator. If an admin already exists, all
     additional users must be created by an admin via the admin user endpoints.
     """
-    if has_any_admin():
+    if await _run_db("auth.has_any_admin", has_any_admin):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Self-service registration is disabled. Contact an administrator.",
         )
 
-    if get_user_by_email(data.email):
+    if await _run_db("auth.get_user", get_user_by_email, data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
     # New user is created as admin (no admin existed).
-    create_user(data.email, data.password, is_admin=True, must_change_password=True)
+    await _run_auth("auth.create_user", create_user, data.email, data.password, is_admin=True, must_change_password=True)
     access_token = create_access_token(data.email)
     return Token(
         access_token=access_token,
@@ -191,12 +279,27 @@ async def register(data: UserCreate):
 
 @router.post("/login", response_model=Token)
 async def login(data: UserLogin):
-    user = get_user_by_email(data.email)
-    if not user or not verify_password(data.password, user["hashed_password"]):
+    user = await _run_db("auth.get_user", get_user_by_email, data.email)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
         )
+    try:
+        valid, new_hash = await verify_and_update_async(data.password, user["hashed_password"])
+    except ExecutorBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+        )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid email or password",
+        )
+    if new_hash:
+        # Stored hash used an older cost (AUTH_PBKDF2_ROUNDS changed): upgrade it now that we know the password
+        await _run_db("auth.update_user", update_user, data.email, hashed_password=new_hash)
     access_token = create_access_token(data.email)
     must_change = bool(user.get("must_change_password", False))
     return Token(
@@ -210,25 +313,18 @@ async def login(data: UserLogin):
 
 
 @router.get("/me", response_model=UserResponse)
-async def me(email: str = Depends(get_current_user_email)):
-    user = get_user_by_email(email)
-    if not user:
-        return UserResponse(email=email, is_admin=False, must_change_password=False)
-    return UserResponse(
-        email=email,
-        is_admin=bool(user.get("is_admin")),
-        must_change_password=bool(user.get("must_change_password", False)),
-    )
+async def me(user: CurrentUser = Depends(get_current_user)):
+    return UserResponse(email=user.email, is_admin=user.is_admin, must_change_password=user.must_change_password)
 
 
 @router.post("/change-password", response_model=UserResponse)
 async def change_password(
     data: ChangePassword,
-    email: str = Depends(get_current_user_email),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """Change the current user's password. Required on first login."""
-    user = get_user_by_email(email)
-    if not user or not verify_password(data.current_password, user["hashed_password"]):
+    email = user.email
+    if not await _verify(data.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect",
@@ -238,37 +334,36 @@ async def change_password(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be at least 6 characters",
         )
-    update_user(email, password=data.new_password, must_change_password=False)
-    return UserResponse(
-        email=email,
-        is_admin=bool(user.get("is_admin")),
-        must_change_password=False,
-    )
+    await _run_auth("auth.update_user", update_user, email, password=data.new_password, must_change_password=False)
+    return UserResponse(email=email, is_admin=user.is_admin, must_change_password=False)
 
 
 @router.get("/users", response_model=list[UserResponse])
 async def list_all_users(_: str = Depends(get_current_admin_email)):
     """List all users (admin-only)."""
+    users = await _run_db("auth.list_users", list_users)
     return [
         UserResponse(
             email=user["email"],
             is_admin=bool(user.get("is_admin")),
             must_change_password=bool(user.get("must_change_password", False)),
         )
-        for user in list_users()
+        for user in users
     ]
 
 
 @router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user_admin(data: AdminUserCreate, _: str = Depends(get_current_admin_email)):
     """Create a new user account (admin-only)."""
-    if get_user_by_email(data.email):
+    if await _run_db("auth.get_user", get_user_by_email, data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    create_user(data.email, data.password, is_admin=data.is_admin, must_change_password=True)
+    await _run_auth(
+        "auth.create_user", create_user, data.email, data.password, is_admin=data.is_admin, must_change_password=True
+    )
     return UserResponse(email=data.email, is_admin=data.is_admin, must_change_password=True)
 
 
@@ -279,7 +374,7 @@ async def update_user_admin(
     _: str = Depends(get_current_admin_email),
 ):
     """Update an existing user (admin-only)."""
-    user = get_user_by_email(email)
+    user = await _run_db("auth.get_user", get_user_by_email, email)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -289,11 +384,11 @@ async def update_user_admin(
         update_kwargs["must_change_password"] = True  # Require password change on next login
     if data.is_admin is not None:
         update_kwargs["is_admin"] = data.is_admin
-    updated = update_user(email, **update_kwargs)
+    updated = await _run_auth("auth.update_user", update_user, email, **update_kwargs)
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    updated_user = get_user_by_email(email)
+    updated_user = await _run_db("auth.get_user", get_user_by_email, email)
     return UserResponse(
         email=email,
         is_admin=bool(updated_user.get("is_admin")) if updated_user else False,
@@ -304,6 +399,6 @@ async def update_user_admin(
 @router.delete("/users/{email}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user_admin(email: str, _: str = Depends(get_current_admin_email)):
     """Delete a user account (admin-only)."""
-    if not delete_user(email):
+    if not await _run_db("auth.delete_user", delete_user, email):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
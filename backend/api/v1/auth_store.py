@@ -1,34 +1,124 @@
-"""In-memory user store. Replace with DB (e.g. SQLite) later.
+"""User store backed by the `users` table in the SQLite database (core/db.py).
 
-This module now supports basic user management with an `is_admin` flag so that
-administrators can manage all user accounts.
-"""
-
-from typing import Any, Dict, List, Optional
+Users survive restarts and are shared by every worker process using the same
+database file. Emails are stored lowercased as the primary key. Users have an
+`is_admin` flag so that administrators can manage all user accounts.
 
-from api.v1.auth_utils import hash_password
+Lookups go through a small read-through LRU (AUTH_USER_CACHE_SIZE entries,
+AUTH_USER_CACHE_TTL seconds) so resolving the user on every authenticated
+request rarely touches SQLite. Writes in this process invalidate the entry
+and the user's verified-token cache entries (auth_utils.verify_token);
+changes made by another worker are picked up within the TTL.
+"""
 
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
-# email (lowercased) -> {"hashed_password": str, "is_admin": bool, "must_change_password": bool}
-_store: Dict[str, Dict[str, Any]] = {}
+from api.v1.auth_utils import hash_password, invalidate_tokens
+from core import db
+from core.config import settings
 
 
 def _normalize_email(email: str) -> str:
     return email.lower()
 
 
+def _ensure_db() -> None:
+    # The API can be used without the startup hook (e.g. TestClient without a context manager)
+    if not db.is_initialized():
+        db.init_db()
+
+
+class _UserCache:
+    """email -> (expires_at, user record). Only existing users are cached."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, user: Dict[str, Any]) -> None:
+        size = settings.AUTH_USER_CACHE_SIZE
+        if size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_cache = _UserCache()
+
+
+def _record(row) -> Dict[str, Any]:
+    return {
+        "hashed_password": row["hashed_password"],
+        "is_admin": bool(row["is_admin"]),
+        "must_change_password": bool(row["must_change_password"]),
+    }
+
+
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
-    """Return the stored user record for the given email, or None."""
-    return _store.get(_normalize_email(email))
+    """Return the stored user record for the given email, or None. Treat the record as read-only."""
+    key = _normalize_email(email)
+    user = _cache.get(key)
+    if user is not None:
+        return user
+    _ensure_db()
+    with db.reader() as conn:
+        row = conn.execute(
+            "SELECT hashed_password, is_admin, must_change_password FROM users WHERE email = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    user = _record(row)
+    _cache.put(key, user)
+    return user
 
 
 def create_user(email: str, password: str, is_admin: bool = False, must_change_password: bool = True) -> None:
     """Create or overwrite a user record. New users must change password on first login by default."""
-    _store[_normalize_email(email)] = {
-        "hashed_password": hash_password(password),
-        "is_admin": bool(is_admin),
-        "must_change_password": must_change_password,
-    }
+    key = _normalize_email(email)
+    _ensure_db()
+    with db.writer() as conn:
+        conn.execute(
+            """
+            INSERT INTO users (email, hashed_password, is_admin, must_change_password)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(email) DO UPDATE SET
+                hashed_password = excluded.hashed_password,
+                is_admin = excluded.is_admin,
+                must_change_password = excluded.must_change_password,
+                updated_at = datetime('now')
+            """,
+            (key, hash_password(password), int(bool(is_admin)), int(bool(must_change_password))),
+        )
+    _cache.invalidate(key)
+    invalidate_tokens(key)
 
 
 def update_user(
@@ -37,53 +127,83 @@ def update_user(
     password: Optional[str] = None,
     is_admin: Optional[bool] = None,
     must_change_password: Optional[bool] = None,
+    hashed_password: Optional[str] = None,
 ) -> bool:
-    """Update an existing user. Returns True if the user existed and was updated."""
+    """
+    Update an existing user. Returns True if the user existed and was updated.
+    hashed_password stores an already computed hash (e.g. a login-time rehash) instead of hashing password.
+    """
     key = _normalize_email(email)
-    user = _store.get(key)
-    if not user:
-        return False
-
+    assignments = ["updated_at = datetime('now')"]
+    params: List[Any] = []
     if password is not None:
-        user["hashed_password"] = hash_password(password)
+        hashed_password = hash_password(password)
+    if hashed_password is not None:
+        assignments.append("hashed_password = ?")
+        params.append(hashed_password)
     if is_admin is not None:
-        user["is_admin"] = bool(is_admin)
+        assignments.append("is_admin = ?")
+        params.append(int(bool(is_admin)))
     if must_change_password is not None:
-        user["must_change_password"] = bool(must_change_password)
-    return True
+        assignments.append("must_change_password = ?")
+        params.append(int(bool(must_change_password)))
+    _ensure_db()
+    with db.writer() as conn:
+        cur = conn.execute(f"UPDATE users SET {', '.join(assignments)} WHERE email = ?", (*params, key))
+    _cache.invalidate(key)
+    invalidate_tokens(key)
+    return cur.rowcount > 0
 
 
 def delete_user(email: str) -> bool:
     """Delete a user by email. Returns True if a user was removed."""
     key = _normalize_email(email)
-    if key in _store:
-        del _store[key]
-        return True
-    return False
+    _ensure_db()
+    with db.writer() as conn:
+        cur = conn.execute("DELETE FROM users WHERE email = ?", (key,))
+    _cache.invalidate(key)
+    invalidate_tokens(key)
+    return cur.rowcount > 0
 
 
 def list_users() -> List[Dict[str, Any]]:
     """Return a list of users without exposing password hashes."""
-    return [
-        {
-            "email": email,
-            "is_admin": bool(data.get("is_admin", False)),
-            "must_change_password": bool(data.get("must_change_password", False)),
-        }
-        for email, data in _store.items()
-    ]
+    _ensure_db()
+    with db.reader() as conn:
+        rows = conn.execute("SELECT email, is_admin, must_change_password FROM users ORDER BY rowid")
+        return [
+            {
+                "email": row["email"],
+                "is_admin": bool(row["is_admin"]),
+                "must_change_password": bool(row["must_change_password"]),
+            }
+            for row in rows
+        ]
 
 
 def has_any_users() -> bool:
     """Return True if any user accounts exist."""
-    return bool(_store)
+    _ensure_db()
+    with db.reader() as conn:
+        return conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
 
 
 def has_any_admin() -> bool:
     """Return True if any user has is_admin=True."""
-    return any(data.get("is_admin") for data in _store.values())
+    _ensure_db()
+    with db.reader() as conn:
+        return conn.execute("SELECT 1 FROM users WHERE is_admin = 1 LIMIT 1").fetchone() is not None
 
 
 def clear_all_users() -> None:
     """Remove all users. For development/testing only."""
-    _store.clear()
+    _ensure_db()
+    with db.writer() as conn:
+        conn.execute("DELETE FROM users")
+    _cache.invalidate()
+    invalidate_tokens()
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Read-through cache counters for user lookups."""
+    return _cache.stats()
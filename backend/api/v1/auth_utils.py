@@ -1,10 +1,23 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from core import executors
 from core.config import settings
 
-# Use PBKDF2-SHA256 (pure Python, no external bcrypt dependency)
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Use PBKDF2-SHA256 (pure Python, no external bcrypt dependency).
+# Hashes with any other round count are flagged for upgrade and rehashed on the next successful login.
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=settings.AUTH_PBKDF2_ROUNDS,
+    pbkdf2_sha256__min_rounds=settings.AUTH_PBKDF2_ROUNDS,
+    pbkdf2_sha256__max_rounds=settings.AUTH_PBKDF2_ROUNDS,
+)
 
 
 def hash_password(password: str) -> str:
@@ -15,15 +28,126 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def verify_and_update(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """Verify; on success also return a new hash when the stored one uses outdated parameters."""
+    return pwd_context.verify_and_update(plain, hashed)
+
+
+# PBKDF2 burns tens of milliseconds of CPU per call; from async code run it on the bounded "auth" pool
+# (hashlib releases the GIL, so worker threads hash in parallel without stalling the event loop).
+
+async def hash_password_async(password: str) -> str:
+    return await executors.run_blocking("auth", "auth.hash", hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await executors.run_blocking("auth", "auth.verify", verify_password, plain, hashed)
+
+
+async def verify_and_update_async(plain: str, hashed: str) -> tuple[bool, str | None]:
+    return await executors.run_blocking("auth", "auth.verify", verify_and_update, plain, hashed)
+
+
 def create_access_token(subject: str) -> str:
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"sub": subject, "exp": expire}
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
-def decode_token(token: str) -> str | None:
+def _decode_payload(token: str) -> Optional[Dict[str, Any]]:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload.get("sub")
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
         return None
+
+
+class _TokenCache:
+    """
+    sha256(token) -> (exp, email) for tokens whose signature already checked out. Entries expire at the token's
+    own exp; an email index lets user changes drop that user's entries. Raw tokens are never kept.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+        self._by_email: Dict[str, Set[bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key: bytes) -> None:
+        _, email = self._entries.pop(key)
+        keys = self._by_email.get(email.lower())
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_email[email.lower()]
+
+    def get(self, key: bytes) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.time():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: bytes, exp: float, email: str) -> None:
+        size = settings.AUTH_TOKEN_CACHE_SIZE
+        if size <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (exp, email)
+            self._by_email.setdefault(email.lower(), set()).add(key)
+            while len(self._entries) > size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, email: Optional[str] = None) -> None:
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+                self._by_email.clear()
+                return
+            for key in self._by_email.pop(email.lower(), ()):
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_token_cache = _TokenCache()
+
+
+def decode_token(token: str) -> str | None:
+    payload = _decode_payload(token)
+    return payload.get("sub") if payload else None
+
+
+def verify_token(token: str) -> str | None:
+    """Like decode_token, but tokens seen before are answered from the verified-token cache until their exp."""
+    key = hashlib.sha256(token.encode()).digest()
+    email = _token_cache.get(key)
+    if email is not None:
+        return email
+    payload = _decode_payload(token)
+    if not payload or not payload.get("sub"):
+        return None
+    email = payload["sub"]
+    if isinstance(payload.get("exp"), (int, float)):
+        _token_cache.put(key, float(payload["exp"]), email)
+    return email
+
+
+def invalidate_tokens(email: Optional[str] = None) -> None:
+    """Forget cached verifications for one user, or for everyone."""
+    _token_cache.invalidate(email)
+
+
+def get_token_cache_stats() -> Dict[str, Any]:
+    return _token_cache.stats()
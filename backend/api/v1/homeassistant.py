@@ -1,18 +1,42 @@
 """
 Home Assistant proxy API. Auth-protected; returns HA entity states to the frontend.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 from pathlib import Path
+import asyncio
 import os
-import glob
 import logging
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
 
-from api.v1.auth import get_current_user_email
+from api.v1.auth import (
+    get_current_admin_email,
+    get_current_token_or_query_token,
+    get_current_user_email,
+    is_token_valid,
+)
 from core.config import settings, get_env_file_path
+from core import db
+from core.lease import scheduler_lease
+from core import executors
+from core.executors import ExecutorBusyError
+from core.responses import FastJSONResponse, dumps
 from services import homeassistant as ha
 from services import energy_history
+from services.energy_backfill import energy_backfill
+from services import energy_export
+from services import energy_samples
+from services.ha_shared import shared_states
+from services.ha_websocket import ha_mirror
+from services.dashboard_stream import StreamCapacityError, dashboard_broker
+from services import dashboard_summary
+from services import house_image_variants
+from services import house_images
+from services.house_images import HouseImage, house_image_catalog
+from services.mqtt import mqtt_service
 from datetime import date, datetime
 
 logger = logging.getLogger(__name__)
@@ -41,18 +65,127 @@ async def homeassistant_status():
             "url_set": url_set,
             "token_set": token_set,
         },
+        "websocket": ha_mirror.status(),
     }
 
 
+@router.get("/cache-stats")
+async def homeassistant_cache_stats(_email: str = Depends(get_current_user_email)):
+    """Return states cache counters (hits, misses, coalesced waiters, upstream fetches) to gauge HA load saved."""
+    return {**ha.get_cache_stats(), "websocket": ha_mirror.status()}
+
+
+@router.get("/db-stats")
+async def homeassistant_db_stats(_email: str = Depends(get_current_user_email)):
+    """Return SQLite pool counters (connections in use, acquisitions, time spent waiting for a connection)."""
+    return db.get_pool_stats()
+
+
+@router.get("/house-image-stats")
+async def homeassistant_house_image_stats(_email: str = Depends(get_current_user_email)):
+    """Return the house image catalog and variant cache state (files, bytes, hits, evictions, render latency)."""
+    return {"catalog": house_image_catalog.status(), "variants": house_image_variants.get_stats()}
+
+
+@router.get("/executor-stats")
+async def homeassistant_executor_stats(_email: str = Depends(get_current_user_email)):
+    """Return blocking-work pools (db, fs, auth): pending/running calls and per-operation latency histograms."""
+    return executors.get_executor_stats()
+
+
+@router.get("/worker-stats")
+async def homeassistant_worker_stats(_email: str = Depends(get_current_user_email)):
+    """Return this worker's multi-worker role: scheduler lease (holder, expiry) and shared HA states counters."""
+    return {
+        "multi_worker": settings.MULTI_WORKER,
+        "pid": os.getpid(),
+        "lease": scheduler_lease.status() if settings.MULTI_WORKER else None,
+        "shared_states": shared_states.status(),
+    }
+
+
+@router.get("/mqtt-stats")
+async def homeassistant_mqtt_stats(_email: str = Depends(get_current_user_email)):
+    """Return MQTT ingestion counters: received/dropped/coalesced messages, queue depth, flush latency."""
+    return mqtt_service.status()
+
+
+_FIELDS_DESCRIPTION = "Comma-separated fields to return, e.g. entity_id,state,attributes.unit_of_measurement"
+_SINCE_DESCRIPTION = "Only return entities changed after this revision (from X-States-Revision)"
+# Clients may store responses but must revalidate (If-None-Match) before reuse
+_REVALIDATE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Weak If-None-Match comparison (W/ prefixes ignored), including "*"."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in header.split(","))
+
+
+def _query_variant(request: Request) -> str:
+    """Short hash of the query string so each projection/filter of a snapshot gets its own ETag."""
+    query = request.url.query
+    return f"{zlib.crc32(query.encode()):08x}" if query else ""
+
+
+def _states_response(
+    request: Request,
+    states: list[dict],
+    fields: str | None,
+    since: int | None,
+    entity_filter=None,
+    body=None,
+) -> Response:
+    """
+    JSON list of projected states with ETag / 304 support. With since, returns
+    {"revision", "full", "changed", "removed"} holding only changes after that revision.
+    body() returns the pre-serialized full list (StatesSnapshot) for requests without fields/since.
+    """
+    revision = ha.states_revision()
+    etag = ha.states_etag(_query_variant(request))
+    headers = {**_REVALIDATE_HEADERS, "ETag": etag, "X-States-Revision": str(revision)}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if since is None:
+        if body is not None and not fields:
+            return Response(content=body(), media_type="application/json", headers=headers)
+        return FastJSONResponse(ha.project_states(states, fields), headers=headers)
+
+    delta = ha.changes_since(since, states)
+    if delta is None:
+        body = {"revision": revision, "full": True, "changed": ha.project_states(states, fields), "removed": []}
+    else:
+        changed, removed = delta
+        if entity_filter is not None:
+            removed = [entity_id for entity_id in removed if entity_filter(entity_id)]
+        body = {"revision": revision, "full": False, "changed": ha.project_states(changed, fields), "removed": removed}
+    return FastJSONResponse(body, headers=headers)
+
+
 @router.get("/dashboard")
-async def dashboard_entities(_email: str = Depends(get_current_user_email)):
+async def dashboard_entities(
+    request: Request,
+    fields: str | None = Query(None, description=_FIELDS_DESCRIPTION),
+    since: int | None = Query(None, description=_SINCE_DESCRIPTION),
+    _email: str = Depends(get_current_user_email),
+):
     """
     Return entity states needed for the dashboard (weather, sun, sensor).
     Smaller payload than /entities. Returns empty list if HA is not configured.
+    Sends an ETag (304 on If-None-Match) and X-States-Revision; ?since= returns only changes.
     """
     try:
-        states = await ha.get_states_for_dashboard()
-        return states
+        view = await ha.get_states_snapshot()
+        return _states_response(
+            request, view.dashboard, fields, since,
+            entity_filter=lambda entity_id: entity_id.split(".", 1)[0] in ha._DASHBOARD_DOMAINS,
+            body=view.dashboard_json,
+        )
     except Exception as e:
         import logging
         logging.getLogger(__name__).exception("Home Assistant request failed")
@@ -62,18 +195,109 @@ async def dashboard_entities(_email: str = Depends(get_current_user_email)):
         ) from e
 
 
+@router.get("/dashboard/summary")
+async def dashboard_summary_tiles(request: Request, _email: str = Depends(get_current_user_email)):
+    """
+    Return only the resolved dashboard tile values (weather, sun, power, solar, battery, grid, SMUD billing).
+    Entity matching runs on the server and is cached until the entity set changes; `entities` lists the
+    entity_id chosen for each tile. Supports ETag/If-None-Match.
+    """
+    try:
+        summary = await dashboard_summary.get_summary()
+        etag = ha.states_etag("summary")
+        headers = {**_REVALIDATE_HEADERS, "ETag": etag}
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return FastJSONResponse(summary, headers=headers)
+    except Exception as e:
+        logger.exception("Home Assistant request failed")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Unable to reach Home Assistant. Check server configuration.",
+        ) from e
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+@router.get("/dashboard/stream")
+async def dashboard_stream(access_token: str = Depends(get_current_token_or_query_token)):
+    """
+    Server-Sent Events stream of dashboard entities (weather, sun, sensor).
+    Sends one `snapshot` event with the full list, then `delta` events with only changed entities
+    ({"changed": [...], "removed": [entity_id, ...]}) and a comment heartbeat when idle.
+    Auth: Authorization header or ?token= (EventSource cannot send headers). The token is re-checked every
+    heartbeat interval; the stream ends once it has expired or its user was deleted.
+    """
+    try:
+        subscriber = dashboard_broker.subscribe()
+    except StreamCapacityError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open dashboard streams. Try again later.",
+            headers={"Retry-After": "30"},
+        )
+    # Subscribed before the snapshot is read, so no change between the two is missed
+    try:
+        states = await ha.get_states_for_dashboard()
+    except Exception as e:
+        dashboard_broker.unsubscribe(subscriber)
+        logger.exception("Home Assistant request failed")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Unable to reach Home Assistant. Check server configuration.",
+        ) from e
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        recheck_at = loop.time() + settings.HA_STREAM_HEARTBEAT_SECONDS
+        try:
+            yield _sse("snapshot", ha.project_states(states))
+            while True:
+                changes = await subscriber.next_delta(settings.HA_STREAM_HEARTBEAT_SECONDS)
+                # Checked by time as well, since a busy stream may never be idle long enough for a heartbeat
+                if loop.time() >= recheck_at:
+                    if not await is_token_valid(access_token):
+                        return
+                    recheck_at = loop.time() + settings.HA_STREAM_HEARTBEAT_SECONDS
+                if changes is None:
+                    yield b": heartbeat\n\n"
+                    continue
+                yield _sse("delta", {
+                    "changed": ha.project_states([s for s in changes.values() if s is not None]),
+                    "removed": [k for k, s in changes.items() if s is None],
+                })
+        finally:
+            dashboard_broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # no-transform/X-Accel-Buffering: keep proxies (nginx, compression) from buffering the stream
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/entities")
 async def list_entities(
+    request: Request,
     domain: str | None = Query(None, description="Filter by domain, e.g. light, sensor"),
+    fields: str | None = Query(None, description=_FIELDS_DESCRIPTION),
+    since: int | None = Query(None, description=_SINCE_DESCRIPTION),
     _email: str = Depends(get_current_user_email),
 ):
     """
-    List entity states from Home Assistant. Optional domain filter.
-    Returns empty list if HA is not configured.
+    List entity states from Home Assistant. Optional domain filter and fields= projection.
+    Returns empty list if HA is not configured. Supports ETag/If-None-Match and ?since= like /dashboard.
     """
     try:
-        states = await ha.get_states(domain=domain)
-        return states
+        view = await ha.get_states_snapshot()
+        return _states_response(
+            request, view.domain(domain), fields, since,
+            entity_filter=(lambda entity_id: entity_id.startswith(f"{domain}.")) if domain else None,
+            body=lambda: view.states_json(domain),
+        )
     except Exception as e:
         # Do not leak HA URL or token; log server-side only
         import logging
@@ -86,7 +310,9 @@ async def list_entities(
 
 @router.get("/entities/{entity_id:path}")
 async def get_entity(
+    request: Request,
     entity_id: str,
+    fields: str | None = Query(None, description=_FIELDS_DESCRIPTION),
     _email: str = Depends(get_current_user_email),
 ):
     """
@@ -99,7 +325,17 @@ async def get_entity(
         state = await ha.get_entity(entity_id.strip())
         if state is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entity not found")
-        return state
+        etag = ha.entity_etag(state.get("entity_id") or entity_id.strip())
+        headers = None
+        if etag is not None:
+            etag = etag[:-1] + (f"-{_query_variant(request)}" if request.url.query else "") + '"'
+            headers = {**_REVALIDATE_HEADERS, "ETag": etag}
+            if _etag_matches(request, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        body = ha.cached_entity_json(state.get("entity_id") or "") if not fields else None
+        if body is not None:
+            return Response(content=body, media_type="application/json", headers=headers)
+        return FastJSONResponse(ha.project_state(state, ha.parse_fields(fields)), headers=headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -111,105 +347,106 @@ async def get_entity(
         ) from e
 
 
+async def _latest_house_image() -> HouseImage:
+    """Newest house image from the catalog; 404 if the share or images are missing."""
+    await house_image_catalog.ensure_loaded()
+    if not house_image_catalog.path_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Media directory not accessible"
+        )
+    latest = house_image_catalog.latest()
+    if latest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No house images found"
+        )
+    return latest
+
+
+def _media_path_diagnostics(media_path: str) -> dict:
+    """Blocking: parent directory and /mnt listings for /house-image-debug when the share is missing."""
+    # Try to list parent directory for debugging
+    parent_dir = os.path.dirname(media_path) if os.path.dirname(media_path) else None
+    parent_exists = os.path.exists(parent_dir) if parent_dir else False
+    parent_listing = []
+    if parent_exists:
+        try:
+            parent_listing = os.listdir(parent_dir)
+        except Exception as e:
+            parent_listing = [f"Error listing: {str(e)}"]
+    
+    # Also check if /mnt exists
+    mnt_exists = os.path.exists("/mnt")
+    mnt_listing = []
+    if mnt_exists:
+        try:
+            mnt_listing = os.listdir("/mnt")
+        except Exception as e:
+            mnt_listing = [f"Error listing: {str(e)}"]
+    
+    return {
+        "current_working_directory": os.getcwd(),
+        "parent_directory": parent_dir,
+        "parent_exists": parent_exists,
+        "parent_listing": parent_listing,
+        "/mnt_exists": mnt_exists,
+        "/mnt_listing": mnt_listing
+    }
+
+
 @router.get("/house-image-debug")
 async def get_latest_house_image_debug():
     """
     Debug endpoint: Returns info about house images found without serving the file.
-    Shows which file would be served.
+    Shows which file would be served. Forces a catalog rescan.
     """
-    from core.config import settings
-    media_path = settings.HA_MEDIA_PATH or r"\\homeassistant\media"
+    media_path = house_images.media_path()
     
     try:
-        # Check if path exists
-        path_exists = os.path.exists(media_path)
-        logger.info(f"Debug: Checking media path: {media_path}, exists: {path_exists}")
-        
-        # Try to list parent directory for debugging
-        parent_dir = os.path.dirname(media_path) if os.path.dirname(media_path) else None
-        parent_exists = os.path.exists(parent_dir) if parent_dir else False
-        parent_listing = []
-        if parent_exists:
-            try:
-                parent_listing = os.listdir(parent_dir)
-            except Exception as e:
-                parent_listing = [f"Error listing: {str(e)}"]
-        
-        # Also check if /mnt exists
-        mnt_exists = os.path.exists("/mnt")
-        mnt_listing = []
-        if mnt_exists:
-            try:
-                mnt_listing = os.listdir("/mnt")
-            except Exception as e:
-                mnt_listing = [f"Error listing: {str(e)}"]
-        
-        if not path_exists:
+        await house_image_catalog.refresh_async(force=True)
+        catalog = house_image_catalog.status()
+        if not house_image_catalog.path_exists:
+            diagnostics = await executors.run_blocking(
+                "fs", "house_image.debug", _media_path_diagnostics, media_path
+            )
             return {
                 "error": "Media path does not exist",
                 "media_path": media_path,
                 "path_exists": False,
                 "config_ha_media_path": settings.HA_MEDIA_PATH,
-                "current_working_directory": os.getcwd(),
-                "parent_directory": parent_dir,
-                "parent_exists": parent_exists,
-                "parent_listing": parent_listing,
-                "/mnt_exists": mnt_exists,
-                "/mnt_listing": mnt_listing
+                **diagnostics,
+                "catalog": catalog,
             }
         
-        # Find all house*.jpg files (case-insensitive by using both patterns)
         pattern = os.path.join(media_path, "house*.jpg")
-        matching_files = glob.glob(pattern)
-        # Also try uppercase extension for case-insensitive matching
-        pattern_upper = os.path.join(media_path, "house*.JPG")
-        matching_files.extend(glob.glob(pattern_upper))
-        # Remove duplicates
-        matching_files = list(set(matching_files))
-        
-        if not matching_files:
+        images = house_image_catalog.images()
+        if not images:
             return {
                 "error": "No house*.jpg files found",
                 "media_path": media_path,
                 "pattern": pattern,
                 "path_exists": True,
-                "matching_files": []
+                "matching_files": [],
+                "catalog": catalog,
             }
         
-        # Get file details
-        file_details = []
-        for f in matching_files:
-            try:
-                mtime = os.path.getmtime(f)
-                file_details.append({
-                    "filename": os.path.basename(f),
-                    "full_path": f,
-                    "modified_time": mtime,
-                    "modified_datetime": str(os.path.getmtime(f))
-                })
-            except Exception as e:
-                file_details.append({
-                    "filename": os.path.basename(f),
-                    "full_path": f,
-                    "error": str(e)
-                })
-        
-        # Find the file with the latest modification time
-        latest_file = max(matching_files, key=lambda f: os.path.getmtime(f))
-        latest_mtime = os.path.getmtime(latest_file)
+        def details(image: HouseImage) -> dict:
+            return {
+                "filename": image.filename,
+                "full_path": image.path,
+                "modified_time": image.mtime,
+                "modified_datetime": str(image.mtime)
+            }
         
         return {
             "media_path": media_path,
             "pattern": pattern,
             "path_exists": True,
-            "total_files_found": len(matching_files),
-            "latest_file": {
-                "filename": os.path.basename(latest_file),
-                "full_path": latest_file,
-                "modified_time": latest_mtime,
-                "modified_datetime": str(latest_mtime)
-            },
-            "all_files": sorted(file_details, key=lambda x: x.get("modified_time", 0), reverse=True)
+            "total_files_found": len(images),
+            "latest_file": details(images[-1]),
+            "all_files": [details(image) for image in reversed(images)],
+            "catalog": catalog,
         }
     except Exception as e:
         logger.exception(f"Failed to debug house image from {media_path}")
@@ -226,127 +463,103 @@ async def get_latest_house_image_metadata(_email: str = Depends(get_current_user
     Get metadata about the latest house image (filename, modification time, etc.)
     without serving the file itself.
     """
-    from core.config import settings
-    from datetime import datetime
-    media_path = settings.HA_MEDIA_PATH or r"\\homeassistant\media"
-    
     try:
-        if not os.path.exists(media_path):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Media directory not accessible"
-            )
-        
-        pattern = os.path.join(media_path, "house*.jpg")
-        matching_files = glob.glob(pattern)
-        pattern_upper = os.path.join(media_path, "house*.JPG")
-        matching_files.extend(glob.glob(pattern_upper))
-        matching_files = list(set(matching_files))
-        
-        if not matching_files:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No house images found"
-            )
-        
-        latest_file = max(matching_files, key=lambda f: os.path.getmtime(f))
-        latest_mtime = os.path.getmtime(latest_file)
-        filename = os.path.basename(latest_file)
-        
-        # Parse date from filename if it follows pattern (e.g., housepic_20260212.jpg)
-        date_from_filename = None
-        try:
-            # Try to extract date from filename (format: housepic_YYYYMMDD.jpg)
-            import re
-            match = re.search(r'(\d{8})', filename)
-            if match:
-                date_str = match.group(1)
-                date_from_filename = datetime.strptime(date_str, '%Y%m%d').date()
-        except:
-            pass
-        
-        # Convert timestamp to UTC datetime with timezone info
-        from datetime import timezone
-        utc_dt = datetime.fromtimestamp(latest_mtime, tz=timezone.utc)
-        
-        return {
-            "filename": filename,
-            "modified_timestamp": latest_mtime,
-            "modified_datetime": utc_dt.isoformat(),  # Includes 'Z' suffix for UTC
-            "date_from_filename": date_from_filename.isoformat() if date_from_filename else None,
-        }
+        latest = await _latest_house_image()
+        metadata = latest.to_dict()
+        del metadata["size"]
+        return metadata
     except HTTPException:
         raise
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Media share busy") from e
     except Exception as e:
-        logger.exception(f"Failed to get house image metadata from {media_path}")
+        logger.exception(f"Failed to get house image metadata from {house_images.media_path()}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unable to retrieve house image metadata"
         ) from e
 
 
+@router.get("/house-images")
+async def list_house_images(
+    from_date: str | None = Query(None, alias="from", description="First date (YYYY-MM-DD), inclusive"),
+    to_date: str | None = Query(None, alias="to", description="Last date (YYYY-MM-DD), inclusive"),
+    _email: str = Depends(get_current_user_email),
+):
+    """
+    List house images taken between from and to (date in the filename, else modification date), oldest first.
+    Returns {count, data: [{filename, modified_timestamp, modified_datetime, date_from_filename, size}]}.
+    """
+    try:
+        from_dt = date.fromisoformat(from_date) if from_date else None
+        to_dt = date.fromisoformat(to_date) if to_date else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date format. Use YYYY-MM-DD. {str(e)}"
+        )
+    try:
+        await house_image_catalog.ensure_loaded()
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Media share busy") from e
+    if not house_image_catalog.path_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Media directory not accessible"
+        )
+    images = house_image_catalog.between(from_dt, to_dt)
+    return {"count": len(images), "data": [image.to_dict() for image in images]}
+
+
+def _not_modified_since(request: Request, mtime: float) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or request.headers.get("if-none-match"):
+        return False
+    try:
+        return int(mtime) <= int(parsedate_to_datetime(header).timestamp())
+    except (TypeError, ValueError):
+        return False
+
+
 @router.get("/house-image")
-async def get_latest_house_image(_email: str = Depends(get_current_user_email)):
+async def get_latest_house_image(
+    request: Request,
+    size: str = Query("original", description="original, dashboard or thumbnail"),
+    format: str = Query("jpeg", description="jpeg or webp"),
+    _email: str = Depends(get_current_user_email),
+):
     """
     Serve the latest house*.jpg image from the configured HA media path.
-    Returns the image file with the most recent modification date.
+    Returns the image file with the most recent modification date, optionally as a resized/WebP variant
+    (rendered once, then served from the local cache). Supports If-None-Match/If-Modified-Since and Range.
     """
-    from core.config import settings
-    media_path = settings.HA_MEDIA_PATH or r"\\homeassistant\media"
-    
+    if size not in house_image_variants.SIZES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown size: {size}")
+    if format not in house_image_variants.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown format: {format}")
     try:
-        # Check if path exists
-        if not os.path.exists(media_path):
-            logger.warning(f"Media path does not exist: {media_path}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Media directory not accessible"
-            )
-        
-        # Find all house*.jpg files (case-insensitive by using both patterns)
-        pattern = os.path.join(media_path, "house*.jpg")
-        logger.info(f"Searching for house images with pattern: {pattern}")
-        matching_files = glob.glob(pattern)
-        # Also try uppercase extension for case-insensitive matching
-        pattern_upper = os.path.join(media_path, "house*.JPG")
-        matching_files.extend(glob.glob(pattern_upper))
-        # Remove duplicates
-        matching_files = list(set(matching_files))
-        
-        logger.info(f"Found {len(matching_files)} house*.jpg files in {media_path}")
-        if matching_files:
-            for f in matching_files:
-                logger.info(f"  - {os.path.basename(f)} (mtime: {os.path.getmtime(f)})")
-        else:
-            # Debug: list all files in directory
-            try:
-                all_files = os.listdir(media_path)
-                logger.warning(f"No house*.jpg files found. All files in {media_path}: {all_files}")
-            except Exception as e:
-                logger.error(f"Error listing directory {media_path}: {e}")
-        
-        if not matching_files:
-            logger.warning(f"No house*.jpg files found in {media_path}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No house images found"
-            )
-        
-        # Find the file with the latest modification time
-        latest_file = max(matching_files, key=lambda f: os.path.getmtime(f))
-        latest_filename = os.path.basename(latest_file)
-        latest_mtime = os.path.getmtime(latest_file)
-        
-        logger.info(f"Serving latest house image: {latest_filename} (modified: {latest_mtime})")
+        latest = await _latest_house_image()
+        headers = {
+            **_REVALIDATE_HEADERS,
+            "ETag": house_image_variants.etag(latest, size, format),
+            "Last-Modified": formatdate(latest.mtime, usegmt=True),
+        }
+        if _etag_matches(request, headers["ETag"]) or _not_modified_since(request, latest.mtime):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        path, media_type = await house_image_variants.get_variant(latest, size, format)
+        logger.info(f"Serving latest house image: {latest.filename} (modified: {latest.mtime}, {size}/{format})")
         return FileResponse(
-            latest_file,
-            media_type="image/jpeg",
-            filename=latest_filename
+            path,
+            media_type=media_type,
+            filename=Path(latest.filename).stem + Path(path).suffix,
+            headers=headers,
         )
     except HTTPException:
         raise
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Media share busy") from e
     except Exception as e:
-        logger.exception(f"Failed to serve house image from {media_path}")
+        logger.exception(f"Failed to serve house image from {house_images.media_path()}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unable to retrieve house image"
@@ -357,23 +570,46 @@ async def get_latest_house_image(_email: str = Depends(get_current_user_email)):
 async def get_energy_history(
     from_date: str | None = Query(None, description="Start date (YYYY-MM-DD)"),
     to_date: str | None = Query(None, description="End date (YYYY-MM-DD)"),
+    series: str | None = Query(None, description="Sampled series instead of daily SMUD totals: power, solar, battery_level, battery_power, grid"),
+    resolution: int | None = Query(None, ge=1, description="Series bucket size in seconds (default: automatic from range)"),
+    mode: str | None = Query(None, description="delta (usage/cost per group) or cumulative (running total across bill resets)"),
+    group_by: str | None = Query(None, description="day, week, month or bill_period"),
     _email: str = Depends(get_current_user_email),
 ):
     """
     Get historical energy usage and cost data.
     Returns list of daily snapshots with date, usage_kwh, and cost_usd.
+    With series, returns that time series from the coarsest rollup tier that fits the range/resolution.
+    With mode/group_by, returns derived {date, end_date, days, usage_kwh, cost_usd} per group (not combinable
+    with series).
     """
+    if series and series not in energy_samples.SAMPLED_TILES.values():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown series: {series}")
+    if mode is not None and mode not in energy_history.HISTORY_MODES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown mode: {mode}")
+    if group_by is not None and group_by not in energy_history.HISTORY_GROUPS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown group_by: {group_by}")
+    if series and (mode is not None or group_by is not None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="mode and group_by apply to the daily SMUD totals, not to series",
+        )
     try:
         from_dt = date.fromisoformat(from_date) if from_date else None
         to_dt = date.fromisoformat(to_date) if to_date else None
         
-        history = energy_history.get_history(from_date=from_dt, to_date=to_dt)
+        history = await executors.run_blocking(
+            "db", "energy_history.get", energy_history.get_history,
+            from_date=from_dt, to_date=to_dt, series=series, resolution=resolution, mode=mode, group_by=group_by,
+        )
         return {"data": history}
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid date format. Use YYYY-MM-DD. {str(e)}"
         )
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database busy") from e
     except Exception as e:
         logger.exception("Failed to retrieve energy history")
         raise HTTPException(
@@ -382,6 +618,86 @@ async def get_energy_history(
         ) from e
 
 
+@router.get("/energy-history/export")
+async def export_energy_history(
+    format: str = Query("csv", description="csv, ndjson or parquet (needs the optional pyarrow package)"),
+    from_date: str | None = Query(None, description="Start date (YYYY-MM-DD)"),
+    to_date: str | None = Query(None, description="End date (YYYY-MM-DD)"),
+    series: str | None = Query(None, description="Sampled series instead of daily SMUD totals: power, solar, battery_level, battery_power, grid"),
+    tier: str = Query("raw", description="With series: raw samples or hourly, daily, monthly rollups"),
+    _email: str = Depends(get_current_user_email),
+):
+    """
+    Download energy history as a file, streamed from SQLite in batches (constant memory for any range).
+    Without series: date, usage_kwh, cost_usd per day. With series: ts, entity_id, value (raw) or
+    ts, entity_id, min, max, avg, last, count (rollup tiers).
+    """
+    if format not in energy_export.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown format: {format}")
+    if format == "parquet" and not energy_export.parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Parquet export needs the pyarrow package on the server",
+        )
+    if series and series not in energy_samples.SAMPLED_TILES.values():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown series: {series}")
+    if tier not in energy_export.TIERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown tier: {tier}")
+    try:
+        from_dt = date.fromisoformat(from_date) if from_date else None
+        to_dt = date.fromisoformat(to_date) if to_date else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date format. Use YYYY-MM-DD. {str(e)}"
+        )
+    try:
+        slot = energy_export.reserve()
+    except energy_export.ExportCapacityError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
+    try:
+        query = energy_export.build_query(from_dt, to_dt, series=series, tier=tier)
+        media_type, extension = energy_export.MEDIA_TYPES[format]
+        # The body's finally releases the slot; the background task covers a response that never starts streaming
+        return StreamingResponse(
+            energy_export.stream_export(query, format, slot),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{query.name}.{extension}"'},
+            background=BackgroundTask(slot.release),
+        )
+    except Exception:
+        slot.release()
+        raise
+
+
+@router.get("/energy-samples")
+async def get_energy_samples(
+    kind: str = Query(..., description="power, solar, battery_level, battery_power or grid"),
+    from_ts: int | None = Query(None, description="Start time (unix seconds)"),
+    to_ts: int | None = Query(None, description="End time (unix seconds)"),
+    _email: str = Depends(get_current_user_email),
+):
+    """
+    Get raw minute-level samples for one series (kW for power series, % for battery_level).
+    Returns list of {ts, value, entity_id} ordered by time.
+    """
+    if kind not in energy_samples.SAMPLED_TILES.values():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown series kind: {kind}")
+    try:
+        samples = await executors.run_blocking(
+            "db", "energy_samples.get", energy_samples.get_samples, kind, from_ts=from_ts, to_ts=to_ts
+        )
+        return {"data": samples}
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database busy") from e
+    except Exception as e:
+        logger.exception("Failed to retrieve energy samples")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to retrieve energy samples"
+        ) from e
+
+
 @router.post("/energy-history/record")
 async def record_energy_snapshot(_email: str = Depends(get_current_user_email)):
     """
@@ -403,3 +719,44 @@ async def record_energy_snapshot(_email: str = Depends(get_current_user_email)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unable to record energy snapshot"
         ) from e
+
+
+@router.post("/energy-history/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_energy_backfill(
+    from_date: str = Query(..., description="First day to backfill (YYYY-MM-DD)"),
+    to_date: str | None = Query(None, description="Last day (YYYY-MM-DD; default and maximum: yesterday)"),
+    force: bool = Query(False, description="Refetch days an earlier backfill already completed"),
+    _email: str = Depends(get_current_admin_email),
+):
+    """
+    Admin: backfill energy_daily and the power/solar/battery/grid samples from Home Assistant's recorder history.
+    Runs in the background and resumes after the days earlier runs completed; poll GET for progress.
+    """
+    try:
+        from_dt = date.fromisoformat(from_date)
+        to_dt = date.fromisoformat(to_date) if to_date else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date format. Use YYYY-MM-DD. {str(e)}"
+        )
+    if not _ha_configured():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Home Assistant not configured")
+    try:
+        return await energy_backfill.start(from_dt, to_dt, force=force)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.exception("Failed to start energy backfill")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Unable to reach Home Assistant"
+        ) from e
+
+
+@router.get("/energy-history/backfill")
+async def get_energy_backfill(_email: str = Depends(get_current_admin_email)):
+    """Admin: progress of the current or last backfill started by this worker."""
+    return energy_backfill.status()
@@ -0,0 +1,156 @@
+"""
+Response compression: Brotli when the client accepts it and the optional "brotli" package is installed,
+otherwise gzip. Images, audio/video, archives, event streams, Parquet, partial (206) and already-encoded responses
+and small bodies are left as-is. The checks live here rather than in Starlette's gzip internals, so a Starlette
+upgrade cannot change what gets compressed.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Already compressed, or streamed (compressing SSE would hold events back); "type/*" covers a whole family
+_EXCLUDED_CONTENT_TYPES = frozenset((
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/grpc",
+    "application/vnd.apache.parquet",  # compressed column by column already
+    "audio/*",
+    "font/woff",
+    "font/woff2",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/event-stream",
+    "video/*",
+))
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _is_excluded(content_type: str) -> bool:
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type in _EXCLUDED_CONTENT_TYPES or media_type.partition("/")[0] + "/*" in _EXCLUDED_CONTENT_TYPES
+
+
+# Compressors are created on first use: most responses are below minimum_size or excluded
+class _GzipEncoder:
+    content_encoding = "gzip"
+
+    def __init__(self, level: int):
+        self.level = level
+        self._compressor = None
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        out = self._compressor.compress(body)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    content_encoding = "br"
+
+    def __init__(self, quality: int):
+        self.quality = quality
+        self._compressor = None
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        out = self._compressor.process(body)
+        return out + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class _Responder:
+    """Wraps one response's send: holds back the start message until the first body decides on compression."""
+
+    def __init__(self, send: Send, minimum_size: int, encoder: Optional[object]):
+        self.send = send
+        self.minimum_size = minimum_size
+        self.encoder = encoder  # None: client accepts neither coding (only Vary is added)
+        self.start: Optional[Message] = None
+        self.passthrough = False
+        self.compressing = False
+
+    async def __call__(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] == 206
+                or _is_excluded(headers.get("content-type", ""))
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message
+        elif self.passthrough or message_type != "http.response.body":
+            if self.start is not None:  # e.g. pathsend: sent untouched
+                await self.send(self.start)
+                self.start = None
+            await self.send(message)
+        elif self.start is not None:
+            await self._first_body(message)
+        elif self.compressing:
+            message["body"] = self.encoder.compress(message.get("body", b""), message.get("more_body", False))
+            await self.send(message)
+        else:
+            await self.send(message)
+
+    async def _first_body(self, message: Message) -> None:
+        start, self.start = self.start, None
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if len(body) < self.minimum_size and not more_body:
+            await self.send(start)
+            await self.send(message)
+            return
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if self.encoder is not None:
+            self.compressing = True
+            message["body"] = self.encoder.compress(body, more_body)
+            headers["Content-Encoding"] = self.encoder.content_encoding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+        await self.send(start)
+        await self.send(message)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+        encoder = None
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            encoder = _BrotliEncoder(self.brotli_quality)
+        elif _accepts(accept_encoding, "gzip"):
+            encoder = _GzipEncoder(self.gzip_level)
+        await self.app(scope, receive, _Responder(send, self.minimum_size, encoder))
@@ -27,6 +27,13 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "dev-secret-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # PBKDF2-SHA256 cost. Changing it rehashes each user's password at their next login.
+    AUTH_PBKDF2_ROUNDS: int = 29000
+    # Read-through cache of user records (users live in SQLite); other workers' changes show up within the TTL
+    AUTH_USER_CACHE_SIZE: int = 256
+    AUTH_USER_CACHE_TTL: float = 30.0
+    # Verified access tokens kept so repeat requests skip the JWT signature check (0 disables)
+    AUTH_TOKEN_CACHE_SIZE: int = 1024
 
     # Dev: allow POST /auth/dev/clear-users to reset all users. Set to false in production.
     ALLOW_DEV_CLEAR_USERS: bool = True
@@ -45,9 +52,17 @@ class Settings(BaseSettings):
     USER3_SEED_PASSWORD: str = ""
 
     # MQTT Settings
+    MQTT_ENABLED: bool = False
     MQTT_BROKER: str = "localhost"
     MQTT_PORT: int = 1883
     MQTT_TOPIC_PREFIX: str = "home/"
+    # Messages buffered between paho's network thread and the event loop; when full, drop_oldest or drop_newest
+    MQTT_QUEUE_SIZE: int = 10000
+    MQTT_OVERFLOW_POLICY: str = "drop_oldest"
+    # The latest value per topic is written to energy_samples and published to the state index this often
+    MQTT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # JSON routing table (topic pattern -> entity_id, json_path, unit, scale); re-read when the file changes
+    MQTT_ROUTES_FILE: str = ""
 
     # Home Assistant (optional; leave empty to disable integration)
     HOME_ASSISTANT_URL: str = ""
@@ -56,6 +71,93 @@ class Settings(BaseSettings):
     # For Docker: mount the network share and use the container path (e.g., /mnt/ha-media)
     # For local dev: use UNC path (e.g., \\homeassistant\media) or mapped drive (e.g., Z:\media)
     HA_MEDIA_PATH: str = r"\\homeassistant\media"
+    # How often the house image catalog checks HA_MEDIA_PATH for new/removed images
+    HOUSE_IMAGE_SCAN_INTERVAL_SECONDS: int = 60
+    # Resized/WebP house image variants (need the optional "Pillow" package): longest edge in px, encoder quality,
+    # render processes, and a local disk cache (empty dir = backend/image_cache) trimmed least-recently-used first
+    HOUSE_IMAGE_THUMBNAIL_PX: int = 320
+    HOUSE_IMAGE_DASHBOARD_PX: int = 1280
+    HOUSE_IMAGE_QUALITY: int = 80
+    HOUSE_IMAGE_RENDER_WORKERS: int = 2
+    HOUSE_IMAGE_CACHE_DIR: str = ""
+    HOUSE_IMAGE_CACHE_MAX_MB: int = 200
+    # Shared HTTP client for HA REST calls (one pooled client per process, opened on startup)
+    HA_HTTP_TIMEOUT: float = 15.0
+    HA_HTTP_CONNECT_TIMEOUT: float = 5.0
+    HA_HTTP_MAX_CONNECTIONS: int = 20
+    HA_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HA_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    # HTTP/2 needs the optional "h2" package (pip install "httpx[http2]"); falls back to HTTP/1.1 without it
+    HA_HTTP2: bool = False
+    # Cache of the full /api/states snapshot. TTL 0 disables caching (every request goes to HA).
+    HA_STATES_CACHE_TTL: float = 10.0
+    # Serve the expired snapshot immediately (for up to HA_STATES_MAX_STALE seconds) while one background refresh runs
+    HA_STATES_STALE_WHILE_REVALIDATE: bool = False
+    HA_STATES_MAX_STALE: float = 60.0
+    # Mirror entity states over HA's WebSocket API (/api/websocket) instead of polling /api/states
+    HOME_ASSISTANT_WEBSOCKET: bool = False
+    HA_WEBSOCKET_RECONNECT_MIN: float = 1.0
+    HA_WEBSOCKET_RECONNECT_MAX: float = 60.0
+    # Dashboard push stream (GET /homeassistant/dashboard/stream, Server-Sent Events)
+    HA_STREAM_MAX_SUBSCRIBERS: int = 50
+    HA_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    # Without the WebSocket mirror, one shared poller refreshes states at this interval while anyone is subscribed
+    HA_STREAM_POLL_INTERVAL: float = 10.0
+    # Optional JSON file overriding tile -> entity matching rules for /homeassistant/dashboard/summary
+    HA_DASHBOARD_SUMMARY_RULES_FILE: str = ""
+    # Top-level HA state fields left out of entity/dashboard responses (comma-separated)
+    HA_DROP_STATE_FIELDS: str = "context,last_reported"
+    # Per-domain attribute allow-list as JSON, e.g. {"weather": ["temperature", "humidity"]}.
+    # Empty uses the built-in default (weather without its forecast blob); domains not listed keep all attributes.
+    HA_ATTRIBUTE_ALLOWLIST: str = ""
+
+    # HTTP response compression (Brotli needs the optional "brotli" package; gzip otherwise)
+    HTTP_COMPRESSION_MIN_SIZE: int = 1024
+    HTTP_GZIP_LEVEL: int = 6
+    HTTP_BROTLI_QUALITY: int = 4
+
+    # SQLite (energy.db): one writer + N read-only connections, WAL journal
+    SQLITE_READ_CONNECTIONS: int = 4
+    # Seconds to wait for a free pooled connection / for a lock held by another process
+    SQLITE_POOL_TIMEOUT: float = 10.0
+    SQLITE_BUSY_TIMEOUT: float = 5.0
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_CACHE_SIZE_KB: int = 16384
+    # Worker threads for blocking work from async endpoints: SQLite ("db"; 0 = SQLITE_READ_CONNECTIONS + 1) and
+    # the HA media share ("fs"). Calls beyond EXECUTOR_MAX_PENDING per pool are rejected with 503.
+    EXECUTOR_DB_WORKERS: int = 0
+    EXECUTOR_FS_WORKERS: int = 4
+    # Password hashing/verification threads (caps concurrent PBKDF2 work during login bursts)
+    EXECUTOR_AUTH_WORKERS: int = 2
+    EXECUTOR_MAX_PENDING: int = 200
+    # GET /metrics (Prometheus text format) and the per-route request timing middleware; event loop lag is
+    # sampled every METRICS_LOOP_LAG_INTERVAL_SECONDS (0 disables)
+    METRICS_ENABLED: bool = True
+    METRICS_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+
+    # Multi-worker mode (uvicorn --workers N): the worker holding the scheduler lease (SQLite row, renewed every
+    # MULTI_WORKER_LEASE_TTL/3 s, taken over once it expires) runs scheduled jobs, HA polling/WebSocket and MQTT, and
+    # publishes its HA states snapshot to MULTI_WORKER_STATE_DIR (empty = under /dev/shm when available). The other
+    # workers reload that snapshot when it changes, checking every MULTI_WORKER_SYNC_INTERVAL s, instead of calling HA.
+    MULTI_WORKER: bool = False
+    MULTI_WORKER_LEASE_TTL: float = 15.0
+    MULTI_WORKER_SYNC_INTERVAL: float = 1.0
+    MULTI_WORKER_STATE_DIR: str = ""
+
+    # Energy time series: sample power/solar/battery/grid every N seconds (0 disables) and keep raw samples N days
+    ENERGY_SAMPLE_INTERVAL_SECONDS: int = 60
+    ENERGY_SAMPLE_RETENTION_DAYS: int = 30
+
+    # Backfill of energy_daily/energy_samples from HA's recorder (/api/history/period): local days per request,
+    # requests in flight, sample rows per bulk write, and the read timeout of one request
+    HA_BACKFILL_CHUNK_DAYS: int = 7
+    HA_BACKFILL_CONCURRENCY: int = 4
+    HA_BACKFILL_BATCH_ROWS: int = 5000
+    HA_BACKFILL_TIMEOUT: float = 120.0
+    # GET /homeassistant/energy-history/export: rows per fetchmany batch and concurrent downloads (each holds its own
+    # read-only SQLite connection); format=parquet needs the optional "pyarrow" package
+    ENERGY_EXPORT_BATCH_ROWS: int = 5000
+    ENERGY_EXPORT_MAX_CONCURRENT: int = 2
 
     class Config:
         env_file = str(_ENV_FILE) if _ENV_FILE.exists() else None
@@ -1,28 +1,266 @@
 """
 SQLite database setup for energy history storage.
+
+Connections come from a small pool: one writer and SQLITE_READ_CONNECTIONS read-only readers, opened lazily
+and configured once (WAL, synchronous=NORMAL, mmap, page cache, in-memory temp tables). With WAL, readers never
+block the writer or each other. Sync code uses `with db.reader() as conn` / `with db.writer() as conn`; async
+code uses `await db.run_read(fn)` / `await db.run_write(fn)`, which call fn(conn) on the "db" executor.
+Bulk reads of unbounded size (exports) stream batches with `async for rows in db.iter_rows(sql)`.
 """
+import asyncio
+import queue
 import sqlite3
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, TypeVar
+
+from core import executors
+from core import metrics
+from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # Database file path (in backend directory)
 _DB_PATH = Path(__file__).resolve().parent.parent / "energy.db"
 
 
+class PoolTimeoutError(RuntimeError):
+    """No connection became free within SQLITE_POOL_TIMEOUT."""
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{settings.SQLITE_CACHE_SIZE_KB}")  # negative = KiB
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
 def get_db_connection() -> sqlite3.Connection:
-    """Get a connection to the SQLite database. Creates the database file if it doesn't exist."""
+    """
+    Open a new, unpooled connection (caller closes it). Creates the database file if it doesn't exist.
+    Prefer reader()/writer(); this is for schema setup and one-off scripts.
+    """
     conn = sqlite3.connect(str(_DB_PATH), check_same_thread=False)
     conn.row_factory = sqlite3.Row  # Return rows as dict-like objects
+    _apply_pragmas(conn)
     return conn
 
 
+def _open_reader() -> sqlite3.Connection:
+    conn = sqlite3.connect(f"{Path(_DB_PATH).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
+    return conn
+
+
+class _Pool:
+    """Fixed set of connections handed out one caller at a time, with wait-time counters."""
+
+    def __init__(self, name: str, size: int, factory: Callable[[], sqlite3.Connection]):
+        self.name = name
+        self.size = size
+        self._hold = metrics.DB_CONNECTION_HOLD.labels(name)
+        self._factory = factory
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get(self, timeout: float) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._factory()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeoutError(f"No {self.name} connection free after {timeout}s") from None
+
+    @contextmanager
+    def connection(self, timeout: float) -> Iterator[sqlite3.Connection]:
+        start = time.perf_counter()
+        try:
+            conn = self._get(timeout)
+        except PoolTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        with self._lock:
+            self.acquired += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if wait > 0.001:
+                self.waited += 1
+        acquired = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self._hold.observe(time.perf_counter() - acquired)
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": self._idle.qsize(),
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+_initialized_path: Optional[str] = None
+_writer_pool: Optional[_Pool] = None
+_reader_pool: Optional[_Pool] = None
+_pool_lock = threading.Lock()
+
+
+def _pools() -> tuple[_Pool, _Pool]:
+    global _writer_pool, _reader_pool
+    if _writer_pool is None or _reader_pool is None:
+        with _pool_lock:
+            if _writer_pool is None or _reader_pool is None:
+                _writer_pool = _Pool("writer", 1, get_db_connection)
+                _reader_pool = _Pool("reader", max(settings.SQLITE_READ_CONNECTIONS, 1), _open_reader)
+    return _writer_pool, _reader_pool
+
+
+@contextmanager
+def reader() -> Iterator[sqlite3.Connection]:
+    """Borrow a read-only connection (blocks while all readers are in use)."""
+    with _pools()[1].connection(settings.SQLITE_POOL_TIMEOUT) as conn:
+        yield conn
+
+
+@contextmanager
+def writer() -> Iterator[sqlite3.Connection]:
+    """Borrow the single writer connection inside a transaction: committed on exit, rolled back on error."""
+    with _pools()[0].connection(settings.SQLITE_POOL_TIMEOUT) as conn:
+        with conn:
+            yield conn
+
+
+async def run_read(fn: Callable[[sqlite3.Connection], T], op: str = "db.read") -> T:
+    """Run fn(conn) with a reader connection on the "db" executor (latency recorded under op)."""
+    def call() -> T:
+        with reader() as conn:
+            return fn(conn)
+    return await executors.run_blocking("db", op, call)
+
+
+async def run_write(fn: Callable[[sqlite3.Connection], T], op: str = "db.write") -> T:
+    """Run fn(conn) in a write transaction on the "db" executor (latency recorded under op)."""
+    def call() -> T:
+        with writer() as conn:
+            return fn(conn)
+    return await executors.run_blocking("db", op, call)
+
+
+async def iter_rows(
+    sql: str, params: Sequence[Any] = (), batch_size: int = 1000, op: str = "db.iter"
+) -> AsyncIterator[List[tuple]]:
+    """
+    Yield the rows of a long read query as tuples, in fetchmany(batch_size) batches; the next batch is fetched
+    while the caller works on the current one. Runs on its own read-only connection and its own thread, not
+    pooled ones, so a slow consumer (e.g. a download) never holds a reader or db worker the rest of the app
+    needs, and a busy "db" pool cannot cut a started download short. The query reads one consistent snapshot
+    from start to end.
+    """
+    def open_cursor() -> sqlite3.Cursor:
+        conn = _open_reader()
+        conn.row_factory = None  # plain tuples: cheaper than sqlite3.Row for millions of rows
+        try:
+            return conn.execute(sql, params)
+        except Exception:
+            conn.close()
+            raise
+
+    executor = executors.dedicated("db-iter")
+    cursor: Optional[sqlite3.Cursor] = None
+    pending: Optional[asyncio.Future] = None
+    try:
+        cursor = await executor.run(op, open_cursor)
+        pending = asyncio.ensure_future(executor.run(op, cursor.fetchmany, batch_size))
+        while True:
+            rows = await pending
+            if not rows:
+                break
+            pending = asyncio.ensure_future(executor.run(op, cursor.fetchmany, batch_size))
+            yield rows
+    finally:
+        # Let a fetch still running on the thread finish before closing its connection
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        if cursor is not None:
+            cursor.connection.close()
+        executor.shutdown()
+
+
+def close_pool() -> None:
+    """Close pooled connections (idle ones now, borrowed ones when returned). The next use opens a new pool."""
+    global _writer_pool, _reader_pool
+    with _pool_lock:
+        for pool in (_writer_pool, _reader_pool):
+            if pool is not None:
+                pool.close()
+        _writer_pool = _reader_pool = None
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Connection pool counters, including how long callers waited for a connection."""
+    writer_pool, reader_pool = _pools()
+    return {"path": str(_DB_PATH), "writer": writer_pool.stats(), "reader": reader_pool.stats()}
+
+
+def is_initialized() -> bool:
+    """True once init_db() has run for the current database path."""
+    return _initialized_path == str(_DB_PATH)
+
+
 def init_db() -> None:
-    """Initialize the database schema. Safe to call multiple times (idempotent)."""
+    """Initialize the database schema and switch it to WAL. Safe to call multiple times (idempotent)."""
+    global _initialized_path
+    close_pool()
     conn = get_db_connection()
     try:
+        # Persistent in the database file, so every later connection (including read-only ones) uses WAL
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS energy_daily (
                 date          DATE PRIMARY KEY,
@@ -34,7 +272,76 @@ def init_db() -> None:
         conn.execute("""
             CREATE INDEX IF NOT EXISTS idx_energy_daily_date ON energy_daily(date DESC)
         """)
+        # Minute-level time series: one small integer key per sampled entity, narrow sample rows
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS energy_series (
+                id            INTEGER PRIMARY KEY,
+                entity_id     TEXT NOT NULL UNIQUE,
+                kind          TEXT NOT NULL,
+                unit          TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS energy_samples (
+                series_id     INTEGER NOT NULL REFERENCES energy_series(id),
+                ts            INTEGER NOT NULL,
+                value         REAL NOT NULL,
+                PRIMARY KEY (series_id, ts)
+            ) WITHOUT ROWID
+        """)
+        # Rollup tiers of energy_samples (bucket = start of hour / local day / local month, unix seconds).
+        # avg = sum / count; last is the value of the latest sample in the bucket.
+        for tier in ("hourly", "daily", "monthly"):
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS energy_rollup_{tier} (
+                    series_id     INTEGER NOT NULL,
+                    bucket        INTEGER NOT NULL,
+                    min           REAL NOT NULL,
+                    max           REAL NOT NULL,
+                    sum           REAL NOT NULL,
+                    count         INTEGER NOT NULL,
+                    last          REAL NOT NULL,
+                    last_ts       INTEGER NOT NULL,
+                    PRIMARY KEY (series_id, bucket)
+                ) WITHOUT ROWID
+            """)
+        # Per-tier watermark: everything in the source before this timestamp has been rolled up
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS energy_rollup_watermarks (
+                tier          TEXT PRIMARY KEY,
+                ts            INTEGER NOT NULL
+            )
+        """)
+        # Days already backfilled from HA history (services/energy_backfill.py); a re-run resumes after them
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS energy_backfill_days (
+                date          DATE PRIMARY KEY,
+                completed_at  TEXT NOT NULL DEFAULT (datetime('now'))
+            ) WITHOUT ROWID
+        """)
+        # Users (api/v1/auth_store.py); email is stored lowercased and is the primary key
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                email                 TEXT PRIMARY KEY CHECK (email = lower(email)),
+                hashed_password       TEXT NOT NULL,
+                is_admin              INTEGER NOT NULL DEFAULT 0,
+                must_change_password  INTEGER NOT NULL DEFAULT 1,
+                created_at            TEXT NOT NULL DEFAULT (datetime('now')),
+                updated_at            TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_admin ON users(is_admin) WHERE is_admin = 1")
+        # Leader leases for multi-worker mode (core/lease.py); times are unix seconds
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS worker_leases (
+                name          TEXT PRIMARY KEY,
+                holder        TEXT NOT NULL,
+                expires_at    REAL NOT NULL,
+                acquired_at   REAL NOT NULL
+            )
+        """)
         conn.commit()
+        _initialized_path = str(_DB_PATH)
         logger.info(f"Database initialized at {_DB_PATH}")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
@@ -0,0 +1,208 @@
+"""
+Bounded thread pools for blocking work called from async endpoints: SQLite queries ("db"), filesystem access
+on the possibly remote HA media share ("fs") and password hashing ("auth"). Each pool has a fixed number of worker
+threads and a cap on queued calls, so a hung NAS stat ties up at most the fs workers and never the event loop or
+the db pool.
+
+    rows = await executors.run_blocking("db", "energy_history.get", energy_history.get_history, from_date=d)
+
+Every call records a latency histogram (queue wait + run time) under its operation name; see get_executor_stats().
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from core import metrics
+from core.config import settings
+
+T = TypeVar("T")
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class ExecutorBusyError(RuntimeError):
+    """The pool already has its maximum number of calls queued or running."""
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram (Prometheus-style); thread-safe."""
+
+    def __init__(self, buckets_ms: tuple = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)  # last slot = +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        i = 0
+        while i < len(self.buckets_ms) and ms > self.buckets_ms[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def _quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, n in zip((*self.buckets_ms, "+Inf"), self.counts):
+                cumulative += n
+                buckets[str(bound)] = cumulative
+            return {
+                "count": self.count,
+                "sum_ms": round(self.sum_ms, 3),
+                "max_ms": round(self.max_ms, 3),
+                "p50_ms": self._quantile(0.5),
+                "p99_ms": self._quantile(0.99),
+                "buckets": buckets,
+            }
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max(max_workers, 1)
+        self.max_pending = max(max_pending, self.max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.rejected = 0
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.wait: Dict[str, LatencyHistogram] = {}
+        self._exported: Dict[str, Any] = {}
+
+    def _histograms(self, op: str) -> tuple[LatencyHistogram, LatencyHistogram, Any]:
+        latency = self.latency.get(op)
+        if latency is None:
+            with self._lock:
+                latency = self.latency.setdefault(op, LatencyHistogram())
+                self.wait.setdefault(op, LatencyHistogram())
+                self._exported.setdefault(op, metrics.EXECUTOR_CALL_DURATION.labels(self.name, op))
+        return latency, self.wait[op], self._exported[op]
+
+    async def run(self, op: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusyError(f"{self.name} executor has {self.pending} calls pending")
+            self.pending += 1
+        latency, wait, exported = self._histograms(op)
+        submitted = time.perf_counter()
+
+        def call() -> T:
+            wait.observe(time.perf_counter() - submitted)
+            with self._lock:
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            elapsed = time.perf_counter() - submitted
+            latency.observe(elapsed)
+            exported.observe(elapsed)
+            with self._lock:
+                self.pending -= 1
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "running": self.running,
+            "rejected": self.rejected,
+            "operations": {
+                op: {"latency": hist.snapshot(), "wait": self.wait[op].snapshot()}
+                for op, hist in list(self.latency.items())
+            },
+        }
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _pool_sizes() -> Dict[str, int]:
+    return {
+        # One more than the reader pool so a writer call never waits behind a full set of reads
+        "db": settings.EXECUTOR_DB_WORKERS or settings.SQLITE_READ_CONNECTIONS + 1,
+        "fs": settings.EXECUTOR_FS_WORKERS,
+        "auth": settings.EXECUTOR_AUTH_WORKERS,
+    }
+
+
+def _load_gauges() -> Dict[tuple, float]:
+    values: Dict[tuple, float] = {}
+    for name, executor in list(_executors.items()):
+        values[(name, "pending")] = executor.pending
+        values[(name, "running")] = executor.running
+        values[(name, "rejected")] = executor.rejected
+    return values
+
+
+metrics.Gauge(
+    "executor_calls", "Calls pending/running (and rejected so far) per executor", ("pool", "state"), fn=_load_gauges
+)
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = BoundedExecutor(name, _pool_sizes()[name], settings.EXECUTOR_MAX_PENDING)
+                _executors[name] = executor
+    return executor
+
+
+async def run_blocking(pool: str, op: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run fn(*args, **kwargs) on the named pool ("db", "fs" or "auth"), timing it under op."""
+    return await get_executor(pool).run(op, functools.partial(fn, *args, **kwargs))
+
+
+def dedicated(name: str) -> BoundedExecutor:
+    """
+    A private one-thread executor for one long-running consumer (e.g. an export that has already sent its
+    response headers): its calls never queue behind, or get rejected by, a shared pool. shutdown() it when done.
+    """
+    return BoundedExecutor(name, 1, settings.EXECUTOR_MAX_PENDING)
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Per-pool load (pending/running/rejected) and per-operation latency and queue-wait histograms."""
+    return {name: executor.stats() for name, executor in list(_executors.items())}
+
+
+def shutdown_executors() -> None:
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
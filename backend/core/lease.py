@@ -0,0 +1,146 @@
+"""
+Leader lease for multi-worker mode (MULTI_WORKER): a row in the worker_leases table of the shared SQLite database.
+
+Every worker runs the same loop: every MULTI_WORKER_LEASE_TTL / 3 seconds it renews the lease if it holds it, or
+takes it over if the holder's lease has expired, in one UPSERT (SQLite serializes the writers, so at most one
+worker wins). The holder runs the once-per-deployment work (scheduled jobs, HA polling/mirror, MQTT); when it
+dies its lease expires within MULTI_WORKER_LEASE_TTL and another worker takes over. A holder that cannot renew
+in time (database locked, executor busy) steps down before its lease can expire, so two workers never both
+believe they lead. Releasing on shutdown hands over immediately.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from core import db
+from core import metrics
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _acquire(conn, name: str, holder: str, now: float, ttl: float) -> Optional[Dict[str, Any]]:
+    conn.execute(
+        """
+        INSERT INTO worker_leases (name, holder, expires_at, acquired_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            holder = excluded.holder,
+            expires_at = excluded.expires_at,
+            acquired_at = CASE WHEN holder = excluded.holder THEN acquired_at ELSE excluded.acquired_at END
+        WHERE holder = excluded.holder OR expires_at < excluded.acquired_at
+        """,
+        (name, holder, now + ttl, now),
+    )
+    row = conn.execute("SELECT holder, expires_at, acquired_at FROM worker_leases WHERE name = ?", (name,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def _release(conn, name: str, holder: str) -> None:
+    conn.execute("DELETE FROM worker_leases WHERE name = ? AND holder = ?", (name, holder))
+
+
+class Lease:
+    def __init__(self, name: str):
+        self.name = name
+        # Unique per process start, readable in worker_leases
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+        self.current_holder: Optional[str] = None
+        self._expires_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._on_acquire: Optional[Callable[[], Awaitable[None]]] = None
+        self._on_release: Optional[Callable[[], Awaitable[None]]] = None
+        self.stats: Dict[str, int] = {"acquired": 0, "lost": 0, "renew_errors": 0}
+
+    def start(self, on_acquire: Callable[[], Awaitable[None]], on_release: Callable[[], Awaitable[None]]) -> None:
+        """Start the heartbeat loop; on_acquire/on_release run on each change of leadership."""
+        self._on_acquire, self._on_release = on_acquire, on_release
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"lease-{self.name}")
+
+    async def stop(self) -> None:
+        """Stop heartbeating and give the lease up so another worker can take over right away."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.held:
+            await self._set_held(False)
+            try:
+                await db.run_write(lambda conn: _release(conn, self.name, self.holder), op="lease.release")
+            except Exception as e:
+                logger.warning(f"Could not release lease {self.name}: {e}")
+
+    async def _set_held(self, held: bool) -> None:
+        if held == self.held:
+            return
+        self.held = held
+        callback = self._on_acquire if held else self._on_release
+        if held:
+            self.stats["acquired"] += 1
+            logger.info(f"Worker {self.holder} acquired the {self.name} lease")
+        else:
+            self.stats["lost"] += 1
+            logger.info(f"Worker {self.holder} gave up the {self.name} lease")
+        if callback is not None:
+            try:
+                await callback()
+            except Exception:
+                logger.exception(f"Lease {self.name} {'acquire' if held else 'release'} callback failed")
+
+    async def heartbeat(self) -> bool:
+        """One acquire/renew attempt. Returns whether this worker holds the lease afterwards."""
+        ttl = settings.MULTI_WORKER_LEASE_TTL
+        now = time.time()
+        # A holder's renewal must finish while the last one is certainly still valid, however long the write
+        # waits in the executor queue or on a locked database
+        timeout = max(self._expires_at - ttl / 3 - now, 0) if self.held else None
+        try:
+            row = await asyncio.wait_for(
+                db.run_write(lambda conn: _acquire(conn, self.name, self.holder, now, ttl), op="lease.heartbeat"),
+                timeout,
+            )
+        except Exception as e:
+            self.stats["renew_errors"] += 1
+            reason = "renewal did not finish in time" if isinstance(e, asyncio.TimeoutError) else e
+            logger.warning(f"Lease {self.name} heartbeat failed: {reason}")
+            # Keep leading only while the last successful renewal is certainly still valid
+            if self.held and time.time() >= self._expires_at - ttl / 3:
+                await self._set_held(False)
+            return self.held
+        self.current_holder = row["holder"] if row else None
+        held = self.current_holder == self.holder
+        if held:
+            self._expires_at = row["expires_at"]
+        await self._set_held(held)
+        return held
+
+    async def _run(self) -> None:
+        while True:
+            await self.heartbeat()
+            await asyncio.sleep(max(settings.MULTI_WORKER_LEASE_TTL / 3, 0.1))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "worker": self.holder,
+            "held": self.held,
+            "holder": self.current_holder,
+            "expires_in_seconds": round(self._expires_at - time.time(), 1) if self.held else None,
+            **self.stats,
+        }
+
+
+scheduler_lease = Lease("scheduler")
+
+metrics.Gauge(
+    "worker_lease_held", "1 while this worker holds the lease (multi-worker mode)", ("lease",),
+    fn=lambda: {(scheduler_lease.name,): int(scheduler_lease.held)} if settings.MULTI_WORKER else {},
+)
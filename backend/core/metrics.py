@@ -0,0 +1,335 @@
+"""
+Prometheus-style metrics: counters, gauges and histograms rendered by GET /metrics in the text exposition format.
+
+Hot-path cost is a dict lookup plus an increment. Label children are created once and cached, and modules
+bind the ones they use at import:
+
+    _STATES_LATENCY = metrics.HA_UPSTREAM_DURATION.labels("states")
+    ...
+    _STATES_LATENCY.observe(elapsed)
+
+Children need no locks. Each thread updates its own shard, found by thread id, and a scrape sums the shards, so
+the event loop and the db/fs worker threads never contend or lose increments.
+"""
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Seconds (Prometheus convention)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_get_ident = threading.get_ident
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards: Dict[int, List[float]] = {}
+
+    def inc(self, amount: float = 1) -> None:
+        shard = self._shards.get(_get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(_get_ident(), [0])
+        shard[0] += amount
+
+    def value(self) -> float:
+        return sum(shard[0] for shard in list(self._shards.values()))
+
+
+class _GaugeChild:
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return self._value
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_shards")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # Per thread: one count per bucket, +Inf count, then the sum
+        self._shards: Dict[int, List[float]] = {}
+
+    def observe(self, value: float) -> None:
+        shard = self._shards.get(_get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(_get_ident(), [0] * (len(self._bounds) + 1) + [0.0])
+        shard[bisect.bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """(per-bucket counts incl. +Inf, sum)."""
+        counts = [0] * (len(self._bounds) + 1)
+        total = 0.0
+        for shard in list(self._shards.values()):
+            for i in range(len(counts)):
+                counts[i] += shard[i]
+            total += shard[-1]
+        return counts, total
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The child for these label values, created once; bind it at import time on hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value())}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    """Set directly, or pass fn returning {label values tuple: value} to read it at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._fn = fn
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def render(self) -> List[str]:
+        if self._fn is None:
+            return super().render()
+        lines = self._header()
+        try:
+            values = self._fn()
+        except Exception:
+            logger.exception(f"Metric callback for {self.name} failed")
+            values = {}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = _label_text(self.labelnames, values, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in list(REGISTRY):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Series shared across modules -------------------------------------------------------------------------------
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+HA_UPSTREAM_DURATION = Histogram(
+    "ha_upstream_request_duration_seconds", "Home Assistant REST call latency", ("endpoint",)
+)
+HA_UPSTREAM_ERRORS = Counter(
+    "ha_upstream_errors_total", "Failed Home Assistant REST calls", ("endpoint", "reason")
+)
+EXECUTOR_CALL_DURATION = Histogram(
+    "executor_call_duration_seconds", "Blocking calls on the bounded executors (queue wait + run), e.g. SQLite ops",
+    ("pool", "op"),
+)
+DB_CONNECTION_HOLD = Histogram(
+    "sqlite_connection_hold_seconds", "Time a pooled SQLite connection is held per use (queries + commit)", ("pool",)
+)
+SCHEDULER_JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+SCHEDULER_JOB_RUNS = Counter("scheduler_job_runs_total", "Scheduled job runs by outcome", ("job", "outcome"))
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late a periodic sleep on the event loop wakes up",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+_LOOP_LAG = EVENT_LOOP_LAG.labels()
+
+
+def _route_template(scope: Scope) -> str:
+    """
+    Full path template of the matched route, e.g. /api/v1/homeassistant/entities/{entity_id:path}. Newer FastAPI
+    versions keep included routes relative to their router (scope["route"].path is /homeassistant/...) and
+    record the prefixed template in the route context; older ones store the prefixed path on the route itself.
+    """
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request under its full route template (the URL pattern including the /api/v1 prefix);
+    unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # (method, route, status) -> bound histogram child
+        self._children: Dict[Tuple[str, str, int], Any] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            key = (scope["method"], _route_template(scope), status)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = HTTP_REQUEST_DURATION.labels(*key)
+            child.observe(time.perf_counter() - start)
+
+
+def instrument_job(job_id: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a scheduler job (sync or async) to record its duration and success/error outcome."""
+    duration = SCHEDULER_JOB_DURATION.labels(job_id)
+    success = SCHEDULER_JOB_RUNS.labels(job_id, "success")
+    error = SCHEDULER_JOB_RUNS.labels(job_id, "error")
+
+    if asyncio.iscoroutinefunction(fn):
+        async def run_async(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                error.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start)
+            success.inc()
+            return result
+        run_async.__name__ = getattr(fn, "__name__", job_id)
+        return run_async
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            error.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - start)
+        success.inc()
+        return result
+    run.__name__ = getattr(fn, "__name__", job_id)
+    return run
+
+
+def record_missed_job(event) -> None:
+    """APScheduler EVENT_JOB_MISSED listener."""
+    SCHEDULER_JOB_RUNS.labels(event.job_id, "missed").inc()
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """Sleep interval seconds in a loop and record how late each wake-up is. Runs until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        _LOOP_LAG.observe(max(loop.time() - start - interval, 0.0))
@@ -0,0 +1 @@
+# Local development and test helpers (not imported by the app)
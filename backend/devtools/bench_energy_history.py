@@ -0,0 +1,151 @@
+"""
+Benchmark: derived energy history (per-day deltas, bill-period resets, grouping) computed in SQLite with window
+functions vs. the same math in a Python loop over the rows, on 10 years of synthetic bill-to-date snapshots.
+
+Run from backend/:
+    python -m devtools.bench_energy_history [--years 10] [--repeat 5]
+
+Uses a temporary database; also checks that both implementations return the same numbers.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from core import db
+from services import energy_history
+
+
+def populate(years: int, seed: int = 42) -> int:
+    """Insert bill-to-date rows: usage/cost accumulate daily and reset every 29-32 days. Returns row count."""
+    rng = random.Random(seed)
+    day = date.today() - timedelta(days=365 * years)
+    end = date.today()
+    rows = []
+    usage = cost = 0.0
+    next_reset = day + timedelta(days=rng.randint(29, 32))
+    while day <= end:
+        if day >= next_reset:
+            usage = cost = 0.0
+            next_reset = day + timedelta(days=rng.randint(29, 32))
+        used = round(rng.uniform(5, 45), 3)
+        usage += used
+        cost += used * 0.14
+        if rng.random() > 0.02:  # a few missed snapshots
+            rows.append((day.isoformat(), round(usage, 3), round(cost, 2), day.isoformat()))
+        day += timedelta(days=1)
+    with db.writer() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO energy_daily (date, usage_kwh, cost_usd, created_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
+
+
+def python_derived(mode: str, group_by: str) -> List[Dict[str, Any]]:
+    """Reference implementation: read every snapshot and do the differencing/grouping in Python."""
+    prev: Optional[Dict[str, Any]] = None
+    bill_period = 0
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for row in energy_history.get_history():
+        d = date.fromisoformat(row["date"])
+        usage_delta = cost_delta = None
+        if prev is not None:
+            if row["usage_kwh"] is not None and prev["usage_kwh"] is not None:
+                reset = row["usage_kwh"] < prev["usage_kwh"]
+            elif row["cost_usd"] is not None and prev["cost_usd"] is not None:
+                reset = row["cost_usd"] < prev["cost_usd"]
+            else:
+                reset = False
+            if reset:
+                bill_period += 1
+                usage_delta, cost_delta = row["usage_kwh"], row["cost_usd"]
+            else:
+                if row["usage_kwh"] is not None and prev["usage_kwh"] is not None:
+                    usage_delta = row["usage_kwh"] - prev["usage_kwh"]
+                if row["cost_usd"] is not None and prev["cost_usd"] is not None:
+                    cost_delta = row["cost_usd"] - prev["cost_usd"]
+        prev = row
+        key = {
+            "day": d,
+            "week": d - timedelta(days=d.weekday()),
+            "month": d.replace(day=1),
+            "bill_period": bill_period,
+        }[group_by]
+        group = groups.setdefault(
+            key, {"date": row["date"], "end_date": row["date"], "days": 0, "usage_kwh": None, "cost_usd": None}
+        )
+        group["end_date"] = row["date"]
+        group["days"] += 1
+        if usage_delta is not None:
+            group["usage_kwh"] = (group["usage_kwh"] or 0) + usage_delta
+        if cost_delta is not None:
+            group["cost_usd"] = (group["cost_usd"] or 0) + cost_delta
+
+    result = sorted(groups.values(), key=lambda g: g["date"])
+    usage_total = cost_total = None
+    for group in result:
+        if mode == "cumulative":
+            if group["usage_kwh"] is not None:
+                usage_total = (usage_total or 0) + group["usage_kwh"]
+            if group["cost_usd"] is not None:
+                cost_total = (cost_total or 0) + group["cost_usd"]
+            group["usage_kwh"], group["cost_usd"] = usage_total, cost_total
+        group["usage_kwh"] = energy_history._round(group["usage_kwh"])
+        group["cost_usd"] = energy_history._round(group["cost_usd"])
+    return result
+
+
+def _same(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> bool:
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        for key in ("date", "end_date", "days"):
+            if x[key] != y[key]:
+                return False
+        for key in ("usage_kwh", "cost_usd"):
+            if (x[key] is None) != (y[key] is None) or (x[key] is not None and abs(x[key] - y[key]) > 1e-3):
+                return False
+    return True
+
+
+def _time(fn, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        rows = populate(args.years)
+        print(f"{rows} daily snapshots ({args.years} years)\n")
+        print(f"{'mode':<11} {'group_by':<12} {'sql ms':>9} {'python ms':>10} {'speedup':>8}  match")
+        for mode in energy_history.HISTORY_MODES:
+            for group_by in energy_history.HISTORY_GROUPS:
+                sql = _time(lambda: energy_history.get_derived_history(mode=mode, group_by=group_by), args.repeat)
+                py = _time(lambda: python_derived(mode, group_by), args.repeat)
+                match = _same(
+                    energy_history.get_derived_history(mode=mode, group_by=group_by),
+                    python_derived(mode, group_by),
+                )
+                sql_ms, py_ms = statistics.median(sql), statistics.median(py)
+                print(f"{mode:<11} {group_by:<12} {sql_ms:9.2f} {py_ms:10.2f} {py_ms / sql_ms:7.1f}x  {match}")
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
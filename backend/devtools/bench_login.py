@@ -0,0 +1,133 @@
+"""
+Benchmark: login latency (p50/p99) while dashboard clients keep polling authenticated endpoints, with password
+hashing offloaded to the "auth" pool vs. run inline on the event loop (the old behaviour).
+
+Run from backend/:
+    python -m devtools.bench_login [--logins 200] [--concurrency 8] [--pollers 20] [--rounds 29000]
+
+Drives the app in-process through httpx's ASGI transport against a temporary database. Dashboard load is
+/auth/me plus /homeassistant/energy-history, which need no Home Assistant connection.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from core.config import settings
+
+
+def _pct(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+
+async def _run(app, logins: int, concurrency: int, pollers: int, users: List[str]) -> dict:
+    login_times: List[float] = []
+    poll_times: List[float] = []
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        api = settings.API_V1_STR
+        resp = await client.post(f"{api}/auth/login", json={"email": users[0], "password": "bench-password"})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        async def poller() -> None:
+            paths = (f"{api}/auth/me", f"{api}/homeassistant/energy-history")
+            i = 0
+            while not done.is_set():
+                start = time.perf_counter()
+                r = await client.get(paths[i % 2], headers=headers)
+                poll_times.append(time.perf_counter() - start)
+                r.raise_for_status()
+                i += 1
+                await asyncio.sleep(0.01)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(logins):
+            queue.put_nowait(users[i % len(users)])
+
+        async def login_worker() -> None:
+            while not queue.empty():
+                email = queue.get_nowait()
+                start = time.perf_counter()
+                r = await client.post(f"{api}/auth/login", json={"email": email, "password": "bench-password"})
+                login_times.append(time.perf_counter() - start)
+                r.raise_for_status()
+
+        poll_tasks = [asyncio.create_task(poller()) for _ in range(pollers)]
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*poll_tasks)
+    return {
+        "logins_per_s": logins / elapsed,
+        "login_p50": _pct(login_times, 0.5),
+        "login_p99": _pct(login_times, 0.99),
+        "poll_p50": _pct(poll_times, 0.5),
+        "poll_p99": _pct(poll_times, 0.99),
+        "polls": len(poll_times),
+    }
+
+
+async def _inline_verify_and_update(plain: str, hashed: str):
+    from api.v1 import auth_utils
+    return auth_utils.verify_and_update(plain, hashed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=None, help="override AUTH_PBKDF2_ROUNDS")
+    args = parser.parse_args()
+    if args.rounds:
+        settings.AUTH_PBKDF2_ROUNDS = args.rounds
+
+    from core import db
+    from core import executors
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        # Import after settings are final: auth_utils builds its CryptContext from AUTH_PBKDF2_ROUNDS at import
+        from api.v1 import auth
+        from api.v1.auth_store import create_user
+        from main import app
+
+        users = [f"bench{i}@example.com" for i in range(args.users)]
+        for email in users:
+            create_user(email, "bench-password", must_change_password=False)
+        print(
+            f"{args.logins} logins x{args.concurrency}, {args.pollers} dashboard pollers, "
+            f"{settings.AUTH_PBKDF2_ROUNDS} PBKDF2 rounds, {settings.EXECUTOR_AUTH_WORKERS} auth workers\n"
+        )
+        print(f"{'hashing':<10} {'logins/s':>9} {'login p50':>10} {'login p99':>10} {'poll p50':>9} {'poll p99':>9}")
+        offloaded = auth.verify_and_update_async
+        for label, verify in (("inline", _inline_verify_and_update), ("offloaded", offloaded)):
+            auth.verify_and_update_async = verify
+            r = asyncio.run(_run(app, args.logins, args.concurrency, args.pollers, users))
+            print(
+                f"{label:<10} {r['logins_per_s']:9.1f} {r['login_p50']:8.1f}ms {r['login_p99']:8.1f}ms "
+                f"{r['poll_p50']:7.1f}ms {r['poll_p99']:7.1f}ms"
+            )
+        auth.verify_and_update_async = offloaded
+        auth_pool = executors.get_executor_stats().get("auth", {})
+        verify = auth_pool.get("operations", {}).get("auth.verify", {}).get("latency", {})
+        print(
+            f"\nauth pool: {auth_pool.get('rejected', 0)} rejected, "
+            f"verify p50<={verify.get('p50_ms')}ms p99<={verify.get('p99_ms')}ms"
+        )
+        executors.shutdown_executors()
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
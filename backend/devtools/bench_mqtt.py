@@ -0,0 +1,174 @@
+"""
+Benchmark: MQTT ingestion throughput at a target message rate from an in-process fake publisher.
+
+Run from backend/:
+    python -m devtools.bench_mqtt [--rate 10000] [--seconds 10] [--topics 200] [--flush 1.0]
+    python -m devtools.bench_mqtt --routes 500     # topic routing: compiled trie vs. testing every pattern
+
+A thread stands in for paho's network thread and calls MQTTService.on_message with broker-shaped messages at the
+target rate (numeric and JSON payloads, spread over --topics topics). Uses a temporary database and a fake HA
+snapshot so flushes exercise both the energy_samples batch write and the state index. Reports achieved rate,
+drops, coalescing, rows written, flush latency and event loop lag (how late a 10ms sleep wakes up).
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+
+from core import db
+from core.config import settings
+from services import homeassistant as ha
+from services.mqtt import MQTTService
+from services.mqtt_routes import RouteTable
+
+
+def _publisher(service: MQTTService, rate: int, seconds: float, topics: List[str], cost: List[float]) -> None:
+    """Publish in 1ms slices so the rate stays smooth; records CPU time spent inside on_message."""
+    rng = random.Random(7)
+    per_slice = rate / 1000
+    start = time.perf_counter()
+    sent = 0.0
+    busy = 0.0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            break
+        due = int(elapsed * rate) - int(sent)
+        for _ in range(max(due, 0)):
+            topic = rng.choice(topics)
+            if rng.random() < 0.5:
+                payload = f"{rng.uniform(0, 5000):.2f}".encode()
+            else:
+                payload = f'{{"value": {rng.uniform(0, 100):.1f}, "battery": 97}}'.encode()
+            t0 = time.perf_counter()
+            service.on_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+            busy += time.perf_counter() - t0
+            sent += 1
+        time.sleep(max(0.0, (sent + per_slice) / rate - (time.perf_counter() - start)))
+    cost.extend([sent, busy])
+
+
+def _linear_match(patterns: List[str], topic: str) -> str | None:
+    """What per-message matching looks like without the trie: split and compare against every pattern."""
+    levels = topic.split("/")
+    for pattern in patterns:
+        parts = pattern.split("/")
+        for i, part in enumerate(parts):
+            if part == "#":
+                return pattern
+            if i >= len(levels) or (part != "+" and part != levels[i]):
+                break
+        else:
+            if len(parts) == len(levels):
+                return pattern
+    return None
+
+
+def _bench_routes(count: int) -> None:
+    rng = random.Random(3)
+    specs = []
+    for i in range(count):
+        shape = i % 3
+        if shape == 0:
+            specs.append({"topic": f"home/room{i}/+/temperature", "unit": "°C"})
+        elif shape == 1:
+            specs.append({"topic": f"home/meter{i}/#", "json_path": "power.total", "scale": 0.001})
+        else:
+            specs.append({"topic": f"home/device{i}/state"})
+    table = RouteTable.from_specs(specs)
+    patterns = [spec["topic"] for spec in specs]
+    topics = []
+    for _ in range(20_000):
+        i = rng.randrange(count)
+        topics.append(patterns[i].replace("+", f"s{rng.randrange(5)}").replace("#", "phase/a"))
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for topic in topics:
+            fn(topic)
+        return (time.perf_counter() - start) / len(topics) * 1e6
+
+    linear = timed(lambda t: _linear_match(patterns, t))
+    trie = timed(lambda t: table._walk(table._root, t.split("/"), 0, []))
+    for topic in topics:
+        table.match(topic)
+    cached = timed(table.match)
+    print(f"{count} routes, {len(set(topics))} distinct topics")
+    print(f"  linear scan   {linear:8.2f} us/lookup")
+    print(f"  trie          {trie:8.2f} us/lookup")
+    print(f"  trie + cache  {cached:8.2f} us/lookup")
+
+
+async def _run(args: argparse.Namespace) -> None:
+    ha.set_states_snapshot([{"entity_id": "sun.sun", "state": "above_horizon", "attributes": {}}])
+    service = MQTTService()
+    service.start_consumer()
+    topics = [f"{settings.MQTT_TOPIC_PREFIX}room{i % 40}/sensor{i}" for i in range(args.topics)]
+
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def probe() -> None:
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - t0 - 0.01)
+
+    probe_task = asyncio.create_task(probe())
+    cost: List[float] = []
+    thread = threading.Thread(target=_publisher, args=(service, args.rate, args.seconds, topics, cost))
+    started = time.perf_counter()
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    elapsed = time.perf_counter() - started
+    await service.stop()
+    done.set()
+    await probe_task
+
+    sent, busy = cost
+    stats = service.status()
+    lags.sort()
+    with db.reader() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM energy_samples").fetchone()[0]
+    flush = stats["flush_latency"]
+    print(f"sent {int(sent)} msgs in {elapsed:.2f}s = {sent / elapsed:,.0f} msg/s over {args.topics} topics")
+    print(f"  on_message cost   {busy / sent * 1e6:.2f} us/msg on the publisher thread")
+    print(f"  received/dropped  {stats['received']} / {stats['dropped']}  (queue {settings.MQTT_QUEUE_SIZE})")
+    print(f"  coalesced         {stats['coalesced']} ({stats['coalesced'] / max(sent, 1):.1%})")
+    print(f"  flushes           {stats['flushes']}, samples written {stats['samples_written']}, rows in db {rows}")
+    print(f"  flush latency     p50<={flush['p50_ms']}ms p99<={flush['p99_ms']}ms max {flush['max_ms']}ms")
+    print(f"  loop lag          p50 {lags[len(lags) // 2] * 1000:.2f}ms p99 {lags[int(len(lags) * 0.99)] * 1000:.2f}ms")
+    print(f"  state index       {sum(1 for e in ha.get_cached_index() if e.startswith('sensor.mqtt_'))} mqtt entities")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--flush", type=float, default=None, help="override MQTT_FLUSH_INTERVAL_SECONDS")
+    parser.add_argument("--queue", type=int, default=None, help="override MQTT_QUEUE_SIZE")
+    parser.add_argument("--routes", type=int, default=0, help="benchmark topic routing with this many routes")
+    args = parser.parse_args()
+    if args.routes:
+        _bench_routes(args.routes)
+        return
+    if args.flush is not None:
+        settings.MQTT_FLUSH_INTERVAL_SECONDS = args.flush
+    if args.queue is not None:
+        settings.MQTT_QUEUE_SIZE = args.queue
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        asyncio.run(_run(args))
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
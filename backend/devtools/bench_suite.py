@@ -0,0 +1,391 @@
+"""
+Benchmark suite: throughput and p50/p95/p99 latency of the main API endpoints, end to end, saved as JSON.
+
+Run from backend/:
+    python -m devtools.bench_suite [--entities 100,1000,5000] [--latency-ms 20 --jitter-ms 10] [--ha rest]
+                                   [--requests 200] [--concurrency 10] [--years 10] [--sample-days 30]
+                                   [--output bench_results/<commit>.json] [--compare OLD.json]
+    python -m devtools.bench_suite --compare OLD.json NEW.json    # diff two saved runs, no benchmark
+
+Starts the app in-process (startup/shutdown hooks included) through httpx's ASGI transport, against a fake
+Home Assistant (devtools/fake_homeassistant.py) serving --entities synthetic entities over REST, or over the
+WebSocket mirror with --ha websocket, with the given response latency and jitter. Each entity count is a
+separate round; energy history runs over a temporary database with --years of daily snapshots plus
+--sample-days of minute samples per series (rolled up), and /house-image over generated JPEGs (needs Pillow
+for the resized WebP variant).
+
+Results are keyed "<endpoint>" or "<endpoint>@<entities>" and written with the git commit and the run
+parameters. --compare prints per-endpoint changes against an earlier file and exits 1 when p95 latency or
+throughput regressed by more than --threshold percent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from core.config import settings
+from devtools.fake_homeassistant import FakeHomeAssistant, synthetic_states
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+FORMAT_VERSION = 1
+_REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    # request number -> (method, path under API_V1_STR, query params, JSON body)
+    request: Callable[[int], Tuple[str, str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]
+    requests: Optional[int] = None  # default --requests
+    authenticated: bool = True
+
+
+def _pct(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+
+def _git_info() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=_REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {
+            "commit": git("rev-parse", "HEAD"),
+            "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        }
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "subject": None, "dirty": None}
+
+
+# --- Synthetic data -----------------------------------------------------------------------------------------------
+
+def _populate_samples(days: int) -> int:
+    """One sample per minute per series kind for the last days days, then roll them up. Returns raw rows."""
+    from core import db
+    from services import energy_rollups, energy_samples
+
+    rng = random.Random(11)
+    end = int(time.time()) // 60 * 60
+    start = end - days * 86400
+    total = 0
+    with db.writer() as conn:
+        for kind in energy_samples.SAMPLED_TILES.values():
+            series_id = energy_samples.series_id(conn, f"sensor.bench_{kind}", kind)
+            value = 50.0
+            rows = []
+            for ts in range(start, end, 60):
+                value = min(max(value + rng.uniform(-2, 2), 0.0), 100.0)
+                rows.append((series_id, ts, round(value, 3)))
+            conn.executemany("INSERT OR REPLACE INTO energy_samples (series_id, ts, value) VALUES (?, ?, ?)", rows)
+            total += len(rows)
+    energy_rollups.run_rollups(now=end)
+    return total
+
+
+def _write_house_images(media_dir: str, count: int = 5) -> int:
+    """house_YYYYMMDD.jpg files like the HA camera snapshots (random bytes when Pillow is missing)."""
+    os.makedirs(media_dir, exist_ok=True)
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    for i in range(count):
+        path = os.path.join(media_dir, f"house_{(date.today() - timedelta(days=i)).strftime('%Y%m%d')}.jpg")
+        if Image is not None:
+            image = Image.linear_gradient("L").resize((2560, 1920)).convert("RGB")
+            image.save(path, "JPEG", quality=90)
+        else:
+            with open(path, "wb") as f:
+                f.write(random.randbytes(1_500_000))
+    return count
+
+
+# --- Measurement --------------------------------------------------------------------------------------------------
+
+async def _measure(client: httpx.AsyncClient, scenario: Scenario, headers: Dict[str, str], requests: int,
+                   concurrency: int, warmup: int, fake: FakeHomeAssistant) -> Dict[str, Any]:
+    api = settings.API_V1_STR
+
+    async def send(i: int) -> httpx.Response:
+        method, path, params, body = scenario.request(i)
+        return await client.request(
+            method, f"{api}{path}", params=params, json=body, headers=headers if scenario.authenticated else None
+        )
+
+    for i in range(warmup):
+        await send(i)
+    latencies: List[float] = []
+    sizes: List[int] = []
+    errors: Dict[str, int] = {}
+    next_index = 0
+    upstream_before = fake.rest_requests
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            resp = await send(i)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(resp.content))
+            if resp.status_code >= 400:
+                errors[str(resp.status_code)] = errors.get(str(resp.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(_pct(latencies, 0.50), 2),
+        "p95_ms": round(_pct(latencies, 0.95), 2),
+        "p99_ms": round(_pct(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "response_bytes": round(sum(sizes) / len(sizes)),
+        "upstream_requests": fake.rest_requests - upstream_before,
+    }
+
+
+def _ha_scenarios(entity_ids: List[str]) -> List[Scenario]:
+    rng = random.Random(5)
+    return [
+        Scenario("dashboard", lambda i: ("GET", "/homeassistant/dashboard", None, None)),
+        Scenario("entities", lambda i: ("GET", "/homeassistant/entities", None, None)),
+        Scenario("entity", lambda i: ("GET", f"/homeassistant/entities/{rng.choice(entity_ids)}", None, None)),
+    ]
+
+
+def _static_scenarios(args: argparse.Namespace) -> List[Scenario]:
+    week_ago = (date.today() - timedelta(days=7)).isoformat()
+    today = date.today().isoformat()
+    login = {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+    return [
+        Scenario("energy_history", lambda i: ("GET", "/homeassistant/energy-history", None, None)),
+        Scenario("energy_history_monthly", lambda i: (
+            "GET", "/homeassistant/energy-history", {"mode": "delta", "group_by": "month"}, None,
+        )),
+        Scenario("energy_series_week", lambda i: (
+            "GET", "/homeassistant/energy-history", {"series": "power", "from_date": week_ago, "to_date": today}, None,
+        )),
+        Scenario("house_image", lambda i: ("GET", "/homeassistant/house-image", None, None)),
+        Scenario("house_image_dashboard_webp", lambda i: (
+            "GET", "/homeassistant/house-image", {"size": "dashboard", "format": "webp"}, None,
+        )),
+        Scenario("login", lambda i: ("POST", "/auth/login", None, login),
+                 requests=args.login_requests, authenticated=False),
+    ]
+
+
+async def _wait_for_entities(count: int, timeout: float = 30.0) -> None:
+    """WebSocket mode: wait until the mirror has resynced the new entity set."""
+    from services import homeassistant as ha
+
+    deadline = time.monotonic() + timeout
+    while len(ha.get_cached_index()) != count:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"WebSocket mirror did not sync {count} entities within {timeout}s")
+        await asyncio.sleep(0.05)
+
+
+async def _run(args: argparse.Namespace, counts: List[int]) -> Dict[str, Dict[str, Any]]:
+    from main import app
+    from services import homeassistant as ha
+
+    fake = FakeHomeAssistant(token="bench-token", latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    await fake.start()
+    settings.HOME_ASSISTANT_URL = fake.url
+    settings.HOME_ASSISTANT_TOKEN = fake.token
+    settings.HOME_ASSISTANT_WEBSOCKET = args.ha == "websocket"
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def report(key: str, result: Dict[str, Any]) -> None:
+        results[key] = result
+        errors = f"  errors {result['errors']}" if result["errors"] else ""
+        print(
+            f"  {key:<32} {result['throughput_rps']:9.1f}/s  p50 {result['p50_ms']:8.2f}  "
+            f"p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms  "
+            f"{result['response_bytes'] / 1024:8.1f} KiB  upstream {result['upstream_requests']}{errors}"
+        )
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                api = settings.API_V1_STR
+                resp = await client.post(f"{api}/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+                resp.raise_for_status()
+                headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+                for n in counts:
+                    states = synthetic_states(n)
+                    fake.replace_states(states)
+                    ha.clear_states_cache()
+                    if args.ha == "websocket":
+                        await fake.drop_connections()
+                        await _wait_for_entities(len(states))
+                    print(f"{n} entities ({args.ha}, latency {args.latency_ms}+/-{args.jitter_ms} ms)")
+                    entity_ids = [s["entity_id"] for s in states]
+                    for scenario in _ha_scenarios(entity_ids):
+                        result = await _measure(
+                            client, scenario, headers, scenario.requests or args.requests, args.concurrency,
+                            args.warmup, fake,
+                        )
+                        report(f"{scenario.name}@{n}", result)
+
+                print("database, media share and auth")
+                for scenario in _static_scenarios(args):
+                    result = await _measure(
+                        client, scenario, headers, scenario.requests or args.requests, args.concurrency,
+                        args.warmup, fake,
+                    )
+                    report(scenario.name, result)
+    finally:
+        await fake.stop()
+    return results
+
+
+# --- Comparison ---------------------------------------------------------------------------------------------------
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """Print per-endpoint changes; returns the keys whose p95 or throughput regressed beyond threshold percent."""
+    print(
+        f"\nbaseline {(old.get('git') or {}).get('commit', '?')[:12]} -> "
+        f"current {(new.get('git') or {}).get('commit', '?')[:12]}  (regression threshold {threshold:g}%)"
+    )
+    if old.get("config") != new.get("config"):
+        print("  note: the runs used different parameters (see \"config\" in each file)")
+    print(f"  {'endpoint':<32} {'rps':>17}  {'p50 ms':>17}  {'p95 ms':>17}  {'p99 ms':>17}")
+    regressions = []
+    for key, cur in new["results"].items():
+        base = old["results"].get(key)
+        if base is None:
+            print(f"  {key:<32} (new)")
+            continue
+        cells = []
+        for field in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{cur[field]:>9.1f} {_change(base[field], cur[field]):+6.1f}%")
+        regressed = (
+            _change(base["p95_ms"], cur["p95_ms"]) > threshold
+            or _change(base["throughput_rps"], cur["throughput_rps"]) < -threshold
+        )
+        if regressed:
+            regressions.append(key)
+        print(f"  {key:<32} " + "  ".join(cells) + ("  REGRESSION" if regressed else ""))
+    for key in old["results"].keys() - new["results"].keys():
+        print(f"  {key:<32} (missing from current run)")
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format_version") != FORMAT_VERSION:
+        raise SystemExit(f"{path}: unsupported results format {data.get('format_version')!r}")
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entities", default="100,1000,5000", help="comma-separated entity counts (100-20000)")
+    parser.add_argument("--ha", choices=("rest", "websocket"), default="rest", help="how the app reads HA states")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake HA response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="uniform +/- variation of that latency")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="override HA_STATES_CACHE_TTL")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per endpoint")
+    parser.add_argument("--years", type=int, default=10, help="years of daily energy snapshots")
+    parser.add_argument("--sample-days", type=int, default=30, help="days of minute samples per series")
+    parser.add_argument("--output", default=None, help="results file (default bench_results/<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="FILE", help="baseline results; with two files only diff")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        regressions = compare(_load(args.compare[0]), _load(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+    baseline = _load(args.compare[0]) if args.compare else None
+    counts = [int(n) for n in args.entities.split(",") if n.strip()]
+    if any(not 1 <= n <= 20_000 for n in counts):
+        parser.error("--entities counts must be between 1 and 20000")
+    if args.cache_ttl is not None:
+        settings.HA_STATES_CACHE_TTL = args.cache_ttl
+
+    from core import db
+    from api.v1.auth_store import create_user
+    from devtools.bench_energy_history import populate
+
+    git = _git_info()
+    with tempfile.TemporaryDirectory() as tmp:
+        db._DB_PATH = os.path.join(tmp, "bench.db")
+        settings.HA_MEDIA_PATH = os.path.join(tmp, "media")
+        settings.HOUSE_IMAGE_CACHE_DIR = os.path.join(tmp, "image_cache")
+        # No background sampling or seeding during the run; only the house image scan job runs
+        settings.ENERGY_SAMPLE_INTERVAL_SECONDS = 0
+        settings.MQTT_ENABLED = False
+        settings.E2E_SEED_USER = False
+        db.init_db()
+        daily = populate(args.years)
+        samples = _populate_samples(args.sample_days)
+        images = _write_house_images(settings.HA_MEDIA_PATH)
+        create_user(BENCH_EMAIL, BENCH_PASSWORD, must_change_password=False)
+        print(f"dataset: {daily} daily snapshots, {samples} minute samples, {images} house images\n")
+        results = asyncio.run(_run(args, counts))
+
+    run = {
+        "format_version": FORMAT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "entities": counts,
+            "ha": args.ha,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "cache_ttl": settings.HA_STATES_CACHE_TTL,
+            "requests": args.requests,
+            "login_requests": args.login_requests,
+            "concurrency": args.concurrency,
+            "years": args.years,
+            "sample_days": args.sample_days,
+            "pbkdf2_rounds": settings.AUTH_PBKDF2_ROUNDS,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("bench_results", f"{(git['commit'] or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nresults written to {output}")
+    if baseline is not None:
+        sys.exit(1 if compare(baseline, run, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Fake Home Assistant server for local testing of services/homeassistant.py and services/ha_websocket.py.
+
+Speaks the subset of HA's /api/websocket protocol the mirror uses (auth, subscribe_events(state_changed),
+get_states) and the REST endpoints the client uses (GET /api/, /api/states, /api/states/<entity_id> and
+/api/history/period from history recorded with set_history; bearer token required). latency/jitter (seconds)
+delay every REST response and get_states result by latency +/- jitter, uniformly, to stand in for a slow HA
+host. Tests can drive it in-process:
+
+    server = FakeHomeAssistant(token="test-token", latency=0.05, jitter=0.02)
+    await server.start()            # then set HOME_ASSISTANT_URL=server.url
+    await server.set_state("sensor.power", "1200", {"unit_of_measurement": "W"})
+    server.set_history("sensor.power", [(ts, "1200"), (ts + 60, "900")])  # recorder contents (unix seconds)
+    await server.drop_connections() # exercise reconnect + resync
+
+Or run standalone with synthetic entities that change every second:
+
+    python -m devtools.fake_homeassistant --port 8123 --token dev --entities 500 [--latency-ms 50 --jitter-ms 20]
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import random
+from datetime import datetime, timezone
+from typing import Any
+from urllib.parse import parse_qs, unquote
+
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.datastructures import Headers
+from websockets.exceptions import ConnectionClosed
+from websockets.http11 import Request, Response
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def make_state(entity_id: str, state: str, attributes: dict[str, Any] | None = None) -> dict[str, Any]:
+    now = _now()
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes or {},
+        "last_changed": now,
+        "last_updated": now,
+        "context": {"id": f"{random.getrandbits(64):016x}", "parent_id": None, "user_id": None},
+    }
+
+
+def synthetic_states(count: int) -> list[dict[str, Any]]:
+    """Build count sensor entities plus the weather/sun entities the dashboard expects."""
+    states = [
+        make_state("sun.sun", "above_horizon", {"friendly_name": "Sun"}),
+        make_state("weather.home", "sunny", {"friendly_name": "Home", "temperature": 72}),
+    ]
+    for i in range(max(count - len(states), 0)):
+        states.append(make_state(
+            f"sensor.synthetic_{i}",
+            f"{random.uniform(0, 5000):.1f}",
+            {"friendly_name": f"Synthetic {i}", "unit_of_measurement": "W", "device_class": "power"},
+        ))
+    return states
+
+
+class FakeHomeAssistant:
+    def __init__(self, token: str = "test-token", host: str = "127.0.0.1", port: int = 0,
+                 states: list[dict[str, Any]] | None = None, latency: float = 0.0, jitter: float = 0.0):
+        self.token = token
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.states: dict[str, dict[str, Any]] = {s["entity_id"]: s for s in (states or [])}
+        self.rest_requests = 0
+        # entity_id -> [(unix seconds, state)] in time order, served by /api/history/period
+        self.history: dict[str, list[tuple[float, str]]] = {}
+        self._server = None
+        # Serialized /api/states body, rebuilt after a change (20k entities take tens of ms to encode)
+        self._states_body: bytes | None = None
+        # connection -> subscription id for state_changed
+        self._subscribers: dict[ServerConnection, int] = {}
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as HOME_ASSISTANT_URL."""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await serve(
+            self._handler, self.host, self.port, max_size=None, process_request=self._process_request
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake Home Assistant listening on {self.url}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def drop_connections(self) -> None:
+        """Close every client connection (simulates an HA restart) while keeping the server up."""
+        for ws in list(self._subscribers):
+            await ws.close()
+        self._subscribers.clear()
+
+    def replace_states(self, states: list[dict[str, Any]]) -> None:
+        """Swap the whole entity set without events (clients see it on their next REST poll or resync)."""
+        self.states = {s["entity_id"]: s for s in states}
+        self._states_body = None
+
+    def set_history(self, entity_id: str, points: list[tuple[float, str]]) -> None:
+        """Replace an entity's recorder history with (unix seconds, state) points."""
+        self.history[entity_id] = sorted(points)
+
+    def _history_body(self, path: str, query: str) -> bytes:
+        """/api/history/period/<start>?end_time=&filter_entity_id=: per entity, the state in effect at start (as
+        of start) then its changes before end; minimal_response/no_attributes shape the states like HA does."""
+        params = parse_qs(query, keep_blank_values=True)
+        start = datetime.fromisoformat(unquote(path[len("/api/history/period/"):])).timestamp()
+        end = datetime.fromisoformat(params["end_time"][0]).timestamp() if "end_time" in params else start + 86400
+        entity_ids = params.get("filter_entity_id", [""])[0].split(",")
+        minimal, no_attributes = "minimal_response" in params, "no_attributes" in params
+        result = []
+        for entity_id in entity_ids:
+            points = self.history.get(entity_id, [])
+            i = bisect.bisect_right(points, (start, chr(0x10FFFF)))
+            window = ([(start, points[i - 1][1])] if i else []) + [p for p in points[i:] if p[0] < end]
+            if not window:
+                continue
+            attributes = {} if no_attributes else (self.states.get(entity_id) or {}).get("attributes", {})
+            states = []
+            for n, (ts, state) in enumerate(window):
+                changed = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                if minimal and n:
+                    states.append({"state": state, "last_changed": changed})
+                else:
+                    states.append({"entity_id": entity_id, "state": state, "attributes": attributes,
+                                   "last_changed": changed, "last_updated": changed})
+            result.append(states)
+        return json.dumps(result).encode()
+
+    async def set_state(self, entity_id: str, state: str, attributes: dict[str, Any] | None = None) -> None:
+        old = self.states.get(entity_id)
+        new = make_state(entity_id, state, attributes if attributes is not None else (old or {}).get("attributes"))
+        self.states[entity_id] = new
+        self._states_body = None
+        await self._broadcast(entity_id, old, new)
+
+    async def remove_state(self, entity_id: str) -> None:
+        old = self.states.pop(entity_id, None)
+        if old is not None:
+            self._states_body = None
+            await self._broadcast(entity_id, old, None)
+
+    async def _delay(self) -> None:
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _json_response(status: int, reason: str, body: bytes) -> Response:
+        headers = Headers([
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(body))),
+            ("Connection", "close"),
+        ])
+        return Response(status, reason, headers, body)
+
+    async def _process_request(self, connection: ServerConnection, request: Request) -> Response | None:
+        """Answer REST calls before the WebSocket handshake; /api/websocket continues to _handler."""
+        path, _, query = request.path.partition("?")
+        if path == "/api/websocket":
+            return None
+        self.rest_requests += 1
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            return self._json_response(401, "Unauthorized", b'{"message": "401: Unauthorized"}')
+        await self._delay()
+        if path == "/api/":
+            return self._json_response(200, "OK", b'{"message": "API running."}')
+        if path == "/api/states":
+            if self._states_body is None:
+                self._states_body = json.dumps(list(self.states.values())).encode()
+            return self._json_response(200, "OK", self._states_body)
+        if path.startswith("/api/states/"):
+            state = self.states.get(path[len("/api/states/"):])
+            if state is not None:
+                return self._json_response(200, "OK", json.dumps(state).encode())
+            return self._json_response(404, "Not Found", b'{"message": "Entity not found."}')
+        if path.startswith("/api/history/period/"):
+            try:
+                return self._json_response(200, "OK", self._history_body(path, query))
+            except (KeyError, ValueError):
+                return self._json_response(400, "Bad Request", b'{"message": "Invalid datetime"}')
+        return self._json_response(404, "Not Found", b'{"message": "Not found."}')
+
+    async def _broadcast(self, entity_id: str, old: dict | None, new: dict | None) -> None:
+        for ws, sub_id in list(self._subscribers.items()):
+            event = {
+                "id": sub_id,
+                "type": "event",
+                "event": {
+                    "event_type": "state_changed",
+                    "data": {"entity_id": entity_id, "old_state": old, "new_state": new},
+                    "origin": "LOCAL",
+                    "time_fired": _now(),
+                },
+            }
+            try:
+                await ws.send(json.dumps(event))
+            except Exception:
+                self._subscribers.pop(ws, None)
+
+    async def _handler(self, ws: ServerConnection) -> None:
+        if ws.request is not None and ws.request.path != "/api/websocket":
+            await ws.close(code=1008, reason="not found")
+            return
+        await ws.send(json.dumps({"type": "auth_required", "ha_version": "fake"}))
+        auth = json.loads(await ws.recv())
+        if auth.get("type") != "auth" or auth.get("access_token") != self.token:
+            await ws.send(json.dumps({"type": "auth_invalid", "message": "Invalid access token"}))
+            await ws.close()
+            return
+        await ws.send(json.dumps({"type": "auth_ok", "ha_version": "fake"}))
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                msg_id = msg.get("id")
+                if msg.get("type") == "subscribe_events" and msg.get("event_type") == "state_changed":
+                    self._subscribers[ws] = msg_id
+                    await ws.send(json.dumps({"id": msg_id, "type": "result", "success": True, "result": None}))
+                elif msg.get("type") == "get_states":
+                    await self._delay()
+                    await ws.send(json.dumps({
+                        "id": msg_id, "type": "result", "success": True, "result": list(self.states.values()),
+                    }))
+                else:
+                    await ws.send(json.dumps({
+                        "id": msg_id, "type": "result", "success": False,
+                        "error": {"code": "unknown_command", "message": "Unknown command."},
+                    }))
+        except ConnectionClosed:
+            pass
+        finally:
+            self._subscribers.pop(ws, None)
+
+
+async def _run_standalone(args: argparse.Namespace) -> None:
+    server = FakeHomeAssistant(token=args.token, host=args.host, port=args.port,
+                               states=synthetic_states(args.entities),
+                               latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    await server.start()
+    print(f"Fake Home Assistant at {server.url} (token: {args.token}, {len(server.states)} entities)")
+    sensor_ids = [e for e in server.states if e.startswith("sensor.")]
+    try:
+        while True:
+            await asyncio.sleep(args.interval)
+            if sensor_ids:
+                await server.set_state(random.choice(sensor_ids), f"{random.uniform(0, 5000):.1f}")
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Home Assistant WebSocket/REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--token", default="dev")
+    parser.add_argument("--entities", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between random state changes")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to REST responses and get_states")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- variation of that delay")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone(parser.parse_args()))
@@ -1,12 +1,28 @@
-from fastapi import FastAPI
+import asyncio
+from datetime import datetime
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from apscheduler.events import EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from api.v1.api import api_router
-from api.v1.auth import _seed_dev_users
+from api.v1.auth import seed_dev_users_async
+from core.compression import CompressionMiddleware
 from core.config import settings
 from core import db
+from core import executors
+from core import metrics
+from core.lease import scheduler_lease
 from services import energy_history
+from services.energy_backfill import energy_backfill
+from services import energy_rollups
+from services import energy_samples
+from services import homeassistant as ha
+from services.ha_shared import shared_states
+from services.ha_websocket import ha_mirror
+from services import house_image_variants
+from services.mqtt import mqtt_service
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -20,11 +36,60 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Brotli/gzip for JSON and text responses (entity lists compress ~10x); images and SSE pass through
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.HTTP_COMPRESSION_MIN_SIZE,
+    gzip_level=settings.HTTP_GZIP_LEVEL,
+    brotli_quality=settings.HTTP_BROTLI_QUALITY,
+)
+
+# Per-route latency histograms for GET /metrics (outermost, so compression time is included)
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 # Global scheduler instance
 scheduler = AsyncIOScheduler()
+scheduler.add_listener(metrics.record_missed_job, EVENT_JOB_MISSED)
+_loop_lag_task: asyncio.Task | None = None
+# Jobs that must run once per deployment. With MULTI_WORKER they are added paused on every worker and resumed
+# only on the holder of the scheduler lease; the house image scan refreshes per-process state and runs everywhere.
+_LEADER_JOBS = ("daily_energy_snapshot", "energy_sample", "energy_rollups", "energy_sample_retention")
+
+
+async def _lead() -> None:
+    """Start the once-per-deployment work: leader-only jobs, HA polling/WebSocket mirror, MQTT ingestion."""
+    for job_id in _LEADER_JOBS:
+        if scheduler.get_job(job_id) is not None:
+            scheduler.resume_job(job_id)
+    if settings.MULTI_WORKER:
+        await shared_states.start_leader()
+    # Mirror HA states over WebSocket when HOME_ASSISTANT_WEBSOCKET=true (endpoints then skip REST polling)
+    ha_mirror.start()
+    # MQTT ingestion into energy_samples and the state index (MQTT_ENABLED=true)
+    if settings.MQTT_ENABLED:
+        mqtt_service.connect()
+
+
+async def _follow() -> None:
+    """Lost (or never held) the scheduler lease: stop leader work and read HA states from the leader."""
+    for job_id in _LEADER_JOBS:
+        if scheduler.get_job(job_id) is not None:
+            scheduler.pause_job(job_id)
+    await ha_mirror.stop()
+    if settings.MQTT_ENABLED:
+        await mqtt_service.stop()
+    await shared_states.start_follower()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.on_event("startup")
@@ -40,6 +105,20 @@ async def startup():
     except Exception as e:
         log.error(f"Failed to initialize database: {e}")
     
+    global _loop_lag_task
+    if settings.METRICS_ENABLED and settings.METRICS_LOOP_LAG_INTERVAL_SECONDS > 0:
+        _loop_lag_task = asyncio.create_task(
+            metrics.monitor_event_loop_lag(settings.METRICS_LOOP_LAG_INTERVAL_SECONDS), name="event-loop-lag"
+        )
+
+    # Open the shared Home Assistant HTTP client (pooled keep-alive connections)
+    await ha.start_client()
+    # Single worker: this process does everything. Multi-worker: start as a follower until the lease is ours.
+    if settings.MULTI_WORKER:
+        await shared_states.start_follower()
+    else:
+        await _lead()
+
     # Seed E2E and admin users when credentials are in env
     seed_on_startup = getattr(settings, "E2E_SEED_USER", False)
     has_e2e = (getattr(settings, "E2E_SEED_EMAIL", "") or "").strip() and getattr(settings, "E2E_SEED_PASSWORD", "")
@@ -48,7 +127,7 @@ async def startup():
     has_user2 = (getattr(settings, "USER2_SEED_EMAIL", "") or "").strip() and getattr(settings, "USER2_SEED_PASSWORD", "")
     has_user3 = (getattr(settings, "USER3_SEED_EMAIL", "") or "").strip() and getattr(settings, "USER3_SEED_PASSWORD", "")
     if seed_on_startup or has_e2e or has_admin or has_user1 or has_user2 or has_user3:
-        _seed_dev_users()
+        await seed_dev_users_async()
         log.info("Seeded users: E2E=%s, Admin=%s, User1=%s, User2=%s, User3=%s", 
                  "yes" if has_e2e else "no", 
                  "yes" if has_admin else "no",
@@ -56,22 +135,89 @@ async def startup():
                  "yes" if has_user2 else "no",
                  "yes" if has_user3 else "no")
     
+    # Leader-only jobs start paused in multi-worker mode (resumed in _lead())
+    leader_only = {"next_run_time": None} if settings.MULTI_WORKER else {}
+
     # Schedule daily energy snapshot at 11:59 PM
     scheduler.add_job(
-        energy_history.record_today_snapshot,
+        metrics.instrument_job("daily_energy_snapshot", energy_history.record_today_snapshot),
         trigger=CronTrigger(hour=23, minute=59),
         id="daily_energy_snapshot",
         name="Record daily energy usage and cost snapshot",
         replace_existing=True,
+        **leader_only,
+    )
+    # Minute-level power/solar/battery/grid samples
+    if settings.ENERGY_SAMPLE_INTERVAL_SECONDS > 0:
+        scheduler.add_job(
+            metrics.instrument_job("energy_sample", energy_samples.record_sample),
+            trigger=IntervalTrigger(seconds=settings.ENERGY_SAMPLE_INTERVAL_SECONDS),
+            id="energy_sample",
+            name="Record power/solar/battery/grid sample",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            **leader_only,
+        )
+    # Rollups and nightly retention of raw samples, whichever source (sampling, MQTT) writes them
+    if settings.ENERGY_SAMPLE_INTERVAL_SECONDS > 0 or settings.MQTT_ENABLED:
+        scheduler.add_job(
+            metrics.instrument_job("energy_rollups", energy_rollups.run_rollups),
+            trigger=IntervalTrigger(minutes=5),
+            id="energy_rollups",
+            name="Roll energy samples up into hourly/daily/monthly tiers",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            **leader_only,
+        )
+        scheduler.add_job(
+            metrics.instrument_job("energy_sample_retention", energy_samples.purge_old_samples),
+            trigger=CronTrigger(hour=3, minute=15),
+            id="energy_sample_retention",
+            name="Delete raw energy samples past retention",
+            replace_existing=True,
+            **leader_only,
+        )
+    # House image catalog: first scan right away, then poll the media share for changes
+    scheduler.add_job(
+        metrics.instrument_job("house_image_scan", house_image_variants.refresh_and_prerender),
+        trigger=IntervalTrigger(seconds=max(settings.HOUSE_IMAGE_SCAN_INTERVAL_SECONDS, 1)),
+        id="house_image_scan",
+        name="Rescan house images in HA media path",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(),
     )
     scheduler.start()
+    if settings.MULTI_WORKER:
+        scheduler_lease.start(_lead, _follow)
+        log.info(f"Multi-worker mode: worker {scheduler_lease.holder} competing for the scheduler lease")
     log.info("Scheduled daily energy snapshot job (23:59 daily)")
+    if settings.ENERGY_SAMPLE_INTERVAL_SECONDS > 0:
+        log.info(f"Scheduled energy sampling every {settings.ENERGY_SAMPLE_INTERVAL_SECONDS}s "
+                 f"(retention {settings.ENERGY_SAMPLE_RETENTION_DAYS} days)")
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    """Shutdown scheduler gracefully."""
+    """Shutdown scheduler gracefully, flush MQTT, close the shared Home Assistant client and the SQLite pool."""
     scheduler.shutdown()
+    if _loop_lag_task is not None:
+        _loop_lag_task.cancel()
+    if settings.MULTI_WORKER:
+        # Hand the lease over right away instead of letting it expire
+        await scheduler_lease.stop()
+        await shared_states.stop()
+    await energy_backfill.stop()
+    await ha_mirror.stop()
+    if settings.MQTT_ENABLED:
+        await mqtt_service.stop()
+    await ha.close_client()
+    executors.shutdown_executors()
+    house_image_variants.shutdown()
+    db.close_pool()
 
 
 @app.get("/")
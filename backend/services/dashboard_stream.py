@@ -0,0 +1,99 @@
+"""
+Dashboard push stream: fans snapshot changes from services/homeassistant.py out to SSE subscribers.
+
+Each subscriber holds a pending map of entity_id -> latest state. New changes overwrite older pending ones,
+so a slow client skips intermediate states instead of growing an unbounded queue.
+Without the WebSocket mirror, a single shared poller refreshes the states cache while anyone is subscribed,
+so upstream load does not grow with the number of open tabs.
+"""
+import asyncio
+import logging
+from typing import Any
+
+from core.config import settings
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+
+class StreamCapacityError(Exception):
+    """Raised when HA_STREAM_MAX_SUBSCRIBERS subscribers are already connected."""
+
+
+def _is_dashboard_entity(entity_id: str) -> bool:
+    return entity_id.split(".", 1)[0] in ha._DASHBOARD_DOMAINS
+
+
+class DashboardSubscriber:
+    def __init__(self):
+        self._pending: dict[str, dict[str, Any] | None] = {}
+        self._ready = asyncio.Event()
+        # Number of intermediate states overwritten before this client read them
+        self.dropped = 0
+
+    def push(self, changes: dict[str, dict[str, Any] | None]) -> None:
+        for entity_id, state in changes.items():
+            if entity_id in self._pending:
+                self.dropped += 1
+            self._pending[entity_id] = state
+        self._ready.set()
+
+    async def next_delta(self, timeout: float) -> dict[str, dict[str, Any] | None] | None:
+        """Wait up to timeout seconds for changes; returns them (coalesced) or None on timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        pending, self._pending = self._pending, {}
+        return pending
+
+
+class DashboardStreamBroker:
+    def __init__(self):
+        self._subscribers: set[DashboardSubscriber] = set()
+        self._poll_task: asyncio.Task | None = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> DashboardSubscriber:
+        if len(self._subscribers) >= settings.HA_STREAM_MAX_SUBSCRIBERS:
+            raise StreamCapacityError("Too many dashboard stream subscribers")
+        subscriber = DashboardSubscriber()
+        if not self._subscribers:
+            ha.add_change_listener(self._on_change)
+        self._subscribers.add(subscriber)
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll(), name="dashboard-stream-poller")
+        return subscriber
+
+    def unsubscribe(self, subscriber: DashboardSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            ha.remove_change_listener(self._on_change)
+            if self._poll_task is not None:
+                self._poll_task.cancel()
+                self._poll_task = None
+
+    def _on_change(self, changes: dict[str, dict[str, Any] | None]) -> None:
+        relevant = {k: v for k, v in changes.items() if _is_dashboard_entity(k)}
+        if not relevant:
+            return
+        for subscriber in self._subscribers:
+            subscriber.push(relevant)
+
+    async def _poll(self) -> None:
+        """Keep the states cache refreshing while subscribers exist (skipped while the WebSocket mirror is live)."""
+        while self._subscribers:
+            await asyncio.sleep(settings.HA_STREAM_POLL_INTERVAL)
+            if ha._live_mirror:
+                continue
+            try:
+                await ha.get_states()
+            except Exception as e:
+                logger.warning(f"Dashboard stream poll failed: {e}")
+
+
+dashboard_broker = DashboardStreamBroker()
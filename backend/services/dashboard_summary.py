@@ -0,0 +1,257 @@
+"""
+Dashboard summary: resolves which HA entity feeds each dashboard tile (weather, sun, power, solar, battery,
+grid, SMUD billing) once on the server and returns just the values the tiles display.
+
+Resolution uses an index of the dashboard entities by entity_id, friendly_name, device_class and unit, and the
+resolved tile -> entity_id mapping is cached until the set of entities (or the rules) changes. Only the values
+are read per request.
+
+Rules: each tile has an ordered list of rules; the first rule that matches any entity wins. Within a rule every
+condition must hold (or any, with "match": "any"). Conditions:
+    entity_id / friendly_name   exact match
+    entity_id_contains          entity_id contains any of the substrings (a list of lists means every group
+                                must match: [["battery", "powerwall"], ["power", "charge"]])
+    device_class / unit         attribute equals any of the values
+Override or add tiles with a JSON file of the same shape in HA_DASHBOARD_SUMMARY_RULES_FILE.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Any
+
+from core.config import settings
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the heuristics the Dashboard page used to run client-side
+DEFAULT_RULES: dict[str, list[dict[str, Any]]] = {
+    "weather": [{"entity_id_contains": ["weather"], "device_class": ["temperature"], "match": "any"}],
+    "outdoor_temperature": [{"entity_id": "sensor.blink_whole_house_temperature"}],
+    "sun": [{"entity_id_contains": ["sun"]}],
+    "power": [{"entity_id_contains": ["power", "consumption"], "unit": ["kW", "W"], "match": "any"}],
+    "solar": [
+        {"friendly_name": "Envoy 121544051333 Current power production"},
+        {"entity_id_contains": ["solar", "pv"]},
+    ],
+    "battery_level": [
+        {"entity_id_contains": ["battery", "powerwall"], "unit": ["%"]},
+        {"entity_id_contains": ["battery", "powerwall"], "device_class": ["battery"]},
+    ],
+    "battery_power": [
+        {"entity_id_contains": [["battery", "powerwall"], ["power", "charge", "discharge"]], "unit": ["kW", "W"]},
+    ],
+    "grid": [{"entity_id_contains": ["grid", "import", "export"]}],
+    "cost_to_date": [{"friendly_name": "SMUD Electric Current bill electric cost to date"}],
+    "forecasted_cost": [{"friendly_name": "SMUD Electric Current bill electric forecasted cost"}],
+    "usage_to_date": [{"friendly_name": "SMUD Electric Current bill electric usage to date"}],
+    "forecasted_usage": [{"friendly_name": "SMUD Electric Current bill electric forecasted usage"}],
+}
+
+# Cached {tile: entity_id or None}, valid while _resolved_key == (rules version, entity set version)
+_resolved: dict[str, str | None] = {}
+_resolved_key: tuple[int, int] | None = None
+_rules: dict[str, list[dict[str, Any]]] | None = None
+_rules_version = 0
+
+
+def _load_rules() -> dict[str, list[dict[str, Any]]]:
+    global _rules, _rules_version
+    if _rules is not None:
+        return _rules
+    rules = dict(DEFAULT_RULES)
+    path = (settings.HA_DASHBOARD_SUMMARY_RULES_FILE or "").strip()
+    if path:
+        try:
+            overrides = json.loads(Path(path).read_text(encoding="utf-8"))
+            rules.update(overrides)
+            logger.info(f"Loaded dashboard summary rules for {len(overrides)} tiles from {path}")
+        except Exception as e:
+            logger.error(f"Failed to load dashboard summary rules from {path}, using defaults: {e}")
+    _rules = rules
+    _rules_version += 1
+    return rules
+
+
+def reload_rules() -> None:
+    """Re-read HA_DASHBOARD_SUMMARY_RULES_FILE on next use (also drops the cached mapping)."""
+    global _rules
+    _rules = None
+
+
+class _EntityIndex:
+    def __init__(self, states: list[dict[str, Any]]):
+        self.ids: list[str] = []
+        self.by_id: dict[str, dict[str, Any]] = {}
+        self.by_friendly_name: dict[str, str] = {}
+        self.by_device_class: dict[str, list[str]] = {}
+        self.by_unit: dict[str, list[str]] = {}
+        for s in states:
+            entity_id = s.get("entity_id")
+            if not entity_id:
+                continue
+            attrs = s.get("attributes") or {}
+            self.ids.append(entity_id)
+            self.by_id[entity_id] = s
+            name = attrs.get("friendly_name")
+            if name is not None:
+                self.by_friendly_name.setdefault(name, entity_id)
+            if attrs.get("device_class") is not None:
+                self.by_device_class.setdefault(attrs["device_class"], []).append(entity_id)
+            if attrs.get("unit_of_measurement") is not None:
+                self.by_unit.setdefault(attrs["unit_of_measurement"], []).append(entity_id)
+        self.position = {entity_id: i for i, entity_id in enumerate(self.ids)}
+
+    def _matches_contains(self, entity_id: str, substrings: list) -> bool:
+        if substrings and isinstance(substrings[0], list):
+            return all(any(sub in entity_id for sub in group) for group in substrings)
+        return any(sub in entity_id for sub in substrings)
+
+    def _condition_sets(self, rule: dict[str, Any]) -> list[set[str] | None]:
+        """Candidate sets for the indexed conditions (None entries need a scan: entity_id_contains)."""
+        sets: list[set[str] | None] = []
+        if "entity_id" in rule:
+            sets.append({rule["entity_id"]} & self.by_id.keys())
+        if "friendly_name" in rule:
+            found = self.by_friendly_name.get(rule["friendly_name"])
+            sets.append({found} if found else set())
+        if "device_class" in rule:
+            sets.append({e for v in rule["device_class"] for e in self.by_device_class.get(v, [])})
+        if "unit" in rule:
+            sets.append({e for v in rule["unit"] for e in self.by_unit.get(v, [])})
+        if "entity_id_contains" in rule:
+            sets.append(None)
+        return sets
+
+    def resolve(self, rule: dict[str, Any]) -> str | None:
+        """First entity (in HA order) matching the rule."""
+        sets = self._condition_sets(rule)
+        if not sets:
+            return None
+        contains = rule.get("entity_id_contains") or []
+        indexed = [s for s in sets if s is not None]
+        if rule.get("match") == "any":
+            candidates = set().union(*indexed) if indexed else set()
+            if contains:
+                candidates |= {e for e in self.ids if self._matches_contains(e, contains)}
+        else:
+            if indexed:
+                candidates = set.intersection(*indexed)
+                if contains:
+                    candidates = {e for e in candidates if self._matches_contains(e, contains)}
+            else:
+                candidates = {e for e in self.ids if self._matches_contains(e, contains)}
+        if not candidates:
+            return None
+        return min(candidates, key=self.position.__getitem__)
+
+
+def resolve_tiles(states: list[dict[str, Any]]) -> dict[str, str | None]:
+    """Tile name -> entity_id picked by the tile rules (None when nothing matches); cached per entity set."""
+    global _resolved, _resolved_key
+    rules = _load_rules()
+    key = (_rules_version, ha.entity_set_version())
+    if _resolved_key == key:
+        return _resolved
+    index = _EntityIndex(states)
+    resolved: dict[str, str | None] = {}
+    for tile, tile_rules in rules.items():
+        resolved[tile] = None
+        for rule in tile_rules:
+            entity_id = index.resolve(rule)
+            if entity_id:
+                resolved[tile] = entity_id
+                break
+    _resolved, _resolved_key = resolved, key
+    logger.debug(f"Resolved dashboard tiles: {resolved}")
+    return resolved
+
+
+def parse_number(value: Any) -> float | None:
+    """Parse a state like "1,234.5" or "$12.30"; None when it is not a number."""
+    try:
+        return float(str(value).replace("$", "").replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def to_kw(state: dict[str, Any] | None) -> float | None:
+    """A power state's value in kW (W readings are converted)."""
+    if not state:
+        return None
+    value = parse_number(state.get("state"))
+    if value is None:
+        return None
+    unit = (state.get("attributes") or {}).get("unit_of_measurement")
+    return value / 1000 if unit in ("W", "w") else value
+
+
+def _base(state: dict[str, Any] | None) -> dict[str, Any] | None:
+    if not state:
+        return None
+    return {
+        "entity_id": state.get("entity_id"),
+        "friendly_name": (state.get("attributes") or {}).get("friendly_name"),
+        "state": state.get("state"),
+    }
+
+
+def _value(state: dict[str, Any] | None) -> dict[str, Any] | None:
+    if not state:
+        return None
+    attrs = state.get("attributes") or {}
+    return {**_base(state), "value": parse_number(state.get("state")), "unit": attrs.get("unit_of_measurement")}
+
+
+def _power(state: dict[str, Any] | None) -> dict[str, Any] | None:
+    if not state:
+        return None
+    return {**_base(state), "kw": to_kw(state)}
+
+
+async def get_summary() -> dict[str, Any]:
+    """Compact dashboard model: one small object per tile, or None where no entity matched."""
+    states = await ha.get_states_for_dashboard()
+    tiles = resolve_tiles(states)
+    index = ha.get_cached_index()
+
+    def state_of(tile: str) -> dict[str, Any] | None:
+        entity_id = tiles.get(tile)
+        return index.get(entity_id) if entity_id else None
+
+    weather = state_of("weather")
+    weather_attrs = (weather or {}).get("attributes") or {}
+    sun = state_of("sun")
+    sun_attrs = (sun or {}).get("attributes") or {}
+    battery = state_of("battery_level")
+
+    return {
+        "weather": weather and {
+            **_base(weather),
+            "condition": weather_attrs.get("condition") or weather.get("state"),
+            "temperature": weather_attrs.get("temperature"),
+            "temperature_unit": weather_attrs.get("temperature_unit"),
+            "humidity": weather_attrs.get("humidity"),
+            "wind_speed": weather_attrs.get("wind_speed"),
+            "wind_speed_unit": weather_attrs.get("wind_speed_unit"),
+        },
+        "outdoor_temperature": _value(state_of("outdoor_temperature")),
+        "sun": sun and {
+            **_base(sun),
+            "elevation": sun_attrs.get("elevation"),
+            "next_rising": sun_attrs.get("next_rising"),
+            "next_setting": sun_attrs.get("next_setting"),
+        },
+        "power": _power(state_of("power")),
+        "solar": _power(state_of("solar")),
+        "battery": battery and {**_base(battery), "level_pct": parse_number(battery.get("state"))},
+        "battery_power": _power(state_of("battery_power")),
+        "grid": _power(state_of("grid")),
+        "billing": {
+            "cost_to_date": _value(state_of("cost_to_date")),
+            "forecasted_cost": _value(state_of("forecasted_cost")),
+            "usage_to_date": _value(state_of("usage_to_date")),
+            "forecasted_usage": _value(state_of("forecasted_usage")),
+        },
+        "entities": tiles,
+    }
@@ -0,0 +1,451 @@
+"""
+Backfill of energy history from Home Assistant's recorder (GET /api/history/period), for days the 23:59 snapshot
+job missed and days from before the app was deployed:
+
+- energy_daily: the SMUD bill-to-date usage/cost at the end of each local day, i.e. what the snapshot job would
+  have recorded. Values already recorded are kept; only missing ones are filled in.
+- energy_samples: power/solar/battery/grid readings on the ENERGY_SAMPLE_INTERVAL_SECONDS grid (HA stores changes
+  only, so each value holds until the next one). Existing samples win. The rollup buckets covering the backfilled
+  time are recomputed afterwards; raw samples past retention are purged by the nightly job as usual.
+
+The range is split into runs of HA_BACKFILL_CHUNK_DAYS local days, fetched with at most HA_BACKFILL_CONCURRENCY
+requests in flight. Each response is parsed as it downloads and samples are written every HA_BACKFILL_BATCH_ROWS
+rows, so memory stays bounded by one batch per request however long the range. A chunk marks its days in
+energy_backfill_days once written; a later run (after a crash, restart or HA outage) skips those days unless
+force is set. HA only returns what its recorder still keeps (purge_keep_days, 10 days by default).
+
+Run from backend/:  python -m services.energy_backfill --from 2025-01-01 [--to 2025-06-30] [--force]
+"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from core import db
+from core import executors
+from core.config import settings
+from services import dashboard_summary
+from services import energy_history
+from services import energy_rollups
+from services import energy_samples
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+# Recorder states that carry no reading
+_NO_VALUE = frozenset(("", "unknown", "unavailable", "none"))
+
+
+@dataclass
+class _Target:
+    entity_id: str
+    kind: str  # "usage", "cost" or a sampled series kind (energy_samples.SAMPLED_TILES)
+    # Attributes of the current state (unit_of_measurement); history states come without attributes
+    attributes: Dict[str, Any]
+    series_id: Optional[int] = None
+
+    def value(self, state: Any) -> Optional[float]:
+        if state is None or str(state).strip().lower() in _NO_VALUE:
+            return None
+        reading = {"state": state, "attributes": self.attributes}
+        if self.kind == "usage":
+            return energy_history.usage_kwh_from_state(reading)
+        if self.kind == "cost":
+            return energy_history.cost_usd_from_state(reading)
+        return energy_samples.read_value(self.kind, reading)
+
+
+@dataclass
+class _Chunk:
+    days: List[date]
+
+    @property
+    def start(self) -> datetime:
+        return _local_midnight(self.days[0])
+
+    @property
+    def end(self) -> datetime:
+        return _local_midnight(self.days[-1] + timedelta(days=1))
+
+
+def _local_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min).astimezone()
+
+
+def _plan_chunks(days: List[date], chunk_days: int) -> List[_Chunk]:
+    """Group days (sorted) into chunks of consecutive days, at most chunk_days each."""
+    chunks: List[_Chunk] = []
+    for day in days:
+        last = chunks[-1].days if chunks else None
+        if last and len(last) < chunk_days and last[-1] + timedelta(days=1) == day:
+            last.append(day)
+        else:
+            chunks.append(_Chunk([day]))
+    return chunks
+
+
+class HistoryParser:
+    """
+    Incremental parser for /api/history/period bodies ([[state, ...], ...], one list per entity). feed() text as
+    it arrives and get (entity_id, state) for every complete state object; only the unfinished tail is buffered.
+    With minimal_response only an entity's first state names it, so the id is carried over within each list.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._depth = 0
+        self._entity_id: Optional[str] = None
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, text: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        buf = self._buf + text
+        pos, end = 0, len(buf)
+        while pos < end:
+            ch = buf[pos]
+            if ch in " \t\r\n,":
+                pos += 1
+            elif ch == "[" and self._depth < 2:
+                self._depth += 1
+                self._entity_id = None
+                pos += 1
+            elif ch == "]" and self._depth > 0:
+                self._depth -= 1
+                pos += 1
+            elif ch == "{" and self._depth == 2:
+                try:
+                    state, pos_after = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # object continues in the next piece
+                pos = pos_after
+                self._entity_id = state.get("entity_id") or self._entity_id
+                if self._entity_id:
+                    yield self._entity_id, state
+            else:
+                raise ValueError(f"Unexpected {ch!r} in history response")
+        self._buf = buf[pos:]
+
+    def close(self) -> None:
+        if self._depth or self._buf.strip():
+            raise ValueError("Truncated history response")
+
+
+def _timestamp(state: Dict[str, Any]) -> Optional[float]:
+    changed = state.get("last_changed") or state.get("last_updated")
+    try:
+        return datetime.fromisoformat(changed).timestamp() if changed else None
+    except ValueError:
+        return None
+
+
+class _ChunkRun:
+    """Turns the states of one chunk into end-of-day values and grid-aligned samples."""
+
+    def __init__(self, chunk: _Chunk, targets: Dict[str, _Target], interval: int):
+        self.chunk = chunk
+        self.targets = targets
+        self.interval = interval
+        self.start_ts = int(chunk.start.timestamp())
+        self.end_ts = int(chunk.end.timestamp())
+        # Last reading per day of the usage/cost entity whose list is streaming
+        self._day_values: Dict[date, float] = {}
+        # day -> {"usage": kWh, "cost": USD} at the end of the day
+        self.daily: Dict[date, Dict[str, float]] = {}
+        self.rows: List[Tuple[int, int, float]] = []
+        self._current: Optional[_Target] = None
+        self._held: Optional[Tuple[int, Optional[float]]] = None  # (since ts, value) of the current entity
+
+    def add(self, entity_id: str, state: Dict[str, Any]) -> None:
+        if self._current is None or self._current.entity_id != entity_id:
+            self.finish_entity()
+            self._current = self.targets.get(entity_id)
+        target = self._current
+        ts = _timestamp(state)
+        if target is None or ts is None:
+            return
+        ts = max(int(ts), self.start_ts)  # the first state is the one in effect at the chunk start
+        value = target.value(state.get("state"))
+        if target.series_id is None:
+            if value is not None:
+                self._day_values[datetime.fromtimestamp(ts).date()] = value
+        else:
+            if self._held is not None:
+                self._emit(target.series_id, self._held, ts)
+            self._held = (ts, value)
+
+    def finish_entity(self) -> None:
+        target, self._current = self._current, None
+        if target is None:
+            return
+        if target.series_id is None:
+            # A day without changes keeps the previous day's reading
+            last = None
+            for day in self.chunk.days:
+                last = self._day_values.get(day, last)
+                if last is not None:
+                    self.daily.setdefault(day, {})[target.kind] = last
+            self._day_values = {}
+        elif self._held is not None:
+            self._emit(target.series_id, self._held, self.end_ts)
+            self._held = None
+
+    def _emit(self, series_id: int, held: Tuple[int, Optional[float]], until: int) -> None:
+        # One sample per grid point while the value held (none while the entity was unavailable)
+        since, value = held
+        if value is None:
+            return
+        first = -(-since // self.interval) * self.interval
+        self.rows.extend((series_id, ts, value) for ts in range(first, min(until, self.end_ts), self.interval))
+
+
+def _write_samples(conn, rows: List[Tuple[int, int, float]]) -> int:
+    cur = conn.executemany("INSERT OR IGNORE INTO energy_samples (series_id, ts, value) VALUES (?, ?, ?)", rows)
+    return cur.rowcount
+
+
+def _write_days(conn, chunk: _Chunk, daily: Dict[date, Dict[str, float]]) -> int:
+    """Fill missing energy_daily values and checkpoint the chunk's days, in one transaction."""
+    now = datetime.now().isoformat()
+    rows = [
+        (day.isoformat(), values.get("usage"), values.get("cost"), now)
+        for day, values in sorted(daily.items())
+    ]
+    conn.executemany("""
+        INSERT INTO energy_daily (date, usage_kwh, cost_usd, created_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(date) DO UPDATE SET
+            usage_kwh = COALESCE(energy_daily.usage_kwh, excluded.usage_kwh),
+            cost_usd = COALESCE(energy_daily.cost_usd, excluded.cost_usd)
+    """, rows)
+    conn.executemany(
+        "INSERT OR REPLACE INTO energy_backfill_days (date, completed_at) VALUES (?, ?)",
+        [(day.isoformat(), now) for day in chunk.days],
+    )
+    return len(rows)
+
+
+def _completed_days(conn, from_date: date, to_date: date) -> Set[date]:
+    rows = conn.execute(
+        "SELECT date FROM energy_backfill_days WHERE date >= ? AND date <= ?",
+        (from_date.isoformat(), to_date.isoformat()),
+    )
+    return {date.fromisoformat(row["date"]) for row in rows}
+
+
+@dataclass
+class _Progress:
+    state: str = "idle"  # idle, running, done, failed, cancelled
+    from_date: Optional[str] = None
+    to_date: Optional[str] = None
+    entities: Dict[str, str] = field(default_factory=dict)
+    days_total: int = 0
+    days_skipped: int = 0
+    chunks_total: int = 0
+    chunks_done: int = 0
+    chunks_failed: int = 0
+    daily_rows: int = 0
+    samples_written: int = 0
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+
+class EnergyBackfill:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.progress = _Progress()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, from_date: date, to_date: Optional[date] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Validate the range, resolve the entities and run the backfill in the background. Raises ValueError for a
+        bad range or missing entities, RuntimeError when a backfill is already running; HA errors propagate.
+        """
+        if self.running:
+            raise RuntimeError("A backfill is already running")
+        chunks, targets = await self._prepare(from_date, to_date, force)
+        self._task = asyncio.create_task(self._run(chunks, targets), name="energy-backfill")
+        return self.status()
+
+    async def run(self, from_date: date, to_date: Optional[date] = None, force: bool = False) -> Dict[str, Any]:
+        """Backfill in the foreground (command line); returns the final status."""
+        if self.running:
+            raise RuntimeError("A backfill is already running")
+        chunks, targets = await self._prepare(from_date, to_date, force)
+        await self._run(chunks, targets)
+        return self.status()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return dict(vars(self.progress))
+
+    async def _prepare(
+        self, from_date: date, to_date: Optional[date], force: bool
+    ) -> Tuple[List[_Chunk], Dict[str, _Target]]:
+        if not ha._is_configured():
+            raise ValueError("Home Assistant is not configured")
+        # Only complete days; today belongs to the 23:59 snapshot and the live sampler
+        yesterday = date.today() - timedelta(days=1)
+        to_date = min(to_date or yesterday, yesterday)
+        if from_date > to_date:
+            raise ValueError(f"from_date must be on or before {to_date.isoformat()}")
+        targets = await self._resolve_targets()
+        if not targets:
+            raise ValueError("None of the SMUD or power entities were found in Home Assistant")
+
+        days = [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+        done = set() if force else await db.run_read(
+            lambda conn: _completed_days(conn, from_date, to_date), op="energy_backfill.checkpoint"
+        )
+        todo = [day for day in days if day not in done]
+        chunks = _plan_chunks(todo, max(settings.HA_BACKFILL_CHUNK_DAYS, 1))
+        self.progress = _Progress(
+            state="running",
+            from_date=from_date.isoformat(),
+            to_date=to_date.isoformat(),
+            entities={t.entity_id: t.kind for t in targets.values()},
+            days_total=len(days),
+            days_skipped=len(days) - len(todo),
+            chunks_total=len(chunks),
+            started_at=datetime.now().isoformat(),
+        )
+        return chunks, targets
+
+    async def _resolve_targets(self) -> Dict[str, _Target]:
+        """Entities to backfill, found the same way the snapshot job and the sampler find them today."""
+        view = await ha.get_states_snapshot()
+        found: List[Tuple[Optional[Dict[str, Any]], str]] = [
+            (view.by_friendly_name(energy_history.SMUD_USAGE_TO_DATE), "usage"),
+            (view.by_friendly_name(energy_history.SMUD_COST_TO_DATE), "cost"),
+        ]
+        if settings.ENERGY_SAMPLE_INTERVAL_SECONDS > 0:
+            tiles = dashboard_summary.resolve_tiles(view.dashboard)
+            for tile, kind in energy_samples.SAMPLED_TILES.items():
+                entity_id = tiles.get(tile)
+                found.append((view.get(entity_id) if entity_id else None, kind))
+        targets: Dict[str, _Target] = {}
+        for state, kind in found:
+            if state and state["entity_id"] not in targets:
+                targets[state["entity_id"]] = _Target(state["entity_id"], kind, dict(state.get("attributes") or {}))
+
+        sampled = [t for t in targets.values() if t.kind not in ("usage", "cost")]
+        if sampled:
+            new_ids: Dict[str, int] = {}
+            ids = await db.run_write(
+                lambda conn: [energy_samples.series_id(conn, t.entity_id, t.kind, new_ids=new_ids) for t in sampled],
+                op="energy_backfill.series",
+            )
+            energy_samples.cache_series_ids(new_ids)
+            for target, series_id in zip(sampled, ids):
+                target.series_id = series_id
+        return targets
+
+    async def _run(self, chunks: List[_Chunk], targets: Dict[str, _Target]) -> None:
+        progress = self.progress
+        semaphore = asyncio.Semaphore(max(settings.HA_BACKFILL_CONCURRENCY, 1))
+        logger.info(
+            f"Energy backfill {progress.from_date}..{progress.to_date}: {len(chunks)} chunks, "
+            f"{progress.days_skipped} days already done, entities {progress.entities}"
+        )
+        try:
+            await asyncio.gather(*(self._run_chunk(chunk, targets, semaphore) for chunk in chunks))
+            progress.state = "failed" if progress.chunks_failed else "done"
+        except asyncio.CancelledError:
+            progress.state = "cancelled"
+            raise
+        except Exception as e:
+            progress.state = "failed"
+            progress.error = str(e)
+            logger.exception("Energy backfill failed")
+        finally:
+            progress.finished_at = datetime.now().isoformat()
+            logger.info(
+                f"Energy backfill {progress.state}: {progress.chunks_done}/{progress.chunks_total} chunks, "
+                f"{progress.daily_rows} days, {progress.samples_written} samples"
+            )
+
+    async def _run_chunk(self, chunk: _Chunk, targets: Dict[str, _Target], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            try:
+                await self._fetch_chunk(chunk, targets)
+                self.progress.chunks_done += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Days stay unchecked, so the next run retries them
+                self.progress.chunks_failed += 1
+                self.progress.error = f"{chunk.days[0]}..{chunk.days[-1]}: {e}"
+                logger.warning(f"Energy backfill of {chunk.days[0]}..{chunk.days[-1]} failed: {e}")
+
+    async def _fetch_chunk(self, chunk: _Chunk, targets: Dict[str, _Target]) -> None:
+        run = _ChunkRun(chunk, targets, max(settings.ENERGY_SAMPLE_INTERVAL_SECONDS, 1))
+        parser = HistoryParser()
+        batch = max(settings.HA_BACKFILL_BATCH_ROWS, 1)
+        body = ha.stream_history(
+            chunk.start, chunk.end, list(targets), timeout=settings.HA_BACKFILL_TIMEOUT
+        )
+        try:
+            async for text in body:
+                for entity_id, state in parser.feed(text):
+                    run.add(entity_id, state)
+                if len(run.rows) >= batch:
+                    await self._flush(run)
+        finally:
+            await body.aclose()
+        parser.close()
+        run.finish_entity()
+        await self._flush(run)
+
+        series_ids = sorted({t.series_id for t in targets.values() if t.series_id is not None})
+        if series_ids:
+            await executors.run_blocking(
+                "db", "energy_backfill.rollups", energy_rollups.rebuild_range,
+                series_ids, run.start_ts, run.end_ts,
+            )
+        # Await first: other chunks update the counters meanwhile
+        written = await db.run_write(lambda conn: _write_days(conn, chunk, run.daily), op="energy_backfill.daily")
+        self.progress.daily_rows += written
+
+    async def _flush(self, run: _ChunkRun) -> None:
+        rows, run.rows = run.rows, []
+        if rows:
+            written = await db.run_write(lambda conn: _write_samples(conn, rows), op="energy_backfill.samples")
+            self.progress.samples_written += written
+
+
+energy_backfill = EnergyBackfill()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backfill energy_daily/energy_samples from HA's recorder history")
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="to_date", type=date.fromisoformat, default=None,
+                        help="YYYY-MM-DD (default and maximum: yesterday)")
+    parser.add_argument("--force", action="store_true", help="Refetch days a previous run already completed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    async def _main() -> Dict[str, Any]:
+        db.init_db()
+        await ha.start_client()
+        try:
+            return await energy_backfill.run(args.from_date, args.to_date, force=args.force)
+        finally:
+            await ha.close_client()
+
+    result = asyncio.run(_main())
+    print(json.dumps(result, indent=2))
+    raise SystemExit(0 if result["state"] == "done" else 1)
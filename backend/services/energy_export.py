@@ -0,0 +1,265 @@
+"""
+Bulk export of energy history (GET /homeassistant/energy-history/export) as CSV, NDJSON or Parquet.
+
+Rows are read with db.iter_rows (fetchmany batches of ENERGY_EXPORT_BATCH_ROWS on a dedicated read-only
+connection and thread) and encoded batch by batch, on a second thread, into the response, so memory stays constant
+however many years are exported and the event loop never encodes. Queries walk the primary keys in order (series,
+then time), so SQLite never sorts a temp table either.
+
+Exports:
+- daily SMUD snapshots (no series): date, usage_kwh, cost_usd
+- series=<kind>&tier=raw: ts, entity_id, value (raw samples only exist for ENERGY_SAMPLE_RETENTION_DAYS)
+- series=<kind>&tier=hourly|daily|monthly: ts, entity_id, min, max, avg, last, count
+
+Parquet needs the optional pyarrow package; rows are written in row groups of _PARQUET_ROW_GROUP rows, with ts as
+a UTC timestamp and date as a date column.
+"""
+import csv
+import io
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+from core import db
+from core import executors
+from core.config import settings
+from core.responses import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson", "parquet")
+TIERS = ("raw", "hourly", "daily", "monthly")
+# format -> (media type, file extension)
+MEDIA_TYPES = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+_PARQUET_ROW_GROUP = 65536
+
+# Export slots reserved by requests whose download has not finished (bounded by ENERGY_EXPORT_MAX_CONCURRENT)
+_active = 0
+
+
+class ExportCapacityError(RuntimeError):
+    """ENERGY_EXPORT_MAX_CONCURRENT downloads are already streaming."""
+
+
+@dataclass
+class ExportQuery:
+    sql: str
+    params: Tuple[Any, ...]
+    # (name, type): "date", "timestamp" (unix seconds), "string", "float" or "int"
+    columns: List[Tuple[str, str]]
+    name: str
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def build_query(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    series: Optional[str] = None,
+    tier: str = "raw",
+) -> ExportQuery:
+    """SQL and column layout for one export; dates are local days, inclusive."""
+    span = f"{from_date.isoformat() if from_date else 'start'}-{to_date.isoformat() if to_date else 'end'}"
+    if not series:
+        where, params = ["1=1"], []
+        if from_date:
+            where.append("date >= ?")
+            params.append(from_date.isoformat())
+        if to_date:
+            where.append("date <= ?")
+            params.append(to_date.isoformat())
+        return ExportQuery(
+            f"SELECT date, usage_kwh, cost_usd FROM energy_daily WHERE {' AND '.join(where)} ORDER BY date",
+            tuple(params),
+            [("date", "date"), ("usage_kwh", "float"), ("cost_usd", "float")],
+            f"energy-daily-{span}",
+        )
+
+    if tier not in TIERS:
+        raise ValueError(f"tier must be one of {', '.join(TIERS)}")
+    from_ts = int(datetime.combine(from_date, time.min).timestamp()) if from_date else 0
+    to_ts = int(datetime.combine(to_date, time.max).timestamp()) if to_date else 2**62
+    # energy_series is scanned in id order and each series' rows come off its primary key in time order
+    if tier == "raw":
+        sql = """
+            SELECT s.ts, e.entity_id, s.value
+            FROM energy_series e JOIN energy_samples s ON s.series_id = e.id
+            WHERE e.kind = ? AND s.ts >= ? AND s.ts <= ?
+            ORDER BY e.id, s.ts
+        """
+        columns = [("ts", "timestamp"), ("entity_id", "string"), ("value", "float")]
+    else:
+        sql = f"""
+            SELECT r.bucket AS ts, e.entity_id, r.min, r.max, r.sum / r.count AS avg, r.last, r.count
+            FROM energy_series e JOIN energy_rollup_{tier} r ON r.series_id = e.id
+            WHERE e.kind = ? AND r.bucket >= ? AND r.bucket <= ?
+            ORDER BY e.id, r.bucket
+        """
+        columns = [
+            ("ts", "timestamp"), ("entity_id", "string"), ("min", "float"), ("max", "float"),
+            ("avg", "float"), ("last", "float"), ("count", "int"),
+        ]
+    return ExportQuery(sql, (series, from_ts, to_ts), columns, f"energy-{series}-{tier}-{span}")
+
+
+class _CsvEncoder:
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, lineterminator="\n")
+        self._writer.writerow([name for name, _ in columns])
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        self._writer.writerows(rows)
+        return self._take()
+
+    def finish(self) -> bytes:
+        return self._take()
+
+    def _take(self) -> bytes:
+        data = self._buf.getvalue().encode("utf-8")
+        self._buf.seek(0)
+        self._buf.truncate()
+        return data
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self._names = [name for name, _ in columns]
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        names = self._names
+        return b"".join(dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Drain:
+    """Write-only file for ParquetWriter whose bytes are handed to the response as they are written."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _ParquetEncoder:
+    _TYPES = {"string": "string", "float": "float64", "int": "int64", "date": "date32"}
+
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self._columns = columns
+        self._schema = pa.schema([
+            (name, pa.timestamp("s", tz="UTC") if kind == "timestamp" else getattr(pa, self._TYPES[kind])())
+            for name, kind in columns
+        ])
+        self._sink = _Drain()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+        self._pending: List[Sequence[Any]] = []
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        self._pending.extend(rows)
+        if len(self._pending) >= _PARQUET_ROW_GROUP:
+            self._write_group()
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        if self._pending:
+            self._write_group()
+        self._writer.close()  # footer
+        return self._sink.take()
+
+    def _write_group(self) -> None:
+        rows, self._pending = self._pending, []
+        arrays = []
+        for i, (name, kind) in enumerate(self._columns):
+            values = [row[i] for row in rows]
+            if kind == "date":
+                values = [date.fromisoformat(v) if v else None for v in values]
+            arrays.append(pa.array(values, type=self._schema.field(name).type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+
+_ENCODERS = {"csv": _CsvEncoder, "ndjson": _NdjsonEncoder, "parquet": _ParquetEncoder}
+
+
+class ExportSlot:
+    """One reserved download slot; release() may be called from every cleanup path, it frees the slot once."""
+
+    def __init__(self):
+        self._released = False
+
+    def release(self) -> None:
+        global _active
+        if not self._released:
+            self._released = True
+            _active -= 1
+
+
+def reserve() -> ExportSlot:
+    """
+    Take a download slot before the response starts, or raise ExportCapacityError when all are in use. Check and
+    increment run together on the event loop, so concurrent requests cannot all pass the check.
+    """
+    global _active
+    if _active >= max(settings.ENERGY_EXPORT_MAX_CONCURRENT, 1):
+        raise ExportCapacityError("Too many exports in progress")
+    _active += 1
+    return ExportSlot()
+
+
+async def stream_export(query: ExportQuery, fmt: str, slot: ExportSlot) -> AsyncIterator[bytes]:
+    """
+    Encoded export body, one piece per fetched batch (Parquet: per row group). Encoding (pyarrow arrays, zstd)
+    runs on a thread of its own, off the event loop and next to the row fetches. Releases slot when done.
+    """
+    executor = executors.dedicated("energy-export")
+    try:
+        encoder = await executor.run("energy_export.encode", _ENCODERS[fmt], query.columns)
+        rows_out = 0
+        async for rows in db.iter_rows(
+            query.sql, query.params, max(settings.ENERGY_EXPORT_BATCH_ROWS, 1), op="energy_export.fetch"
+        ):
+            rows_out += len(rows)
+            data = await executor.run("energy_export.encode", encoder.encode, rows)
+            if data:
+                yield data
+        data = await executor.run("energy_export.encode", encoder.finish)
+        if data:
+            yield data
+        logger.info(f"Exported {rows_out} rows as {fmt} ({query.name})")
+    finally:
+        executor.shutdown()
+        slot.release()
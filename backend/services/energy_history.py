@@ -2,9 +2,10 @@
 Energy history service: record and query daily usage/cost snapshots.
 """
 import logging
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from typing import List, Optional, Dict, Any
 from core import db
+from services import energy_rollups
 from services import homeassistant as ha
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,69 @@ logger = logging.getLogger(__name__)
 SMUD_USAGE_TO_DATE = "SMUD Electric Current bill electric usage to date"
 SMUD_COST_TO_DATE = "SMUD Electric Current bill electric cost to date"
 
+HISTORY_MODES = ("delta", "cumulative")
+HISTORY_GROUPS = ("day", "week", "month", "bill_period")
+
+# energy_daily holds bill-to-date values. Per-day deltas come from LAG over the whole table (so the first day of
+# a range still sees the day before it); a drop in usage (or cost, when usage is missing) marks a new bill
+# period, where the delta is the new to-date value itself. SUM over the reset flags numbers the bill periods
+# (only computed when grouping by bill period: each window is another pass over the rows).
+_DAILY_DELTAS_SQL = """
+    WITH lagged AS (
+        SELECT date, usage_kwh, cost_usd,
+               LAG(usage_kwh) OVER w AS prev_usage,
+               LAG(cost_usd) OVER w AS prev_cost
+        FROM energy_daily
+        WHERE date >= ?
+        WINDOW w AS (ORDER BY date)
+    ),
+    flagged AS (
+        SELECT *,
+               CASE
+                   WHEN usage_kwh IS NOT NULL AND prev_usage IS NOT NULL THEN usage_kwh < prev_usage
+                   WHEN cost_usd IS NOT NULL AND prev_cost IS NOT NULL THEN cost_usd < prev_cost
+                   ELSE 0
+               END AS reset
+        FROM lagged
+    )
+    SELECT date,
+           CASE WHEN reset THEN usage_kwh ELSE usage_kwh - prev_usage END AS usage_delta,
+           CASE WHEN reset THEN cost_usd ELSE cost_usd - prev_cost END AS cost_delta,
+           {bill_period} AS bill_period
+    FROM flagged
+"""
+_BILL_PERIOD_SQL = "SUM(reset) OVER (ORDER BY date ROWS UNBOUNDED PRECEDING)"
+
+_GROUP_KEYS = {
+    "week": "date(date, 'weekday 0', '-6 days')",  # Monday
+    "month": "strftime('%Y-%m-01', date)",
+    "bill_period": "bill_period",
+}
+
+
+def usage_kwh_from_state(state: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Bill-to-date usage in kWh from an HA state (Wh converted; kWh assumed when the unit is missing/unknown)."""
+    if not state or not state.get("state"):
+        return None
+    try:
+        usage_value = float(state["state"])
+    except (ValueError, TypeError):
+        logger.warning(f"Could not parse usage value: {state.get('state')}")
+        return None
+    unit = ((state.get("attributes") or {}).get("unit_of_measurement") or "").lower()
+    return usage_value / 1000 if unit == "wh" else usage_value
+
+
+def cost_usd_from_state(state: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Bill-to-date cost in USD from an HA state ("$12.34" or "12.34")."""
+    if not state or not state.get("state"):
+        return None
+    try:
+        return float(str(state["state"]).replace("$", "").strip())
+    except (ValueError, TypeError):
+        logger.warning(f"Could not parse cost value: {state.get('state')}")
+        return None
+
 
 async def record_today_snapshot() -> bool:
     """
@@ -24,43 +88,13 @@ async def record_today_snapshot() -> bool:
         return False
 
     try:
-        # Fetch all dashboard entities (includes sensor domain)
-        entities = await ha.get_states_for_dashboard()
-        
-        # Find SMUD entities by friendly name
-        usage_entity = next(
-            (e for e in entities if e.get("attributes", {}).get("friendly_name") == SMUD_USAGE_TO_DATE),
-            None
-        )
-        cost_entity = next(
-            (e for e in entities if e.get("attributes", {}).get("friendly_name") == SMUD_COST_TO_DATE),
-            None
-        )
-
-        usage_kwh = None
-        cost_usd = None
-
-        if usage_entity and usage_entity.get("state"):
-            try:
-                usage_value = float(usage_entity["state"])
-                # If unit is kWh, use as-is; if it's something else, might need conversion
-                unit = usage_entity.get("attributes", {}).get("unit_of_measurement", "").lower()
-                if unit == "kwh":
-                    usage_kwh = usage_value
-                elif unit == "wh":
-                    usage_kwh = usage_value / 1000
-                else:
-                    # Assume kWh if no unit or unknown unit
-                    usage_kwh = usage_value
-            except (ValueError, TypeError):
-                logger.warning(f"Could not parse usage value: {usage_entity.get('state')}")
-
-        if cost_entity and cost_entity.get("state"):
-            try:
-                cost_value = str(cost_entity["state"]).replace("$", "").strip()
-                cost_usd = float(cost_value)
-            except (ValueError, TypeError):
-                logger.warning(f"Could not parse cost value: {cost_entity.get('state')}")
+        # Find SMUD entities by friendly name (indexed once per snapshot)
+        view = await ha.get_states_snapshot()
+        usage_entity = view.by_friendly_name(SMUD_USAGE_TO_DATE)
+        cost_entity = view.by_friendly_name(SMUD_COST_TO_DATE)
+
+        usage_kwh = usage_kwh_from_state(usage_entity)
+        cost_usd = cost_usd_from_state(cost_entity)
 
         if usage_kwh is None and cost_usd is None:
             logger.warning("No valid usage or cost data found, skipping snapshot")
@@ -68,30 +102,42 @@ async def record_today_snapshot() -> bool:
 
         # Record today's snapshot
         today = date.today().isoformat()
-        conn = db.get_db_connection()
-        try:
-            conn.execute("""
-                INSERT OR REPLACE INTO energy_daily (date, usage_kwh, cost_usd, created_at)
-                VALUES (?, ?, ?, ?)
-            """, (today, usage_kwh, cost_usd, datetime.now().isoformat()))
-            conn.commit()
-            logger.info(f"Recorded energy snapshot for {today}: usage={usage_kwh} kWh, cost=${cost_usd}")
-            return True
-        finally:
-            conn.close()
+        await db.run_write(lambda conn: conn.execute("""
+            INSERT OR REPLACE INTO energy_daily (date, usage_kwh, cost_usd, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (today, usage_kwh, cost_usd, datetime.now().isoformat())), op="energy_history.record")
+        logger.info(f"Recorded energy snapshot for {today}: usage={usage_kwh} kWh, cost=${cost_usd}")
+        return True
 
     except Exception as e:
         logger.exception(f"Failed to record energy snapshot: {e}")
         return False
 
 
-def get_history(from_date: Optional[date] = None, to_date: Optional[date] = None) -> List[Dict[str, Any]]:
+def get_history(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    series: Optional[str] = None,
+    resolution: Optional[int] = None,
+    mode: Optional[str] = None,
+    group_by: Optional[str] = None,
+) -> List[Dict[str, Any]]:
     """
     Query energy history for a date range.
     Returns list of {date, usage_kwh, cost_usd} dicts, ordered by date ascending.
+    With mode and/or group_by, values are derived from the bill-to-date snapshots instead (see get_derived_history).
+    With series (power, solar, battery_level, battery_power, grid), returns that sampled time series instead,
+    read from the coarsest rollup tier that meets resolution (seconds, or automatic):
+    list of {ts, min, max, avg, last, count, entity_id}; mode and group_by do not apply to series.
     """
-    conn = db.get_db_connection()
-    try:
+    if series:
+        from_ts = int(datetime.combine(from_date, time.min).timestamp()) if from_date else None
+        to_ts = int(datetime.combine(to_date, time.max).timestamp()) if to_date else None
+        return energy_rollups.get_series_history(series, from_ts, to_ts, resolution)["data"]
+    if mode or group_by:
+        return get_derived_history(from_date, to_date, mode or "delta", group_by or "day")
+
+    with db.reader() as conn:
         query = "SELECT date, usage_kwh, cost_usd FROM energy_daily WHERE 1=1"
         params = []
 
@@ -114,5 +160,83 @@ def get_history(from_date: Optional[date] = None, to_date: Optional[date] = None
             }
             for row in rows
         ]
-    finally:
-        conn.close()
+
+
+def get_derived_history(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    mode: str = "delta",
+    group_by: str = "day",
+) -> List[Dict[str, Any]]:
+    """
+    Usage and cost per day, week, month or bill period, computed in SQLite from the bill-to-date snapshots.
+    mode=delta: usage/cost within each group. mode=cumulative: running total from from_date to the end of
+    each group, continuing across bill resets.
+    Returns list of {date, end_date, days, usage_kwh, cost_usd} ordered by date; date is the first snapshot day
+    of the group. A missing day's usage is counted on the next recorded day.
+    """
+    if mode not in HISTORY_MODES:
+        raise ValueError(f"mode must be one of {', '.join(HISTORY_MODES)}")
+    if group_by not in HISTORY_GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(HISTORY_GROUPS)}")
+
+    with db.reader() as conn:
+        # The window only needs the snapshot just before the range to difference against
+        lower = ""
+        if from_date:
+            row = conn.execute(
+                "SELECT MAX(date) AS d FROM energy_daily WHERE date < ?", (from_date.isoformat(),)
+            ).fetchone()
+            lower = row["d"] or ""
+        where = ["1=1"]
+        params: List[Any] = [lower]
+        if from_date:
+            where.append("date >= ?")
+            params.append(from_date.isoformat())
+        if to_date:
+            where.append("date <= ?")
+            params.append(to_date.isoformat())
+
+        deltas = _DAILY_DELTAS_SQL.format(bill_period=_BILL_PERIOD_SQL if group_by == "bill_period" else "0")
+        if group_by == "day":
+            grouped = f"""
+                SELECT date, date AS end_date, 1 AS days, usage_delta AS usage_kwh, cost_delta AS cost_usd
+                FROM deltas
+                WHERE {" AND ".join(where)}
+            """
+        else:
+            grouped = f"""
+                SELECT MIN(date) AS date, MAX(date) AS end_date, COUNT(*) AS days,
+                       SUM(usage_delta) AS usage_kwh, SUM(cost_delta) AS cost_usd
+                FROM deltas
+                WHERE {" AND ".join(where)}
+                GROUP BY {_GROUP_KEYS[group_by]}
+            """
+        query = f"WITH deltas AS ({deltas}), grouped AS ({grouped}) "
+        if mode == "cumulative":
+            query += """
+                SELECT date, end_date, days,
+                       SUM(usage_kwh) OVER w AS usage_kwh,
+                       SUM(cost_usd) OVER w AS cost_usd
+                FROM grouped
+                WINDOW w AS (ORDER BY date ROWS UNBOUNDED PRECEDING)
+                ORDER BY date ASC
+            """
+        else:
+            query += "SELECT date, end_date, days, usage_kwh, cost_usd FROM grouped ORDER BY date ASC"
+
+        return [
+            {
+                "date": row["date"],
+                "end_date": row["end_date"],
+                "days": row["days"],
+                "usage_kwh": _round(row["usage_kwh"]),
+                "cost_usd": _round(row["cost_usd"]),
+            }
+            for row in conn.execute(query, params)
+        ]
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    # Differencing to-date floats leaves noise like 12.299999999999997
+    return round(value, 6) if value is not None else None
@@ -0,0 +1,334 @@
+"""
+Energy rollups: hourly, daily and monthly aggregates (min/max/sum/count/last) of energy_samples.
+
+Each tier is updated incrementally from its source using a watermark, never recomputed:
+    samples -> hourly   samples in [watermark, now - settle margin)
+    hourly  -> daily    hours that are complete (bucket end <= hourly watermark)
+    daily   -> monthly  days that are complete (day end <= daily watermark)
+New partial aggregates are merged into existing buckets with an UPSERT, so a bucket can be filled over
+several runs. Daily and monthly buckets follow the server's local calendar. Samples written after the watermark
+passed their time (a retried write) are reported with note_late_samples(); the next run rebuilds their buckets.
+
+get_series_history() serves charts from the coarsest tier that still meets the requested resolution, so a year
+of data reads ~365 daily rows instead of ~500k raw samples.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core import db
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bucket start expressions (SQL) for a unix-seconds column
+_LOCAL_DAY = "CAST(strftime('%s', {col}, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)"
+_LOCAL_MONTH = "CAST(strftime('%s', {col}, 'unixepoch', 'localtime', 'start of month', 'utc') AS INTEGER)"
+_LOCAL_NEXT_DAY = "CAST(strftime('%s', {col}, 'unixepoch', 'localtime', '+1 day', 'utc') AS INTEGER)"
+
+# Nominal bucket sizes used to pick a tier (monthly is approximate)
+TIER_SECONDS = {"hourly": 3600, "daily": 86400, "monthly": 30 * 86400}
+
+# series id -> [from ts, to ts) of samples written late, rebuilt by the next run_rollups() (the scheduler runs it
+# on a worker thread, hence the lock)
+_late_ranges: Dict[int, Tuple[int, int]] = {}
+_late_lock = threading.Lock()
+
+_MERGE = """
+    ON CONFLICT(series_id, bucket) DO UPDATE SET
+        min = MIN(min, excluded.min),
+        max = MAX(max, excluded.max),
+        sum = sum + excluded.sum,
+        count = count + excluded.count,
+        last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+        last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+def _get_watermark(conn, tier: str) -> int:
+    row = conn.execute("SELECT ts FROM energy_rollup_watermarks WHERE tier = ?", (tier,)).fetchone()
+    return row["ts"] if row else 0
+
+
+def _set_watermark(conn, tier: str, ts: int) -> None:
+    conn.execute(
+        "INSERT INTO energy_rollup_watermarks (tier, ts) VALUES (?, ?) "
+        "ON CONFLICT(tier) DO UPDATE SET ts = excluded.ts",
+        (tier, ts),
+    )
+
+
+def _series_filter(series_ids: Optional[List[int]]) -> Tuple[str, List[int]]:
+    # SQL list for "series_id IN (...)": every series, or the given ones
+    if series_ids is None:
+        return "SELECT id FROM energy_series", []
+    return ", ".join("?" * len(series_ids)), list(series_ids)
+
+
+def _aggregate_hourly(conn, start: int, until: int, series_ids: Optional[List[int]] = None) -> int:
+    series, params = _series_filter(series_ids)
+    cur = conn.execute(f"""
+        INSERT INTO energy_rollup_hourly (series_id, bucket, min, max, sum, count, last, last_ts)
+        SELECT g.series_id, g.bucket, g.mn, g.mx, g.sm, g.c, s.value, g.lts
+        FROM (
+            SELECT series_id, ts - ts % 3600 AS bucket, MIN(value) AS mn, MAX(value) AS mx,
+                   SUM(value) AS sm, COUNT(*) AS c, MAX(ts) AS lts
+            FROM energy_samples
+            WHERE series_id IN ({series}) AND ts >= ? AND ts < ?
+            GROUP BY series_id, bucket
+        ) g
+        JOIN energy_samples s ON s.series_id = g.series_id AND s.ts = g.lts
+        WHERE 1
+        {_MERGE}
+    """, (*params, start, until))
+    return cur.rowcount
+
+
+def _aggregate_daily(conn, start: int, until: int, series_ids: Optional[List[int]] = None) -> int:
+    series, params = _series_filter(series_ids)
+    cur = conn.execute(f"""
+        INSERT INTO energy_rollup_daily (series_id, bucket, min, max, sum, count, last, last_ts)
+        SELECT g.series_id, g.bucket, g.mn, g.mx, g.sm, g.c, h.last, g.lts
+        FROM (
+            SELECT series_id, {_LOCAL_DAY.format(col="bucket")} AS bucket, MIN(min) AS mn, MAX(max) AS mx,
+                   SUM(sum) AS sm, SUM(count) AS c, MAX(last_ts) AS lts
+            FROM energy_rollup_hourly
+            WHERE series_id IN ({series}) AND bucket >= ? AND bucket < ?
+            GROUP BY series_id, 2
+        ) g
+        JOIN energy_rollup_hourly h ON h.series_id = g.series_id AND h.bucket = g.lts - g.lts % 3600
+        WHERE 1
+        {_MERGE}
+    """, (*params, start, until))
+    return cur.rowcount
+
+
+def _aggregate_monthly(conn, start: int, until: int, series_ids: Optional[List[int]] = None) -> int:
+    series, params = _series_filter(series_ids)
+    cur = conn.execute(f"""
+        INSERT INTO energy_rollup_monthly (series_id, bucket, min, max, sum, count, last, last_ts)
+        SELECT g.series_id, g.bucket, g.mn, g.mx, g.sm, g.c, d.last, g.lts
+        FROM (
+            SELECT series_id, {_LOCAL_MONTH.format(col="bucket")} AS bucket, MIN(min) AS mn, MAX(max) AS mx,
+                   SUM(sum) AS sm, SUM(count) AS c, MAX(last_ts) AS lts
+            FROM energy_rollup_daily
+            WHERE series_id IN ({series}) AND bucket >= ? AND bucket < ?
+            GROUP BY series_id, 2
+        ) g
+        JOIN energy_rollup_daily d ON d.series_id = g.series_id AND d.bucket = {_LOCAL_DAY.format(col="g.lts")}
+        WHERE 1
+        {_MERGE}
+    """, (*params, start, until))
+    return cur.rowcount
+
+
+def _roll_hourly(conn, until: int) -> int:
+    start = _get_watermark(conn, "hourly")
+    if until <= start:
+        return 0
+    touched = _aggregate_hourly(conn, start, until)
+    _set_watermark(conn, "hourly", until)
+    return touched
+
+
+def _roll_daily(conn) -> int:
+    start = _get_watermark(conn, "daily")
+    # Only hours the hourly tier has fully covered
+    until = _get_watermark(conn, "hourly") // 3600 * 3600
+    if until <= start:
+        return 0
+    touched = _aggregate_daily(conn, start, until)
+    _set_watermark(conn, "daily", until)
+    return touched
+
+
+def _roll_monthly(conn) -> int:
+    start = _get_watermark(conn, "monthly")
+    daily_wm = _get_watermark(conn, "daily")
+    day_end = _LOCAL_NEXT_DAY.format(col="bucket")
+    # Only days the daily tier has fully covered
+    row = conn.execute(
+        f"SELECT MAX({day_end}) AS until FROM energy_rollup_daily WHERE bucket >= ? AND {day_end} <= ?",
+        (start, daily_wm),
+    ).fetchone()
+    until = row["until"] if row and row["until"] else None
+    if until is None or until <= start:
+        return 0
+    touched = _aggregate_monthly(conn, start, until)
+    _set_watermark(conn, "monthly", until)
+    return touched
+
+
+def hourly_watermark() -> int:
+    """Samples before this timestamp are already in the hourly tier (safe to purge)."""
+    with db.reader() as conn:
+        return _get_watermark(conn, "hourly")
+
+
+def note_late_samples(rows: Iterable[Sequence[Any]]) -> None:
+    """
+    Record committed sample rows (series_id, ts, value) that may be older than the hourly watermark, e.g. a
+    retried batch, so the next run_rollups() re-aggregates the buckets the watermarks passed without them.
+    """
+    with _late_lock:
+        _merge_late(_late_ranges, ((row[0], row[1], row[1] + 1) for row in rows))
+
+
+def _merge_late(ranges: Dict[int, Tuple[int, int]], items: Iterable[Tuple[int, int, int]]) -> None:
+    for series_id, from_ts, to_ts in items:
+        lo, hi = ranges.get(series_id, (from_ts, to_ts))
+        ranges[series_id] = (min(lo, from_ts), max(hi, to_ts))
+
+
+def run_rollups(now: Optional[int] = None) -> Dict[str, int]:
+    """
+    Advance all tiers from new data only, in one transaction. Samples from the last few sampling intervals
+    are left for the next run since a retried write may still land there; buckets behind the watermarks that
+    late samples (note_late_samples) fall into are rebuilt first.
+    Returns buckets touched per tier.
+    """
+    global _late_ranges
+    now = int(time.time()) if now is None else now
+    settle = max(2 * settings.ENERGY_SAMPLE_INTERVAL_SECONDS, 300)
+    with _late_lock:
+        late, _late_ranges = _late_ranges, {}
+    try:
+        with db.writer() as conn:
+            rebuilt = {"hourly": 0, "daily": 0, "monthly": 0}
+            for series_id, (from_ts, to_ts) in late.items():
+                for tier, count in _rebuild(conn, [series_id], from_ts, to_ts).items():
+                    rebuilt[tier] += count
+            result = {
+                "hourly": _roll_hourly(conn, now - settle) + rebuilt["hourly"],
+                "daily": _roll_daily(conn) + rebuilt["daily"],
+                "monthly": _roll_monthly(conn) + rebuilt["monthly"],
+            }
+        logger.debug(f"Energy rollups updated: {result}")
+        return result
+    except Exception as e:
+        with _late_lock:
+            _merge_late(_late_ranges, ((sid, lo, hi) for sid, (lo, hi) in late.items()))
+        logger.exception(f"Energy rollup failed: {e}")
+        raise
+
+
+def rebuild_range(series_ids: List[int], from_ts: int, to_ts: int) -> Dict[str, int]:
+    """
+    Recompute the buckets of series_ids overlapping [from_ts, to_ts) that the watermarks already passed, from the
+    tier below (e.g. after samples were backfilled into the past). In one transaction, each tier's buckets are
+    deleted and re-aggregated up to that tier's watermark, so later incremental runs carry on unchanged.
+    Returns buckets written per tier.
+    """
+    with db.writer() as conn:
+        result = _rebuild(conn, series_ids, from_ts, to_ts)
+    logger.debug(f"Energy rollups rebuilt for {from_ts}-{to_ts}: {result}")
+    return result
+
+
+def _rebuild(conn, series_ids: List[int], from_ts: int, to_ts: int) -> Dict[str, int]:
+    result = {"hourly": 0, "daily": 0, "monthly": 0}
+    if not series_ids or to_ts <= from_ts:
+        return result
+    placeholders = ", ".join("?" * len(series_ids))
+    for tier, aggregate in (
+        ("hourly", _aggregate_hourly),
+        ("daily", _aggregate_daily),
+        ("monthly", _aggregate_monthly),
+    ):
+        start = _bucket_start(tier, from_ts)
+        until = min(_next_bucket(tier, to_ts - 1), _get_watermark(conn, tier))
+        if until <= start:
+            continue
+        conn.execute(
+            f"DELETE FROM energy_rollup_{tier} WHERE series_id IN ({placeholders}) AND bucket >= ? AND bucket < ?",
+            (*series_ids, start, until),
+        )
+        result[tier] = aggregate(conn, start, until, series_ids)
+    return result
+
+
+def _bucket_start(tier: str, ts: int) -> int:
+    if tier == "hourly":
+        return ts - ts % 3600
+    dt = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    if tier == "monthly":
+        dt = dt.replace(day=1)
+    return int(dt.timestamp())
+
+
+def _next_bucket(tier: str, ts: int) -> int:
+    # Start of the bucket after the one holding ts
+    if tier == "hourly":
+        return ts - ts % 3600 + 3600
+    dt = datetime.fromtimestamp(_bucket_start(tier, ts))
+    if tier == "daily":
+        dt += timedelta(days=1)
+    else:
+        dt = (dt.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return int(dt.timestamp())
+
+
+def choose_tier(from_ts: int, to_ts: int, resolution: Optional[int] = None, max_points: int = 1500) -> str:
+    """
+    Pick the tier to read. With resolution (seconds): the coarsest tier whose buckets are no larger.
+    Otherwise: the finest tier that returns at most max_points buckets. Raw samples are only used
+    inside the retention window.
+    """
+    raw_seconds = max(settings.ENERGY_SAMPLE_INTERVAL_SECONDS, 1)
+    raw_available = from_ts >= int(time.time()) - settings.ENERGY_SAMPLE_RETENTION_DAYS * 86400
+    tiers = ([("raw", raw_seconds)] if raw_available else []) + list(TIER_SECONDS.items())
+    if resolution is not None:
+        fitting = [name for name, size in tiers if size <= resolution]
+        return fitting[-1] if fitting else tiers[0][0]
+    span = max(to_ts - from_ts, 1)
+    for name, size in tiers:
+        if span / size <= max_points:
+            return name
+    return "monthly"
+
+
+def get_series_history(
+    kind: str,
+    from_ts: Optional[int] = None,
+    to_ts: Optional[int] = None,
+    resolution: Optional[int] = None,
+    max_points: int = 1500,
+) -> Dict[str, Any]:
+    """
+    Time series for one kind (power, solar, battery_level, battery_power, grid) from the best tier.
+    Returns {"tier", "data": [{ts, min, max, avg, last, count, entity_id}]} ordered by ts; defaults to the last day.
+    """
+    to_ts = int(time.time()) if to_ts is None else to_ts
+    from_ts = to_ts - 86400 if from_ts is None else from_ts
+    tier = choose_tier(from_ts, to_ts, resolution, max_points)
+    with db.reader() as conn:
+        if tier == "raw":
+            rows = conn.execute("""
+                SELECT s.ts AS ts, s.value AS min, s.value AS max, s.value AS sum, 1 AS count, s.value AS last,
+                       e.entity_id AS entity_id
+                FROM energy_samples s JOIN energy_series e ON e.id = s.series_id
+                WHERE e.kind = ? AND s.ts >= ? AND s.ts <= ?
+                ORDER BY s.ts ASC
+            """, (kind, from_ts, to_ts))
+        else:
+            rows = conn.execute(f"""
+                SELECT r.bucket AS ts, r.min, r.max, r.sum, r.count, r.last, e.entity_id AS entity_id
+                FROM energy_rollup_{tier} r JOIN energy_series e ON e.id = r.series_id
+                WHERE e.kind = ? AND r.bucket >= ? AND r.bucket <= ?
+                ORDER BY r.bucket ASC
+            """, (kind, _bucket_start(tier, from_ts), to_ts))
+        data: List[Dict[str, Any]] = [
+            {
+                "ts": row["ts"],
+                "min": row["min"],
+                "max": row["max"],
+                "avg": row["sum"] / row["count"] if row["count"] else None,
+                "last": row["last"],
+                "count": row["count"],
+                "entity_id": row["entity_id"],
+            }
+            for row in rows
+        ]
+        return {"tier": tier, "data": data}
@@ -0,0 +1,161 @@
+"""
+Energy time series: samples power, solar, battery and grid readings every ENERGY_SAMPLE_INTERVAL_SECONDS into
+energy_samples (series id, unix seconds, value) so intra-day curves survive even if the 23:59 daily snapshot
+is missed. Entities are the ones the dashboard summary resolves for each tile.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from core import db
+from core.config import settings
+from services import dashboard_summary
+from services import energy_rollups
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+# Dashboard summary tile -> series kind. Power readings are stored in kW, battery level in %.
+SAMPLED_TILES = {
+    "power": "power",
+    "solar": "solar",
+    "battery_level": "battery_level",
+    "battery_power": "battery_power",
+    "grid": "grid",
+}
+_KIND_UNITS = {"battery_level": "%"}
+
+# Rows that failed to write are retried on the next tick (bounded so a dead disk cannot grow memory)
+_MAX_PENDING_ROWS = 10_000
+_pending: List[tuple] = []
+# entity_id -> series id
+_series_ids: Dict[str, int] = {}
+
+
+def series_id(
+    conn, entity_id: str, kind: str, unit: Optional[str] = None, new_ids: Optional[Dict[str, int]] = None
+) -> int:
+    """
+    Id of entity_id's energy_series row inside a write transaction, creating the row if needed. Ids not cached
+    yet are collected in new_ids; pass them to cache_series_ids() once the transaction has committed, so a
+    rolled-back batch never leaves an id in the cache for a row that does not exist.
+    """
+    cached = _series_ids.get(entity_id)
+    if cached is not None:
+        return cached
+    conn.execute(
+        "INSERT OR IGNORE INTO energy_series (entity_id, kind, unit) VALUES (?, ?, ?)",
+        (entity_id, kind, unit if unit is not None else _KIND_UNITS.get(kind, "kW")),
+    )
+    row = conn.execute("SELECT id FROM energy_series WHERE entity_id = ?", (entity_id,)).fetchone()
+    if new_ids is not None:
+        new_ids[entity_id] = row["id"]
+    return row["id"]
+
+
+def cache_series_ids(new_ids: Dict[str, int]) -> None:
+    """Remember ids collected by series_id() after their transaction committed."""
+    _series_ids.update(new_ids)
+
+
+def read_value(kind: str, state: Dict[str, Any]) -> Optional[float]:
+    """A state's reading in the series kind's unit (kW, or % for battery_level)."""
+    if kind == "battery_level":
+        return dashboard_summary.parse_number(state.get("state"))
+    return dashboard_summary.to_kw(state)
+
+
+async def record_sample() -> int:
+    """
+    Read the current power/solar/battery/grid values and append them to energy_samples in one transaction.
+    Returns the number of rows written.
+    """
+    if not ha._is_configured():
+        return 0
+    try:
+        states = await ha.get_states_for_dashboard()
+    except Exception as e:
+        logger.warning(f"Energy sample skipped, Home Assistant unavailable: {e}")
+        return 0
+
+    interval = max(settings.ENERGY_SAMPLE_INTERVAL_SECONDS, 1)
+    now = int(time.time())
+    ts = now - now % interval  # align to the sampling grid so retries overwrite instead of duplicating
+    tiles = dashboard_summary.resolve_tiles(states)
+    index = ha.get_cached_index()
+    readings = []
+    for tile, kind in SAMPLED_TILES.items():
+        entity_id = tiles.get(tile)
+        state = index.get(entity_id) if entity_id else None
+        value = read_value(kind, state) if state else None
+        if value is not None:
+            readings.append((entity_id, kind, ts, value))
+
+    if not readings and not _pending:
+        return 0
+    new_ids: Dict[str, int] = {}
+
+    def write(conn) -> int:
+        rows = [
+            (series_id(conn, entity_id, kind, new_ids=new_ids), ts, value)
+            for entity_id, kind, ts, value in readings
+        ]
+        batch = _pending + rows
+        conn.executemany("INSERT OR REPLACE INTO energy_samples (series_id, ts, value) VALUES (?, ?, ?)", batch)
+        return len(batch)
+
+    try:
+        written = await db.run_write(write, op="energy_samples.record")
+        cache_series_ids(new_ids)
+        if _pending:
+            # Retried rows may be older than the rollup watermark by now
+            energy_rollups.note_late_samples(_pending)
+        _pending.clear()
+        return written
+    except Exception as e:
+        logger.error(f"Failed to write energy samples, will retry next tick: {e}")
+        if readings:
+            _pending.extend((_series_ids[r[0]], r[2], r[3]) for r in readings if r[0] in _series_ids)
+            del _pending[:-_MAX_PENDING_ROWS]
+        return 0
+
+
+def purge_old_samples() -> int:
+    """
+    Delete raw samples older than ENERGY_SAMPLE_RETENTION_DAYS that the hourly rollup already covers.
+    Returns rows deleted.
+    """
+    days = settings.ENERGY_SAMPLE_RETENTION_DAYS
+    if days <= 0:
+        return 0
+    cutoff = min(int(time.time()) - days * 86400, energy_rollups.hourly_watermark())
+    deleted = 0
+    with db.writer() as conn:
+        # Per series so each delete is a primary-key range scan
+        for row in conn.execute("SELECT id FROM energy_series").fetchall():
+            cur = conn.execute("DELETE FROM energy_samples WHERE series_id = ? AND ts < ?", (row["id"], cutoff))
+            deleted += cur.rowcount
+    logger.info(f"Purged {deleted} energy samples older than {days} days")
+    return deleted
+
+
+def get_samples(kind: str, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Raw samples for one series kind (e.g. 'solar'), ordered by time: [{ts, value, entity_id}]."""
+    with db.reader() as conn:
+        query = """
+            SELECT s.ts, s.value, e.entity_id FROM energy_samples s
+            JOIN energy_series e ON e.id = s.series_id
+            WHERE e.kind = ?
+        """
+        params: List[Any] = [kind]
+        if from_ts is not None:
+            query += " AND s.ts >= ?"
+            params.append(from_ts)
+        if to_ts is not None:
+            query += " AND s.ts <= ?"
+            params.append(to_ts)
+        query += " ORDER BY s.ts ASC"
+        return [
+            {"ts": row["ts"], "value": row["value"], "entity_id": row["entity_id"]}
+            for row in conn.execute(query, params)
+        ]
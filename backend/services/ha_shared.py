@@ -0,0 +1,156 @@
+"""
+HA states shared between workers in multi-worker mode (MULTI_WORKER), so Home Assistant sees one client however
+many workers run.
+
+The leader (holder of the scheduler lease, core/lease.py) is the only worker that polls /api/states or runs the
+WebSocket mirror. Every MULTI_WORKER_SYNC_INTERVAL seconds it refreshes its snapshot if the TTL ran out and, when
+the revision changed, writes homeassistant.export_state() to states.json in the state directory (tmpfs under
+/dev/shm by default; written to a temp file and renamed, so readers never see half a file). An unchanged
+snapshot only gets its mtime bumped, which tells followers the leader is alive and its data current.
+
+Followers install a loader in services/homeassistant.py: on a cache miss (snapshot older than the sync
+interval) they stat the file, re-read and import it only when it was replaced, and fall back to calling HA
+themselves when it is missing or older than MULTI_WORKER_LEASE_TTL (no live leader).
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from core import db
+from core import executors
+from core.config import settings
+from core.responses import dumps
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+_STATE_FILE = "states.json"
+
+
+def state_dir() -> Path:
+    """MULTI_WORKER_STATE_DIR, or a directory per database under /dev/shm (the temp dir without tmpfs)."""
+    if settings.MULTI_WORKER_STATE_DIR:
+        return Path(settings.MULTI_WORKER_STATE_DIR)
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # Workers of one deployment share a database file; separate deployments on a host must not collide
+    tag = f"{zlib.crc32(str(Path(db.get_db_path()).resolve()).encode()):08x}"
+    return Path(base) / f"home-automation-{tag}"
+
+
+def _write(path: Path, body: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def _read(path: Path) -> Tuple[Tuple[int, int], Dict[str, Any]]:
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        data = json.loads(f.read())
+    return (st.st_ino, st.st_size), data
+
+
+class SharedStates:
+    def __init__(self):
+        self.role: Optional[str] = None  # "leader", "follower" or None (single worker)
+        self._task: Optional[asyncio.Task] = None
+        # (boot_id, revision) last written by this worker as leader
+        self._published: Optional[Tuple[str, int]] = None
+        # (inode, size) of the file last imported as follower; a rename gives the file a new inode
+        self._loaded: Optional[Tuple[int, int]] = None
+        self.stats: Dict[str, int] = {"published": 0, "heartbeats": 0, "loads": 0, "unchanged": 0, "stale": 0}
+
+    @property
+    def path(self) -> Path:
+        return state_dir() / _STATE_FILE
+
+    async def start_leader(self) -> None:
+        """Stop following and keep the shared file current from this worker's snapshot."""
+        ha.set_shared_loader(None)
+        self.role = "leader"
+        self._published = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._lead(), name="ha-shared-publisher")
+
+    async def start_follower(self) -> None:
+        await self._stop_task()
+        self.role = "follower"
+        self._loaded = None
+        ha.set_shared_loader(self.load)
+
+    async def stop(self) -> None:
+        await self._stop_task()
+        ha.set_shared_loader(None)
+        self.role = None
+
+    async def _stop_task(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _lead(self) -> None:
+        while True:
+            if ha._is_configured():
+                try:
+                    if not ha._cache_is_fresh():
+                        await ha.get_states()  # one upstream fetch per HA_STATES_CACHE_TTL, for every worker
+                    await self.publish()
+                except Exception as e:
+                    logger.warning(f"Could not refresh/publish the shared HA states: {e}")
+            await asyncio.sleep(max(settings.MULTI_WORKER_SYNC_INTERVAL, 0.1))
+
+    async def publish(self) -> None:
+        """Write the snapshot if it changed since the last publish; otherwise just mark the file as current."""
+        if not ha.has_snapshot() or not ha._cache_is_fresh():
+            return  # let the file age so followers stop trusting data the leader cannot refresh
+        state = ha.export_state()
+        version = (state["boot_id"], state["revision"])
+        path = self.path
+        if version == self._published:
+            try:
+                await executors.run_blocking("fs", "ha_shared.heartbeat", os.utime, path)
+                self.stats["heartbeats"] += 1
+                return
+            except FileNotFoundError:
+                pass  # removed (tmpfs cleared); write it again
+        await executors.run_blocking("fs", "ha_shared.publish", lambda: _write(path, dumps(state)))
+        self._published = version
+        self.stats["published"] += 1
+
+    async def load(self) -> bool:
+        """Follower loader for services/homeassistant.py: True once the local snapshot matches a current file."""
+        path = self.path
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if time.time() - st.st_mtime > settings.MULTI_WORKER_LEASE_TTL:
+            self.stats["stale"] += 1
+            return False
+        if (st.st_ino, st.st_size) == self._loaded and ha.has_snapshot():
+            ha.touch_snapshot()
+            self.stats["unchanged"] += 1
+            return True
+        signature, data = await executors.run_blocking("fs", "ha_shared.load", _read, path)
+        ha.import_state(data)
+        self._loaded = signature
+        self.stats["loads"] += 1
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {"role": self.role, "file": str(self.path) if self.role else None, **self.stats}
+
+
+shared_states = SharedStates()
@@ -0,0 +1,153 @@
+"""
+Home Assistant WebSocket mirror: keeps the entity states snapshot in services/homeassistant.py current
+from HA's /api/websocket so dashboard and entity endpoints need no upstream calls.
+
+Flow per connection: auth -> subscribe_events(state_changed) -> get_states (full resync) -> apply events.
+On disconnect the snapshot falls back to the REST TTL cache and we reconnect with exponential backoff.
+"""
+import asyncio
+import json
+import logging
+import random
+from typing import Any
+
+import websockets
+from websockets.asyncio.client import connect
+
+from core.config import settings
+from services import homeassistant as ha
+
+logger = logging.getLogger(__name__)
+
+
+class HomeAssistantAuthError(Exception):
+    """HA rejected the access token; retrying with the same token will not help quickly."""
+
+
+def _websocket_url() -> str:
+    base = ha._base_url()
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/api/websocket"
+
+
+class HomeAssistantMirror:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._next_id = 1
+        self.connected = False
+        self.synced = False
+        self.stats: dict[str, int] = {"connects": 0, "disconnects": 0, "resyncs": 0, "events": 0}
+
+    def start(self) -> None:
+        """Start the background connection loop. No-op unless HA and HOME_ASSISTANT_WEBSOCKET are configured."""
+        if not settings.HOME_ASSISTANT_WEBSOCKET or not ha._is_configured():
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="ha-websocket-mirror")
+            logger.info("Home Assistant WebSocket mirror started")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._set_synced(False)
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "enabled": settings.HOME_ASSISTANT_WEBSOCKET,
+            "connected": self.connected,
+            "synced": self.synced,
+            **self.stats,
+        }
+
+    def _set_synced(self, synced: bool) -> None:
+        self.synced = synced
+        ha.set_live_mirror(synced)
+
+    def _message_id(self) -> int:
+        msg_id = self._next_id
+        self._next_id += 1
+        return msg_id
+
+    async def _run(self) -> None:
+        delay = settings.HA_WEBSOCKET_RECONNECT_MIN
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except HomeAssistantAuthError as e:
+                logger.error(f"Home Assistant WebSocket auth failed: {e}")
+                delay = settings.HA_WEBSOCKET_RECONNECT_MAX
+            except (OSError, websockets.WebSocketException, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Home Assistant WebSocket disconnected: {e}")
+            except Exception:
+                # Unexpected message shape, listener bug, ...: log it and reconnect rather than end the mirror
+                logger.exception("Home Assistant WebSocket session failed")
+            finally:
+                if self.connected:
+                    self.stats["disconnects"] += 1
+                    # The connection worked; start the backoff over
+                    delay = settings.HA_WEBSOCKET_RECONNECT_MIN
+                self.connected = False
+                self._set_synced(False)
+
+            # Full jitter so several backends do not reconnect in lockstep after an HA restart
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * 2, settings.HA_WEBSOCKET_RECONNECT_MAX)
+
+    async def _session(self) -> None:
+        async with connect(_websocket_url(), max_size=None, open_timeout=settings.HA_HTTP_CONNECT_TIMEOUT) as ws:
+            await self._authenticate(ws)
+            self.connected = True
+            self.stats["connects"] += 1
+            self._next_id = 1
+
+            subscribe_id = self._message_id()
+            await ws.send(json.dumps({"id": subscribe_id, "type": "subscribe_events", "event_type": "state_changed"}))
+            # Subscribe first, then fetch states: events racing the snapshot are either already in it
+            # or arrive after the result, so nothing is lost.
+            states_id = self._message_id()
+            await ws.send(json.dumps({"id": states_id, "type": "get_states"}))
+
+            async for raw in ws:
+                msg = json.loads(raw)
+                msg_type = msg.get("type")
+                if msg_type == "event" and msg.get("id") == subscribe_id:
+                    self._handle_event(msg.get("event") or {})
+                elif msg_type == "result" and msg.get("id") == states_id:
+                    if not msg.get("success"):
+                        raise ValueError(f"get_states failed: {msg.get('error')}")
+                    ha.set_states_snapshot(msg.get("result") or [])
+                    self.stats["resyncs"] += 1
+                    self._set_synced(True)
+                    logger.info(f"Home Assistant WebSocket synced {len(msg.get('result') or [])} entities")
+                elif msg_type == "result" and not msg.get("success"):
+                    raise ValueError(f"Home Assistant command {msg.get('id')} failed: {msg.get('error')}")
+
+    async def _authenticate(self, ws) -> None:
+        hello = json.loads(await ws.recv())
+        if hello.get("type") != "auth_required":
+            raise ValueError(f"Unexpected first message: {hello.get('type')}")
+        await ws.send(json.dumps({"type": "auth", "access_token": settings.HOME_ASSISTANT_TOKEN}))
+        reply = json.loads(await ws.recv())
+        if reply.get("type") != "auth_ok":
+            raise HomeAssistantAuthError(reply.get("message") or reply.get("type"))
+
+    def _handle_event(self, event: dict[str, Any]) -> None:
+        if event.get("event_type") != "state_changed":
+            return
+        data = event.get("data") or {}
+        self.stats["events"] += 1
+        if self.synced:
+            ha.apply_state_change(data.get("entity_id"), data.get("new_state"))
+
+
+ha_mirror = HomeAssistantMirror()
@@ -1,18 +1,68 @@
 """
 Home Assistant REST API client. Single point of contact with HA; URL and token come from settings.
+When the WebSocket mirror (services/ha_websocket.py) is connected it keeps the states snapshot here
+current, and reads are answered without any REST call.
 """
+import asyncio
+import json
 import logging
-from typing import Any
+import random
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable
+from urllib.parse import quote
 
 import httpx
+from core import metrics
 from core.config import settings
+from core.responses import dumps
 
 logger = logging.getLogger(__name__)
 
-# Optional short cache to avoid hammering HA on every request (seconds)
-_STATES_CACHE_TTL = 10
+# Short cache of the full /api/states snapshot to avoid hammering HA on every request.
+# TTL and stale-while-revalidate come from settings (HA_STATES_CACHE_TTL, HA_STATES_STALE_WHILE_REVALIDATE).
 _states_cache: list[dict[str, Any]] | None = None
 _states_cache_time: float = 0
+# entity_id -> state object for the cached snapshot (answers get_entity without another request)
+_states_index: dict[str, dict[str, Any]] = {}
+# Set when incremental updates changed _states_index; the list view is rebuilt on next read
+_states_list_dirty: bool = False
+# True while the WebSocket mirror is connected and synced; the snapshot never expires in that mode
+_live_mirror: bool = False
+# Bumped when entities are added or removed (not on state changes); lets callers cache entity resolution
+_entity_set_version: int = 0
+# Monotonic revision of the snapshot: bumped once per batch of changes (REST refresh diff or WebSocket event).
+# Per-entity revisions and tombstones for removed entities answer "what changed since revision N".
+_revision: int = 0
+_entity_revisions: dict[str, int] = {}
+_removed_revisions: dict[str, int] = {}
+_MAX_TOMBSTONES = 5000
+# Oldest revision changes_since() can answer incrementally (older clients get a full list)
+_revision_floor: int = 0
+# Distinguishes revisions of this process from a previous run in ETags (revisions restart at 0)
+_boot_id = f"{random.getrandbits(32):08x}"
+# Entities published by other sources (MQTT ingestion); overlaid on every HA snapshot so refreshes keep them
+_external_states: dict[str, dict[str, Any]] = {}
+# Callbacks receiving {entity_id: new_state or None (removed)} whenever the snapshot changes
+_change_listeners: list[Callable[[dict[str, dict[str, Any] | None]], None]] = []
+# Multi-worker follower (services/ha_shared.py): loads the leader's published snapshot instead of calling HA and
+# returns False when there is no recent one (the caller then asks HA itself)
+_shared_loader: Callable[[], Awaitable[bool]] | None = None
+# The single upstream /api/states fetch in flight; concurrent cache misses await this instead of fetching again
+_states_inflight: "asyncio.Task[list[dict[str, Any]]] | None" = None
+_cache_stats: dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "stale_served": 0,
+    "upstream_fetches": 0,
+    "upstream_errors": 0,
+    "mirror_updates": 0,
+    "snapshot_builds": 0,
+}
+
+# Shared pooled client (created in start_client() on app startup, closed in close_client() on shutdown)
+_client: httpx.AsyncClient | None = None
 
 
 def _is_configured() -> bool:
@@ -32,46 +82,618 @@ def _headers() -> dict[str, str]:
     }
 
 
-async def get_states(domain: str | None = None) -> list[dict[str, Any]]:
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HA_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HA_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HA_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(settings.HA_HTTP_TIMEOUT, connect=settings.HA_HTTP_CONNECT_TIMEOUT)
+    http2 = settings.HA_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HA_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        base_url=_base_url(),
+        headers=_headers(),
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+    )
+
+
+async def start_client() -> None:
+    """Open the shared HA client. Called from the app startup hook; safe to call more than once."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    """Close the shared HA client and its pooled connections. Called from the app shutdown hook."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily (e.g. scripts or tests that skip the startup hook)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+# Pre-bound latency series per upstream endpoint (see core/metrics.py)
+_UPSTREAM_DURATION = {
+    name: metrics.HA_UPSTREAM_DURATION.labels(name) for name in ("states", "entity", "history")
+}
+
+
+async def _upstream_get(endpoint: str, path: str, **kwargs: Any) -> httpx.Response:
+    """GET path from HA, recording latency and failures (timeouts, transport errors, 4xx/5xx) under endpoint."""
+    start = time.perf_counter()
+    try:
+        resp = await _get_client().get(path, **kwargs)
+    except httpx.TimeoutException:
+        metrics.HA_UPSTREAM_ERRORS.labels(endpoint, "timeout").inc()
+        raise
+    except httpx.HTTPError:
+        metrics.HA_UPSTREAM_ERRORS.labels(endpoint, "transport").inc()
+        raise
+    finally:
+        _UPSTREAM_DURATION[endpoint].observe(time.perf_counter() - start)
+    if resp.status_code >= 400 and resp.status_code != 404:
+        metrics.HA_UPSTREAM_ERRORS.labels(endpoint, f"http_{resp.status_code // 100}xx").inc()
+    return resp
+
+
+def _cache_age() -> float:
+    return time.monotonic() - _states_cache_time
+
+
+def _cache_is_fresh() -> bool:
+    if _states_cache is None:
+        return False
+    if _live_mirror:
+        return True
+    if _shared_loader is not None:
+        return _cache_age() < settings.MULTI_WORKER_SYNC_INTERVAL
+    ttl = settings.HA_STATES_CACHE_TTL
+    return ttl > 0 and _cache_age() < ttl
+
+
+def _snapshot() -> list[dict[str, Any]]:
+    """Return the cached state list, rebuilding it from the index after incremental updates."""
+    global _states_cache, _states_list_dirty
+    if _states_list_dirty:
+        _states_cache = list(_states_index.values())
+        _states_list_dirty = False
+    return _states_cache
+
+
+class StatesSnapshot:
     """
-    Fetch all entity states from Home Assistant. Optionally filter by domain (e.g. 'light', 'sensor').
-    Returns list of HA state objects; raises httpx.HTTPStatusError on HA errors.
+    Read-side view of one snapshot, built once per change instead of filtering the state list per request:
+    buckets by domain (plus the dashboard domains, in snapshot order), hash indexes by entity_id and
+    friendly_name, and the projected JSON bytes of each bucket/entity, serialized on first use. Read-only.
     """
-    if not _is_configured():
-        return []
 
-    url = f"{_base_url()}/api/states"
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.get(url, headers=_headers())
+    __slots__ = ("states", "revision", "_by_id", "_by_domain", "_by_name", "_dashboard", "_json")
+
+    def __init__(self, states: list[dict[str, Any]], revision: int = 0):
+        self.states = states
+        self.revision = revision
+        self._by_id: dict[str, dict[str, Any]] = {}
+        self._by_domain: dict[str, list[dict[str, Any]]] = {}
+        self._by_name: dict[str, dict[str, Any]] = {}
+        self._dashboard: list[dict[str, Any]] = []
+        # ("all"|"domain"|"dashboard"|"entity", key) -> projected JSON
+        self._json: dict[tuple[str, str], bytes] = {}
+        for state in states:
+            entity_id = state.get("entity_id") or ""
+            if entity_id:
+                self._by_id[entity_id] = state
+            domain, dot, _ = entity_id.partition(".")
+            if dot:
+                self._by_domain.setdefault(domain, []).append(state)
+            if domain in _DASHBOARD_DOMAINS:
+                self._dashboard.append(state)
+            name = (state.get("attributes") or {}).get("friendly_name")
+            if name is not None:
+                self._by_name.setdefault(name, state)  # first match wins, like a scan would
+
+    def get(self, entity_id: str) -> dict[str, Any] | None:
+        return self._by_id.get(entity_id)
+
+    def by_friendly_name(self, name: str) -> dict[str, Any] | None:
+        return self._by_name.get(name)
+
+    def domain(self, domain: str | None = None) -> list[dict[str, Any]]:
+        """States of one domain (all states for None)."""
+        return self.states if not domain else self._by_domain.get(domain, [])
+
+    @property
+    def dashboard(self) -> list[dict[str, Any]]:
+        return self._dashboard
+
+    def _memo_json(self, key: tuple[str, str], build: Callable[[], Any]) -> bytes:
+        body = self._json.get(key)
+        if body is None:
+            body = self._json[key] = dumps(build())
+        return body
+
+    def states_json(self, domain: str | None = None) -> bytes:
+        """project_states() of domain(domain), serialized."""
+        key = ("domain", domain) if domain else ("all", "")
+        return self._memo_json(key, lambda: project_states(self.domain(domain)))
+
+    def dashboard_json(self) -> bytes:
+        return self._memo_json(("dashboard", ""), lambda: project_states(self._dashboard))
+
+    def entity_json(self, entity_id: str) -> bytes | None:
+        state = self._by_id.get(entity_id)
+        if state is None:
+            return None
+        return self._memo_json(("entity", entity_id), lambda: project_state(state))
+
+
+_EMPTY_SNAPSHOT = StatesSnapshot([])
+# View of the current _states_cache list; rebuilt when that list is replaced (refresh or incremental update)
+_view: StatesSnapshot | None = None
+
+
+def _states_view() -> StatesSnapshot:
+    global _view
+    states = _snapshot()
+    if states is None:
+        return _EMPTY_SNAPSHOT
+    if _view is None or _view.states is not states:
+        _view = StatesSnapshot(states, _revision)
+        _cache_stats["snapshot_builds"] += 1
+    return _view
+
+
+def add_change_listener(listener: Callable[[dict[str, dict[str, Any] | None]], None]) -> None:
+    """Register a callback for snapshot changes. It runs on the event loop and must not block."""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def remove_change_listener(listener: Callable[[dict[str, dict[str, Any] | None]], None]) -> None:
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+
+def _notify_changes(changes: dict[str, dict[str, Any] | None]) -> None:
+    for listener in list(_change_listeners):
+        try:
+            listener(changes)
+        except Exception:
+            logger.exception("State change listener failed")
+
+
+def _diff_snapshot(
+    old_index: dict[str, dict[str, Any]], new_index: dict[str, dict[str, Any]]
+) -> dict[str, dict[str, Any] | None]:
+    """Entities whose state or last_updated differs between two snapshots; removed entities map to None."""
+    changes: dict[str, dict[str, Any] | None] = {}
+    for entity_id, new in new_index.items():
+        old = old_index.get(entity_id)
+        if old is None or old.get("last_updated") != new.get("last_updated") or old.get("state") != new.get("state"):
+            changes[entity_id] = new
+    for entity_id in old_index.keys() - new_index.keys():
+        changes[entity_id] = None
+    return changes
+
+
+def _record_changes(changes: dict[str, dict[str, Any] | None]) -> None:
+    """Bump the revision for a batch of changes, update per-entity revisions, and notify listeners."""
+    global _revision, _revision_floor
+    _revision += 1
+    for entity_id, state in changes.items():
+        if state is None:
+            _entity_revisions.pop(entity_id, None)
+            _removed_revisions[entity_id] = _revision
+        else:
+            _entity_revisions[entity_id] = _revision
+            _removed_revisions.pop(entity_id, None)
+    if len(_removed_revisions) > _MAX_TOMBSTONES:
+        # Forget the oldest tombstones; clients older than that get a full resync
+        oldest = sorted(_removed_revisions.items(), key=lambda item: item[1])[: len(_removed_revisions) - _MAX_TOMBSTONES]
+        for entity_id, rev in oldest:
+            del _removed_revisions[entity_id]
+            _revision_floor = max(_revision_floor, rev)
+    if _change_listeners:
+        _notify_changes(changes)
+
+
+def _store_snapshot(states: list[dict[str, Any]]) -> None:
+    global _states_cache, _states_cache_time, _states_index, _states_list_dirty, _entity_set_version
+    old_index = _states_index
+    _states_cache = states
+    _states_cache_time = time.monotonic()
+    _states_index = {s.get("entity_id"): s for s in states if s.get("entity_id")}
+    _states_list_dirty = False
+    if _external_states:
+        _states_index.update(_external_states)
+        _states_list_dirty = True
+    if old_index.keys() != _states_index.keys():
+        _entity_set_version += 1
+    changes = _diff_snapshot(old_index, _states_index)
+    if changes:
+        _record_changes(changes)
+
+
+async def _fetch_states_upstream() -> list[dict[str, Any]]:
+    """Download /api/states once and store it as the cached snapshot."""
+    _cache_stats["upstream_fetches"] += 1
+    try:
+        resp = await _upstream_get("states", "/api/states")
         resp.raise_for_status()
         states: list[dict[str, Any]] = resp.json()
+    except Exception:
+        _cache_stats["upstream_errors"] += 1
+        raise
+    _store_snapshot(states)
+    return _snapshot()
+
+
+async def _fetch_states_shared() -> list[dict[str, Any]]:
+    """Follower: adopt the leader's published snapshot; go to HA only when there is none recent enough."""
+    try:
+        if await _shared_loader():
+            return _snapshot()
+    except Exception as e:
+        logger.warning(f"Could not load the shared states snapshot, asking Home Assistant: {e}")
+    return await _fetch_states_upstream()
+
+
+def set_shared_loader(loader: Callable[[], Awaitable[bool]] | None) -> None:
+    """Install (follower) or remove (leader, single worker) the multi-worker snapshot loader."""
+    global _shared_loader
+    _shared_loader = loader
+
+
+def has_snapshot() -> bool:
+    return _states_cache is not None
+
+
+def touch_snapshot() -> None:
+    """Mark the snapshot as just confirmed current (a follower found the leader's copy unchanged)."""
+    global _states_cache_time
+    _states_cache_time = time.monotonic()
+
+
+def export_state() -> dict[str, Any]:
+    """The snapshot plus its revision bookkeeping, for multi-worker followers (see import_state())."""
+    return {
+        "boot_id": _boot_id,
+        "revision": _revision,
+        "revision_floor": _revision_floor,
+        "states": _snapshot(),
+        "entity_revisions": dict(_entity_revisions),
+        "removed_revisions": dict(_removed_revisions),
+    }
+
+
+def import_state(data: dict[str, Any]) -> None:
+    """
+    Adopt a leader's export_state() wholesale, including its boot id and revisions, so ETags and ?since= answers
+    agree whichever worker serves a request. Listeners (SSE streams) get the entities that differ from before.
+    """
+    global _states_cache, _states_cache_time, _states_index, _states_list_dirty, _entity_set_version
+    global _boot_id, _revision, _revision_floor
+    old_index = _states_index
+    _states_cache = data["states"]
+    _states_cache_time = time.monotonic()
+    _states_index = {s.get("entity_id"): s for s in _states_cache if s.get("entity_id")}
+    _states_list_dirty = False
+    if old_index.keys() != _states_index.keys():
+        _entity_set_version += 1
+    _boot_id = data["boot_id"]
+    _revision = data["revision"]
+    _revision_floor = data["revision_floor"]
+    _entity_revisions.clear()
+    _entity_revisions.update(data["entity_revisions"])
+    _removed_revisions.clear()
+    _removed_revisions.update(data["removed_revisions"])
+    changes = _diff_snapshot(old_index, _states_index)
+    if changes and _change_listeners:
+        _notify_changes(changes)
+
+
+def set_states_snapshot(states: list[dict[str, Any]]) -> None:
+    """Replace the snapshot with a full state list from the WebSocket mirror and mark it live."""
+    global _live_mirror
+    _store_snapshot(states)
+    _live_mirror = True
+
+
+def apply_state_change(entity_id: str, new_state: dict[str, Any] | None) -> None:
+    """Apply one state_changed event from the WebSocket mirror. new_state None means the entity was removed."""
+    global _states_cache_time, _states_list_dirty, _entity_set_version
+    if _states_cache is None or not entity_id:
+        return
+    if new_state is None:
+        if _states_index.pop(entity_id, None) is None:
+            return
+        _entity_set_version += 1
+    else:
+        if entity_id not in _states_index:
+            _entity_set_version += 1
+        _states_index[entity_id] = new_state
+    _states_list_dirty = True
+    _states_cache_time = time.monotonic()
+    _cache_stats["mirror_updates"] += 1
+    _record_changes({entity_id: new_state})
+
+
+def apply_external_states(states: dict[str, dict[str, Any]]) -> None:
+    """
+    Publish a batch of states from a source other than HA (e.g. MQTT ingestion) as one revision. They stay in
+    the snapshot across HA refreshes; before the first snapshot they are only kept for it.
+    """
+    global _states_list_dirty, _entity_set_version
+    if not states:
+        return
+    _external_states.update(states)
+    if _states_cache is None:
+        return
+    if not _states_index.keys() >= states.keys():
+        _entity_set_version += 1
+    _states_index.update(states)
+    _states_list_dirty = True
+    _record_changes(dict(states))
+
+
+def set_live_mirror(active: bool) -> None:
+    """Mark whether the WebSocket mirror is keeping the snapshot current. When it drops, the TTL applies again."""
+    global _live_mirror
+    _live_mirror = bool(active)
+
 
-    if domain:
-        prefix = f"{domain}."
-        states = [s for s in states if s.get("entity_id", "").startswith(prefix)]
+def _log_background_refresh_error(task: "asyncio.Task[list[dict[str, Any]]]") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background Home Assistant state refresh failed: %s", task.exception())
 
-    return states
+
+def _start_states_fetch() -> "asyncio.Task[list[dict[str, Any]]]":
+    """Return the in-flight fetch task, starting one if none is running (single-flight)."""
+    global _states_inflight
+    if _states_inflight is None or _states_inflight.done():
+        fetch = _fetch_states_shared if _shared_loader is not None else _fetch_states_upstream
+        _states_inflight = asyncio.ensure_future(fetch())
+    return _states_inflight
+
+
+async def _get_all_states(timeout: float | None = None) -> list[dict[str, Any]]:
+    """
+    Return the full state list, from cache when fresh. On a miss only one upstream fetch runs;
+    concurrent callers await the same task. timeout bounds how long this caller waits.
+    """
+    if _cache_is_fresh():
+        _cache_stats["hits"] += 1
+        return _snapshot()
+
+    ttl = settings.HA_STATES_CACHE_TTL
+    if (
+        _states_cache is not None
+        and ttl > 0
+        and settings.HA_STATES_STALE_WHILE_REVALIDATE
+        and _cache_age() < ttl + settings.HA_STATES_MAX_STALE
+    ):
+        _cache_stats["stale_served"] += 1
+        if _states_inflight is None or _states_inflight.done():
+            _start_states_fetch().add_done_callback(_log_background_refresh_error)
+        return _snapshot()
+
+    _cache_stats["misses"] += 1
+    if _states_inflight is not None and not _states_inflight.done():
+        _cache_stats["coalesced"] += 1
+    task = _start_states_fetch()
+    # shield: one caller timing out or disconnecting must not cancel the fetch the others are awaiting
+    if timeout is not None:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    return await asyncio.shield(task)
+
+
+def entity_set_version() -> int:
+    """Counter that changes whenever the set of known entities changes."""
+    return _entity_set_version
+
+
+def get_cached_index() -> dict[str, dict[str, Any]]:
+    """entity_id -> state for the current snapshot (read-only; call get_states() first to refresh it)."""
+    return _states_index
+
+
+def states_revision() -> int:
+    """Current snapshot revision (increases whenever any entity changes)."""
+    return _revision
+
+
+def states_etag(variant: str = "") -> str:
+    """ETag for a response derived from the current snapshot; variant distinguishes projections of it."""
+    return f'W/"{_boot_id}-{_revision}{"-" + variant if variant else ""}"'
+
+
+def entity_etag(entity_id: str) -> str | None:
+    """ETag for one entity from its own revision, or None when the snapshot is not fresh enough to vouch for it."""
+    rev = _entity_revisions.get(entity_id)
+    if rev is None or not _cache_is_fresh():
+        return None
+    return f'W/"{_boot_id}-e{rev}"'
+
+
+def changes_since(
+    since: int, states: list[dict[str, Any]]
+) -> tuple[list[dict[str, Any]], list[str]] | None:
+    """
+    Entities in states changed after revision since, plus entity_ids removed after it.
+    Returns None when since cannot be answered incrementally (too old, or from before a restart).
+    """
+    if since < _revision_floor or since > _revision:
+        return None
+    changed = [s for s in states if _entity_revisions.get(s.get("entity_id"), 0) > since]
+    removed = [entity_id for entity_id, rev in _removed_revisions.items() if rev > since]
+    return changed, removed
+
+
+def get_cache_stats() -> dict[str, Any]:
+    """Counters for the states cache (hits, misses, coalesced waiters, upstream fetches) plus snapshot age."""
+    return {
+        **_cache_stats,
+        "ttl_seconds": settings.HA_STATES_CACHE_TTL,
+        "stale_while_revalidate": settings.HA_STATES_STALE_WHILE_REVALIDATE,
+        "live_mirror": _live_mirror,
+        "shared_follower": _shared_loader is not None,
+        "revision": _revision,
+        "cached_entities": len(_states_index) if _states_cache is not None else 0,
+        "age_seconds": round(_cache_age(), 3) if _states_cache is not None else None,
+    }
+
+
+def clear_states_cache() -> None:
+    """Drop the cached snapshot so the next read goes to HA."""
+    global _states_cache, _states_cache_time, _states_index, _states_list_dirty, _revision_floor
+    _states_cache = None
+    _states_cache_time = 0
+    _states_index = {}
+    _states_list_dirty = False
+    _entity_revisions.clear()
+    _removed_revisions.clear()
+    # Nothing before the next full snapshot can be answered incrementally
+    _revision_floor = _revision + 1
+
+
+async def get_states_snapshot(timeout: float | None = None) -> StatesSnapshot:
+    """
+    The current snapshot's StatesSnapshot (refreshed like get_states()); an empty one if HA is not configured.
+    Raises httpx.HTTPStatusError on HA errors.
+    """
+    if not _is_configured():
+        return _EMPTY_SNAPSHOT
+    await _get_all_states(timeout=timeout)
+    return _states_view()
+
+
+async def get_states(domain: str | None = None, timeout: float | None = None) -> list[dict[str, Any]]:
+    """
+    Fetch all entity states from Home Assistant. Optionally filter by domain (e.g. 'light', 'sensor').
+    Served from the states cache when fresh; timeout bounds how long this call waits for HA.
+    Returns list of HA state objects; raises httpx.HTTPStatusError on HA errors.
+    """
+    view = await get_states_snapshot(timeout=timeout)
+    return list(view.domain(domain))
+
+
+# Attributes kept per domain when HA_ATTRIBUTE_ALLOWLIST is not set. Weather drops its (large) forecast list.
+_DEFAULT_ATTRIBUTE_ALLOWLIST: dict[str, list[str]] = {
+    "weather": [
+        "friendly_name", "condition", "temperature", "temperature_unit", "apparent_temperature", "dew_point",
+        "humidity", "pressure", "pressure_unit", "wind_speed", "wind_speed_unit", "wind_bearing",
+        "visibility", "visibility_unit", "cloud_coverage", "uv_index", "attribution", "supported_features",
+    ],
+}
+_attribute_allowlist: dict[str, frozenset[str]] | None = None
+
+
+def _get_attribute_allowlist() -> dict[str, frozenset[str]]:
+    global _attribute_allowlist
+    if _attribute_allowlist is None:
+        raw = _DEFAULT_ATTRIBUTE_ALLOWLIST
+        if (settings.HA_ATTRIBUTE_ALLOWLIST or "").strip():
+            try:
+                raw = json.loads(settings.HA_ATTRIBUTE_ALLOWLIST)
+            except ValueError as e:
+                logger.error(f"Invalid HA_ATTRIBUTE_ALLOWLIST JSON, using default: {e}")
+        _attribute_allowlist = {domain: frozenset(attrs) for domain, attrs in raw.items()}
+    return _attribute_allowlist
+
+
+_drop_fields_cache: tuple[str, frozenset[str]] = ("", frozenset())
+
+
+def _drop_fields() -> frozenset[str]:
+    global _drop_fields_cache
+    raw = settings.HA_DROP_STATE_FIELDS or ""
+    if _drop_fields_cache[0] != raw:
+        _drop_fields_cache = (raw, frozenset(f.strip() for f in raw.split(",") if f.strip()))
+    return _drop_fields_cache[1]
+
+
+def parse_fields(fields: str | None) -> dict[str, Any] | None:
+    """
+    Parse a fields= projection such as "entity_id,state,attributes.unit_of_measurement" into a tree
+    ({"entity_id": True, "state": True, "attributes": {"unit_of_measurement": True}}). None/empty = no projection.
+    """
+    if not fields or not fields.strip():
+        return None
+    tree: dict[str, Any] = {}
+    for path in fields.split(","):
+        parts = [p for p in path.strip().split(".") if p]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break  # parent already selected whole
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    return tree or None
+
+
+def _select(value: Any, tree: dict[str, Any]) -> dict[str, Any]:
+    out = {}
+    for key, sub in tree.items():
+        if key in value:
+            v = value[key]
+            out[key] = v if sub is True or not isinstance(v, dict) else _select(v, sub)
+    return out
+
+
+def project_state(state: dict[str, Any], fields: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Shape one HA state for API responses: drop HA_DROP_STATE_FIELDS, apply the domain attribute allow-list,
+    then the optional fields= tree from parse_fields(). Returns a new dict; the cached state is not modified.
+    """
+    drop = _drop_fields()
+    out = {k: v for k, v in state.items() if k not in drop}
+    allowed = _get_attribute_allowlist().get((state.get("entity_id") or "").split(".", 1)[0])
+    if allowed is not None and isinstance(out.get("attributes"), dict):
+        out["attributes"] = {k: v for k, v in out["attributes"].items() if k in allowed}
+    if fields:
+        out = _select(out, fields)
+    return out
+
+
+def project_states(states: list[dict[str, Any]], fields: str | None = None) -> list[dict[str, Any]]:
+    """project_state() over a list; fields is the raw fields= query string."""
+    tree = parse_fields(fields)
+    return [project_state(s, tree) for s in states]
 
 
 # Domains the dashboard needs (weather, sun, sensor for energy/power/battery/solar/grid)
 _DASHBOARD_DOMAINS = ("weather", "sun", "sensor")
 
 
-async def get_states_for_dashboard() -> list[dict[str, Any]]:
+async def get_states_for_dashboard(timeout: float | None = None) -> list[dict[str, Any]]:
     """
     Fetch entity states relevant to the dashboard (weather, sun, sensor).
     Returns list of HA state objects; empty list if not configured.
     """
-    if not _is_configured():
-        return []
-    states = await get_states(domain=None)
-    return [
-        s for s in states
-        if (s.get("entity_id") or "").split(".", 1)[0] in _DASHBOARD_DOMAINS
-    ]
+    view = await get_states_snapshot(timeout=timeout)
+    return list(view.dashboard)
 
 
-async def get_entity(entity_id: str) -> dict[str, Any] | None:
+async def get_entity(entity_id: str, timeout: float | None = 10.0) -> dict[str, Any] | None:
     """
     Fetch a single entity state. Returns None if HA is not configured or entity not found.
     """
@@ -83,10 +705,72 @@ async def get_entity(entity_id: str) -> dict[str, Any] | None:
     if not entity_id:
         return None
 
-    url = f"{_base_url()}/api/states/{entity_id}"
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(url, headers=_headers())
-        if resp.status_code == 404:
-            return None
-        resp.raise_for_status()
-        return resp.json()
+    # A fresh snapshot already holds every entity; answer from it without another request
+    if _cache_is_fresh():
+        _cache_stats["hits"] += 1
+        return _states_index.get(entity_id)
+
+    # Follower: refresh from the leader's snapshot so HA keeps seeing a single fetch stream
+    if _shared_loader is not None:
+        await _get_all_states(timeout=timeout)
+        return _states_index.get(entity_id)
+
+    resp = await _upstream_get(
+        "entity",
+        f"/api/states/{entity_id}",
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+    )
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def stream_history(
+    start: datetime, end: datetime, entity_ids: list[str], timeout: float | None = None
+) -> AsyncIterator[str]:
+    """
+    GET /api/history/period for entity_ids between start and end (aware datetimes), yielding the body as text
+    while it downloads. The body is a list per entity of its state changes; attributes are left out and every
+    state after an entity's first is minimal ({state, last_changed}). Raises httpx.HTTPStatusError on HA errors.
+    """
+    params = {
+        "filter_entity_id": ",".join(entity_ids),
+        "end_time": end.isoformat(),
+        "minimal_response": "",
+        "no_attributes": "",
+    }
+    started = time.perf_counter()
+    try:
+        async with _get_client().stream(
+            "GET",
+            f"/api/history/period/{quote(start.isoformat())}",
+            params=params,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        ) as resp:
+            if resp.status_code >= 400:
+                metrics.HA_UPSTREAM_ERRORS.labels("history", f"http_{resp.status_code // 100}xx").inc()
+                await resp.aread()
+                resp.raise_for_status()
+            async for text in resp.aiter_text():
+                yield text
+    except httpx.TimeoutException:
+        metrics.HA_UPSTREAM_ERRORS.labels("history", "timeout").inc()
+        raise
+    except httpx.HTTPStatusError:
+        raise
+    except httpx.HTTPError:
+        metrics.HA_UPSTREAM_ERRORS.labels("history", "transport").inc()
+        raise
+    finally:
+        _UPSTREAM_DURATION["history"].observe(time.perf_counter() - started)
+
+
+def cached_entity_json(entity_id: str) -> bytes | None:
+    """
+    Projected JSON of one entity from the current StatesSnapshot, or None when there is none to reuse (snapshot
+    not fresh, or changed since the view was last built; rebuilding it for a single entity would cost more).
+    """
+    if not _cache_is_fresh() or _states_list_dirty or _view is None or _view.states is not _states_cache:
+        return None
+    return _view.entity_json(entity_id)
@@ -0,0 +1,247 @@
+"""
+House image variants: resized / re-encoded copies of house images (thumbnail, dashboard size, WebP) rendered once
+per source image in a process pool and kept in a local disk cache (HOUSE_IMAGE_CACHE_DIR), so the dashboard
+doesn't pull a multi-megabyte JPEG off the media share on every load.
+
+Cache files are named after the source path, mtime and size, so a replaced source gets new variants. Least recently
+used files are evicted once the cache exceeds HOUSE_IMAGE_CACHE_MAX_MB; file mtimes record use, so the order
+survives restarts. Rendering needs the optional Pillow package; without it every request gets the original JPEG.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from core.executors import LatencyHistogram
+from services.house_images import HouseImage, house_image_catalog
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+SIZES = ("original", "dashboard", "thumbnail")
+# format -> (media type, file extension, Pillow format)
+FORMATS = {
+    "jpeg": ("image/jpeg", ".jpg", "JPEG"),
+    "webp": ("image/webp", ".webp", "WEBP"),
+}
+# Variants rendered ahead of time for the newest image
+_PRERENDER = (("dashboard", "jpeg"), ("dashboard", "webp"), ("thumbnail", "webp"))
+
+
+def _max_px(size: str) -> Optional[int]:
+    if size == "thumbnail":
+        return settings.HOUSE_IMAGE_THUMBNAIL_PX
+    if size == "dashboard":
+        return settings.HOUSE_IMAGE_DASHBOARD_PX
+    return None
+
+
+def _render(src: str, dst: str, max_px: Optional[int], pil_format: str, quality: int) -> int:
+    """Runs in a worker process: resize src to fit max_px (keeping aspect), encode, write dst. Returns bytes."""
+    with Image.open(src) as im:
+        if max_px and im.format == "JPEG":
+            im.draft("RGB", (max_px, max_px))  # decode at reduced scale, much faster for large JPEGs
+        im = ImageOps.exif_transpose(im)
+        if max_px:
+            im.thumbnail((max_px, max_px), Image.LANCZOS)
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        im.save(tmp, pil_format, quality=quality, optimize=pil_format == "JPEG")
+    os.replace(tmp, dst)
+    return os.path.getsize(dst)
+
+
+class VariantCache:
+    """Size-bounded LRU of rendered files in one directory."""
+
+    def __init__(self):
+        self.dir: Optional[Path] = None
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self) -> None:
+        self.dir = Path(settings.HOUSE_IMAGE_CACHE_DIR or Path(__file__).resolve().parent.parent / "image_cache")
+        self.dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        with os.scandir(self.dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total += size
+
+    def path(self, name: str) -> Path:
+        if self.dir is None:
+            with self._lock:
+                if self.dir is None:
+                    self._load()
+        return self.dir / name
+
+    def get(self, name: str) -> Optional[Path]:
+        path = self.path(name)
+        with self._lock:
+            if name not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(name)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:  # deleted behind our back
+            with self._lock:
+                self._total -= self._files.pop(name, 0)
+            return None
+        return path
+
+    def add(self, name: str, size: int) -> None:
+        max_bytes = settings.HOUSE_IMAGE_CACHE_MAX_MB * 1024 * 1024
+        evict = []
+        with self._lock:
+            self._total += size - self._files.pop(name, 0)
+            self._files[name] = size
+            while self._total > max_bytes and len(self._files) > 1:
+                old, old_size = self._files.popitem(last=False)
+                self._total -= old_size
+                evict.append(old)
+            self.evictions += len(evict)
+        for old in evict:
+            try:
+                os.remove(self.dir / old)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dir": str(self.dir) if self.dir else None,
+            "files": len(self._files),
+            "bytes": self._total,
+            "max_bytes": settings.HOUSE_IMAGE_CACHE_MAX_MB * 1024 * 1024,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_cache = VariantCache()
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, "asyncio.Future[Path]"] = {}
+_render_latency = LatencyHistogram()
+_warned_no_pillow = False
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][0]
+
+
+def effective(size: str, fmt: str) -> tuple[str, str]:
+    """The (size, format) actually served: everything falls back to the original JPEG without Pillow."""
+    return (size, fmt) if available() else ("original", "jpeg")
+
+
+def etag(image: HouseImage, size: str, fmt: str) -> str:
+    """Strong ETag for a variant (same source file + variant = same bytes)."""
+    size, fmt = effective(size, fmt)
+    digest = hashlib.sha1(f"{image.path}|{image.mtime}|{image.size}|{size}|{fmt}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _variant_name(image: HouseImage, size: str, fmt: str) -> str:
+    source = hashlib.sha1(f"{image.path}|{image.mtime}|{image.size}".encode()).hexdigest()[:16]
+    return f"{Path(image.filename).stem}-{source}-{size}{FORMATS[fmt][1]}"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(settings.HOUSE_IMAGE_RENDER_WORKERS, 1))
+    return _pool
+
+
+async def _render_variant(image: HouseImage, size: str, fmt: str, name: str) -> Path:
+    dst = _cache.path(name)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    written = await loop.run_in_executor(
+        _get_pool(), _render, image.path, str(dst), _max_px(size), FORMATS[fmt][2],
+        settings.HOUSE_IMAGE_QUALITY,
+    )
+    _render_latency.observe(loop.time() - start)
+    _cache.add(name, written)
+    logger.info(f"Rendered {size}/{fmt} variant of {image.filename} ({written} bytes)")
+    return dst
+
+
+async def get_variant(image: HouseImage, size: str = "original", fmt: str = "jpeg") -> tuple[str, str]:
+    """
+    Path and media type of the requested variant, rendering it on first use (concurrent requests for the same
+    variant share one render). size=original, format=jpeg is the source file itself.
+    """
+    global _warned_no_pillow
+    if not available() and not _warned_no_pillow and (size, fmt) != ("original", "jpeg"):
+        logger.warning("Pillow not installed; serving original house images for all sizes/formats")
+        _warned_no_pillow = True
+    size, fmt = effective(size, fmt)
+    if size == "original" and fmt == "jpeg":
+        return image.path, "image/jpeg"
+
+    name = _variant_name(image, size, fmt)
+    cached = _cache.get(name)
+    if cached is not None:
+        return str(cached), media_type(fmt)
+    future = _inflight.get(name)
+    if future is None:
+        future = asyncio.ensure_future(_render_variant(image, size, fmt, name))
+        _inflight[name] = future
+        future.add_done_callback(lambda _: _inflight.pop(name, None))
+    return str(await asyncio.shield(future)), media_type(fmt)
+
+
+async def refresh_and_prerender() -> None:
+    """Scheduler job: rescan the media share; when it changed, render the usual variants of the newest image."""
+    if not await house_image_catalog.refresh_async() or not available():
+        return
+    latest = house_image_catalog.latest()
+    if latest is None:
+        return
+    for size, fmt in _PRERENDER:
+        try:
+            await get_variant(latest, size, fmt)
+        except Exception as e:
+            logger.warning(f"Failed to prerender {size}/{fmt} for {latest.filename}: {e}")
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "pillow": available(),
+        "cache": _cache.stats(),
+        "rendering": len(_inflight),
+        "render_latency": _render_latency.snapshot(),
+    }
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,174 @@
+"""
+House image catalog: an in-memory index of house*.jpg files in HA_MEDIA_PATH, so the house-image endpoints never
+glob or stat the (possibly remote SMB) share per request.
+
+A scheduler job rescans every HOUSE_IMAGE_SCAN_INTERVAL_SECONDS with one os.scandir pass on the "fs" executor.
+The scan is skipped when the directory's own mtime hasn't changed (adding, removing or renaming a file updates
+it), so an idle share mostly costs one stat per interval. Images are kept sorted by mtime (latest lookup is O(1))
+and by taken date (the YYYYMMDD in housepic_YYYYMMDD.jpg, else the mtime's date) for range listings.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core import executors
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_DATE_IN_NAME = re.compile(r"(\d{8})")
+# Rescan even if the directory mtime is unchanged after this many skipped checks (files overwritten in place,
+# SMB servers that don't update directory mtimes)
+_FULL_SCAN_EVERY = 10
+
+
+def media_path() -> str:
+    return settings.HA_MEDIA_PATH or r"\\homeassistant\media"
+
+
+@dataclass(frozen=True)
+class HouseImage:
+    path: str
+    filename: str
+    mtime: float
+    size: int
+    date_from_filename: Optional[date]
+
+    @property
+    def taken(self) -> date:
+        return self.date_from_filename or datetime.fromtimestamp(self.mtime).date()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "filename": self.filename,
+            "modified_timestamp": self.mtime,
+            "modified_datetime": datetime.fromtimestamp(self.mtime, tz=timezone.utc).isoformat(),
+            "date_from_filename": self.date_from_filename.isoformat() if self.date_from_filename else None,
+            "size": self.size,
+        }
+
+
+def _date_from_filename(filename: str) -> Optional[date]:
+    match = _DATE_IN_NAME.search(filename)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _is_house_image(name: str) -> bool:
+    # Same files the old house*.jpg / house*.JPG globs matched
+    return name.startswith("house") and (name.endswith(".jpg") or name.endswith(".JPG"))
+
+
+class HouseImageCatalog:
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.path_exists = False
+        self.loaded = False
+        self.error: Optional[str] = None
+        self.scanned_at: Optional[float] = None
+        self.scans = 0
+        self.skipped_scans = 0
+        self._dir_mtime: Optional[float] = None
+        self._skipped_in_row = 0
+        self._by_mtime: List[HouseImage] = []
+        self._by_taken: List[HouseImage] = []
+        self._taken_keys: List[date] = []
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rescan the media directory if it changed. Blocking: run on the "fs" executor. Returns True if rescanned."""
+        path = media_path()
+        try:
+            dir_mtime = os.stat(path).st_mtime
+        except OSError as e:
+            with self._lock:
+                if self.path_exists or not self.loaded:
+                    logger.warning(f"Media path not accessible: {path} ({e})")
+                self.path, self.path_exists, self.loaded, self.error = path, False, True, str(e)
+                self._dir_mtime = None
+                self._by_mtime, self._by_taken, self._taken_keys = [], [], []
+                self.scanned_at = time.time()
+            return True
+        unchanged = self.loaded and path == self.path and dir_mtime == self._dir_mtime
+        if not force and unchanged and self._skipped_in_row < _FULL_SCAN_EVERY:
+            self._skipped_in_row += 1
+            self.skipped_scans += 1
+            return False
+        self._skipped_in_row = 0
+
+        images = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not _is_house_image(entry.name):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # removed mid-scan
+                images.append(HouseImage(
+                    path=entry.path,
+                    filename=entry.name,
+                    mtime=st.st_mtime,
+                    size=st.st_size,
+                    date_from_filename=_date_from_filename(entry.name),
+                ))
+        by_mtime = sorted(images, key=lambda i: (i.mtime, i.filename))
+        by_taken = sorted(images, key=lambda i: (i.taken, i.mtime))
+        with self._lock:
+            self.path, self.path_exists, self.loaded, self.error = path, True, True, None
+            self._dir_mtime = dir_mtime
+            self._by_mtime, self._by_taken = by_mtime, by_taken
+            self._taken_keys = [i.taken for i in by_taken]
+            self.scanned_at = time.time()
+            self.scans += 1
+        logger.info(f"House image catalog: {len(images)} images in {path}")
+        return True
+
+    async def refresh_async(self, force: bool = False) -> bool:
+        return await executors.run_blocking("fs", "house_image.scan", self.refresh, force)
+
+    async def ensure_loaded(self) -> None:
+        """Scan once if the scheduler hasn't yet (first request right after startup)."""
+        if not self.loaded:
+            await self.refresh_async()
+
+    def latest(self) -> Optional[HouseImage]:
+        images = self._by_mtime
+        return images[-1] if images else None
+
+    def images(self) -> List[HouseImage]:
+        """All images, oldest to newest by mtime."""
+        return list(self._by_mtime)
+
+    def between(self, from_date: Optional[date] = None, to_date: Optional[date] = None) -> List[HouseImage]:
+        """Images whose taken date is within [from_date, to_date], ordered by taken date."""
+        with self._lock:
+            keys, images = self._taken_keys, self._by_taken
+        lo = bisect.bisect_left(keys, from_date) if from_date else 0
+        hi = bisect.bisect_right(keys, to_date) if to_date else len(keys)
+        return images[lo:hi]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "media_path": self.path or media_path(),
+            "path_exists": self.path_exists,
+            "loaded": self.loaded,
+            "error": self.error,
+            "count": len(self._by_mtime),
+            "scanned_at": self.scanned_at,
+            "scans": self.scans,
+            "skipped_scans": self.skipped_scans,
+        }
+
+
+house_image_catalog = HouseImageCatalog()
@@ -1,27 +1,297 @@
+"""
+MQTT ingestion: subscribes to MQTT_TOPIC_PREFIX# and turns messages into time-series samples and live states.
+
+    paho network thread --(bounded buffer, MQTT_QUEUE_SIZE)--> event loop consumer
+        -> latest payload per topic (coalesced) -> every MQTT_FLUSH_INTERVAL_SECONDS:
+           route (services/mqtt_routes.py) -> parse/scale -> one executemany into energy_samples
+           + one state index revision
+
+on_message only appends to the buffer under a lock and wakes the consumer when it was idle, so the loop sees one
+callback per drain instead of one per message. A full buffer drops per MQTT_OVERFLOW_POLICY (drop_oldest keeps
+the freshest readings). Only the last payload of each topic per flush is parsed and written; samples are keyed
+by (series, second), so a faster publisher cannot grow the table beyond one row per topic per flush.
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
 import paho.mqtt.client as mqtt
+
+from core import db
 from core.config import settings
-import logging
+from core.executors import LatencyHistogram
+from services import energy_rollups
+from services import energy_samples
+from services import homeassistant as ha
+from services.mqtt_routes import mqtt_routes
 
 logger = logging.getLogger(__name__)
 
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+SERIES_KIND = "mqtt"
+_SLUG = re.compile(r"[^a-z0-9]+")
+
+
+def entity_id_for_topic(topic: str) -> str:
+    """home/garage/temperature -> sensor.mqtt_garage_temperature (prefix stripped)."""
+    prefix = settings.MQTT_TOPIC_PREFIX
+    name = topic[len(prefix):] if prefix and topic.startswith(prefix) else topic
+    return f"sensor.mqtt_{_SLUG.sub('_', name.lower()).strip('_')}"
+
+
+def parse_payload(payload: bytes, json_path: Tuple[Any, ...] = ()) -> Tuple[Optional[float], str]:
+    """
+    (numeric value or None, state string). Without json_path accepts plain numbers, JSON numbers and
+    JSON {"value": ...}; with one (from the topic's route) reads that field of a JSON payload.
+    """
+    text = payload.decode("utf-8", errors="replace").strip()
+    if not json_path:
+        try:
+            return float(text), text
+        except ValueError:
+            pass
+        if text[:1] != "{":
+            return None, text
+        json_path = ("value",)
+    try:
+        value = json.loads(text)
+        for key in json_path:
+            value = value[key]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None, text
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), str(value)
+    return None, str(value) if value is not None else text
+
+
+def _overflow_policy() -> str:
+    policy = settings.MQTT_OVERFLOW_POLICY
+    if policy not in OVERFLOW_POLICIES:
+        logger.warning(f"Unknown MQTT_OVERFLOW_POLICY {policy!r}; using drop_oldest")
+        return "drop_oldest"
+    return policy
+
+
 class MQTTService:
     def __init__(self):
-        self.client = mqtt.Client()
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
+        self.connected = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # (topic, payload, received unix time), filled by the paho thread
+        self._buffer: Deque[Tuple[str, bytes, float]] = deque()
+        self._lock = threading.Lock()
+        self._wake_pending = False
+        # topic -> (payload, received) awaiting the next flush
+        self._latest: Dict[str, Tuple[bytes, float]] = {}
+        # MQTT_OVERFLOW_POLICY, resolved when the consumer starts
+        self.overflow_policy = "drop_oldest"
+        # Set after a failed flush: the next batch re-sends its messages
+        self._retrying = False
+        self.flush_latency = LatencyHistogram()
+        self.stats: Dict[str, int] = {
+            "received": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "parse_errors": 0,
+            "ignored": 0,
+            "samples_written": 0,
+            "states_published": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+        }
 
-    def on_connect(self, client, userdata, flags, rc):
-        logger.info(f"Connected to MQTT broker with result code {rc}")
-        client.subscribe(f"{settings.MQTT_TOPIC_PREFIX}#")
+    def on_connect(self, client, userdata, flags, reason_code, properties=None):
+        self.connected = not reason_code.is_failure
+        logger.info(f"Connected to MQTT broker with result code {reason_code}")
+        if self.connected:
+            client.subscribe(f"{settings.MQTT_TOPIC_PREFIX}#")
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        self.connected = False
+        logger.warning(f"Disconnected from MQTT broker ({reason_code}); paho will reconnect")
 
     def on_message(self, client, userdata, msg):
-        logger.info(f"Received message on topic {msg.topic}: {msg.payload}")
+        """Runs on paho's network thread: buffer the message and wake the consumer if it is idle."""
+        self.enqueue(msg.topic, msg.payload)
+
+    def enqueue(self, topic: str, payload: bytes) -> bool:
+        """Thread-safe hand-off to the consumer. Returns False if the message (or an older one) was dropped."""
+        accepted = True
+        with self._lock:
+            self.stats["received"] += 1
+            if len(self._buffer) >= settings.MQTT_QUEUE_SIZE:
+                self.stats["dropped"] += 1
+                accepted = False
+                if self.overflow_policy == "drop_newest":
+                    return False
+                self._buffer.popleft()
+            self._buffer.append((topic, payload, time.time()))
+            wake = not self._wake_pending
+            self._wake_pending = True
+        if wake and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:  # loop closed during shutdown
+                pass
+        return accepted
+
+    def _drain(self) -> int:
+        with self._lock:
+            items, self._buffer = self._buffer, deque()
+            self._wake_pending = False
+        latest = self._latest
+        before = len(latest)
+        for topic, payload, received in items:
+            latest[topic] = (payload, received)
+        # Messages that replaced a payload still waiting for the flush
+        self.stats["coalesced"] += len(items) - (len(latest) - before)
+        return len(items)
+
+    async def flush(self) -> int:
+        """Parse the latest payload per topic, batch-write numeric values, publish states. Returns rows written."""
+        if not self._latest:
+            return 0
+        batch, self._latest = self._latest, {}
+        start = time.perf_counter()
+        mqtt_routes.maybe_reload()
+        rows = []
+        states: Dict[str, Dict[str, Any]] = {}
+        for topic, (payload, received) in batch.items():
+            match = mqtt_routes.match(topic)
+            route = match.route if match is not None else None
+            if route is not None and route.ignore:
+                self.stats["ignored"] += 1
+                continue
+            entity_id = (match.entity_id if match is not None else None) or entity_id_for_topic(topic)
+            value, state = parse_payload(payload, route.json_path if route is not None else ())
+            attributes: Dict[str, Any] = {"friendly_name": topic, "source": "mqtt", "topic": topic}
+            if value is None:
+                self.stats["parse_errors"] += 1
+            else:
+                if route is not None:
+                    if route.scale != 1.0:
+                        value *= route.scale
+                        state = f"{value:.10g}"
+                    if route.unit:
+                        attributes["unit_of_measurement"] = route.unit
+                kind, unit = (route.kind, route.unit or "") if route is not None else (SERIES_KIND, "")
+                rows.append((entity_id, kind, unit, int(received), value))
+            iso = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(received))
+            states[entity_id] = {
+                "entity_id": entity_id,
+                "state": state,
+                "attributes": attributes,
+                "last_changed": iso,
+                "last_updated": iso,
+            }
+
+        new_ids: Dict[str, int] = {}
+        samples: List[Tuple[int, int, float]] = []
+
+        def write(conn) -> int:
+            samples[:] = [
+                (energy_samples.series_id(conn, entity_id, kind, unit, new_ids), ts, v)
+                for entity_id, kind, unit, ts, v in rows
+            ]
+            conn.executemany("INSERT OR REPLACE INTO energy_samples (series_id, ts, value) VALUES (?, ?, ?)", samples)
+            return len(rows)
+
+        written = 0
+        try:
+            if rows:
+                written = await db.run_write(write, op="mqtt.flush")
+                energy_samples.cache_series_ids(new_ids)
+                if self._retrying:
+                    # The batch carries messages from failed flushes, possibly older than the rollup watermark
+                    energy_rollups.note_late_samples(samples)
+            self._retrying = False
+        except Exception as e:
+            self._retrying = True
+            self.stats["flush_errors"] += 1
+            logger.error(f"Failed to write MQTT samples, will retry next flush: {e}")
+            for topic, item in batch.items():
+                self._latest.setdefault(topic, item)  # newer messages win
+        ha.apply_external_states(states)
+        self.stats["flushes"] += 1
+        self.stats["samples_written"] += written
+        self.stats["states_published"] += len(states)
+        self.flush_latency.observe(time.perf_counter() - start)
+        return written
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = max(settings.MQTT_FLUSH_INTERVAL_SECONDS, 0.05)
+        next_flush = loop.time() + interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(next_flush - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._drain()
+            if loop.time() >= next_flush:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("MQTT flush failed")
+                next_flush = loop.time() + interval
+
+    def start_consumer(self) -> None:
+        """Start the event loop side (consumer + periodic flush) without connecting; used by connect() and tests."""
+        if self._task is not None and not self._task.done():
+            return
+        mqtt_routes.maybe_reload()
+        self.overflow_policy = _overflow_policy()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._consume(), name="mqtt-consumer")
 
     def connect(self):
+        """Start consuming and connect in the background (paho retries until the broker is reachable)."""
+        self.start_consumer()
         try:
-            self.client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
+            self.client.connect_async(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
             self.client.loop_start()
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
 
+    async def stop(self) -> None:
+        """Disconnect, then write whatever is still buffered."""
+        self.client.loop_stop()
+        self.client.disconnect()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._drain()
+        await self.flush()
+        self._loop = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.MQTT_ENABLED,
+            "connected": self.connected,
+            "queue_depth": len(self._buffer),
+            "queue_size": settings.MQTT_QUEUE_SIZE,
+            "overflow_policy": self.overflow_policy,
+            "pending_topics": len(self._latest),
+            **self.stats,
+            "flush_latency": self.flush_latency.snapshot(),
+            "routes": mqtt_routes.status(),
+        }
+
+
 mqtt_service = MQTTService()
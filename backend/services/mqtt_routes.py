@@ -0,0 +1,220 @@
+"""
+MQTT topic routing: maps topics to entities with a payload JSON path, unit and scale, from a JSON file
+(MQTT_ROUTES_FILE):
+
+    [
+      {"topic": "home/+/temperature", "entity_id": "sensor.{1}_temperature", "unit": "°C"},
+      {"topic": "home/meter/#", "json_path": "power.total", "unit": "kW", "scale": 0.001, "kind": "power"},
+      {"topic": "home/debug/#", "ignore": true}
+    ]
+
+Patterns use MQTT wildcards: + matches one level, # (last) any remaining levels. {1}, {2}, ... in entity_id are
+the levels matched by each +, {topic} the whole topic; without entity_id it is derived from the topic. When
+several patterns match, literal levels win over +, and + over #, level by level (file order breaks ties).
+
+The routes are compiled into a trie over topic levels, so a lookup walks at most one branch per level instead
+of testing every pattern, and results are cached per topic. The file is re-read when its mtime changes (checked
+on each MQTT flush); an invalid file is logged and the previous table stays in use.
+"""
+import json
+import logging
+import os
+import string
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Topics cached per table; the cache is dropped wholesale when it grows past this (topics are few in practice)
+_MAX_CACHED_TOPICS = 50_000
+
+
+@dataclass(frozen=True)
+class Route:
+    pattern: str
+    entity_id: Optional[str] = None
+    json_path: Tuple[Any, ...] = ()
+    unit: Optional[str] = None
+    scale: float = 1.0
+    kind: str = "mqtt"
+    ignore: bool = False
+
+
+@dataclass(frozen=True)
+class RouteMatch:
+    route: Route
+    entity_id: Optional[str]  # None: derive from the topic
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash_route", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.plus: Optional["_Node"] = None
+        self.hash_route: Optional[Route] = None  # pattern ending in # at this level
+        self.route: Optional[Route] = None  # pattern ending exactly here
+
+
+def _parse_json_path(path: str) -> Tuple[Any, ...]:
+    """'power.phases.0.w' -> ('power', 'phases', 0, 'w')."""
+    return tuple(int(part) if part.isdigit() else part for part in path.split(".") if part)
+
+
+def _route_from_spec(spec: Dict[str, Any]) -> Route:
+    pattern = spec["topic"]
+    levels = pattern.split("/")
+    if "#" in levels[:-1] or any(("#" in lvl or "+" in lvl) and len(lvl) > 1 for lvl in levels):
+        raise ValueError(f"invalid MQTT pattern {pattern!r}")
+    entity_id = spec.get("entity_id")
+    if entity_id:
+        fields = {name for _, name, _, _ in string.Formatter().parse(entity_id) if name}
+        wildcards = levels.count("+")
+        for name in fields - {"topic"}:
+            if not name.isdigit() or not 1 <= int(name) <= wildcards:
+                raise ValueError(
+                    f"{entity_id!r}: {{{name}}} does not name one of the {wildcards} + levels of {pattern!r}"
+                )
+    return Route(
+        pattern=pattern,
+        entity_id=entity_id,
+        json_path=_parse_json_path(spec.get("json_path") or ""),
+        unit=spec.get("unit"),
+        scale=float(spec.get("scale", 1.0)),
+        kind=spec.get("kind") or "mqtt",
+        ignore=bool(spec.get("ignore", False)),
+    )
+
+
+class RouteTable:
+    """Compiled routes. Immutable apart from its per-topic cache; reloads build a new table."""
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        self._root = _Node()
+        for route in routes:
+            node = self._root
+            levels = route.pattern.split("/")
+            for level in levels:
+                if level == "#":
+                    if node.hash_route is None:
+                        node.hash_route = route
+                    break
+                if level == "+":
+                    node.plus = node.plus or _Node()
+                    node = node.plus
+                else:
+                    node = node.children.setdefault(level, _Node())
+            else:
+                if node.route is None:
+                    node.route = route
+        self._cache: Dict[str, Optional[RouteMatch]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_specs(cls, specs: List[Dict[str, Any]]) -> "RouteTable":
+        return cls([_route_from_spec(spec) for spec in specs])
+
+    def _walk(self, node: _Node, levels: List[str], i: int, captures: List[str]) -> Optional[Tuple[Route, List[str]]]:
+        if i == len(levels):
+            if node.route is not None:
+                return node.route, captures
+            # "a/#" also matches "a" itself
+            return (node.hash_route, captures) if node.hash_route is not None else None
+        child = node.children.get(levels[i])
+        if child is not None:
+            found = self._walk(child, levels, i + 1, captures)
+            if found is not None:
+                return found
+        if node.plus is not None:
+            found = self._walk(node.plus, levels, i + 1, captures + [levels[i]])
+            if found is not None:
+                return found
+        if node.hash_route is not None:
+            return node.hash_route, captures
+        return None
+
+    def match(self, topic: str) -> Optional[RouteMatch]:
+        """Route for topic (cached), or None when no pattern matches."""
+        try:
+            result = self._cache[topic]
+            self.hits += 1
+            return result
+        except KeyError:
+            self.misses += 1
+        found = self._walk(self._root, topic.split("/"), 0, [])
+        result = None
+        if found is not None:
+            route, captures = found
+            entity_id = None
+            if route.entity_id:
+                entity_id = route.entity_id.format("", *captures, topic=topic).lower()
+            result = RouteMatch(route, entity_id)
+        if len(self._cache) >= _MAX_CACHED_TOPICS:
+            self._cache.clear()
+        self._cache[topic] = result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"routes": len(self.routes), "cached_topics": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+class RouteRegistry:
+    """The active RouteTable plus hot reload from MQTT_ROUTES_FILE."""
+
+    def __init__(self):
+        self.table = RouteTable([])
+        self.path: Optional[str] = None
+        self.loaded_mtime: Optional[float] = None
+        self.error: Optional[str] = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+
+    def maybe_reload(self) -> bool:
+        """Re-read the routes file if it is new or its mtime changed. Returns True when a new table was installed."""
+        path = settings.MQTT_ROUTES_FILE
+        if not path:
+            if self.path is not None:
+                with self._lock:
+                    self.table, self.path, self.loaded_mtime, self.error = RouteTable([]), None, None, None
+                return True
+            return False
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if self.error is None:
+                logger.warning(f"MQTT routes file not readable: {path} ({e})")
+            self.error = str(e)
+            return False
+        if path == self.path and mtime == self.loaded_mtime:
+            return False
+        return self.reload(path, mtime)
+
+    def reload(self, path: Optional[str] = None, mtime: Optional[float] = None) -> bool:
+        path = path or settings.MQTT_ROUTES_FILE
+        try:
+            with open(path, encoding="utf-8") as f:
+                table = RouteTable.from_specs(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Invalid MQTT routes file {path}; keeping previous routes: {e}")
+            with self._lock:
+                self.path, self.loaded_mtime, self.error = path, mtime, str(e)
+            return False
+        with self._lock:
+            self.table, self.path, self.loaded_mtime, self.error = table, path, mtime, None
+            self.reloads += 1
+        logger.info(f"Loaded {len(table.routes)} MQTT routes from {path}")
+        return True
+
+    def match(self, topic: str) -> Optional[RouteMatch]:
+        return self.table.match(topic)
+
+    def status(self) -> Dict[str, Any]:
+        return {"file": self.path, "error": self.error, "reloads": self.reloads, **self.table.stats()}
+
+
+mqtt_routes = RouteRegistry()